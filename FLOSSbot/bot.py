@@ -15,14 +15,25 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import argparse
+import contextlib
+import datetime
+import itertools
 import logging
+import os
+import re
 import textwrap
+import threading
 import time
+import weakref
+from concurrent import futures
 
 import pywikibot
-from pywikibot import pagegenerators as pg
+from pywikibot import config2
+from pywikibot.data import api
 
-from FLOSSbot import fsd, license, qa, repository
+from FLOSSbot import (cassette, checkpoint, entities, fsd, index, license,
+                      local, metrics, plan, profiler, qa, repository, sparql,
+                      transaction, util, writer)
 from FLOSSbot.plugin import Plugin
 
 logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
@@ -38,26 +49,130 @@ plugins = [
 name2plugin = dict([(p.__name__, p) for p in plugins])
 
 
+def shard(value):
+    m = re.match(r'^(\d+)/(\d+)$', value)
+    if not m or int(m.group(1)) >= int(m.group(2)):
+        raise argparse.ArgumentTypeError(
+            value + " is not i/n with 0 <= i < n")
+    return (int(m.group(1)), int(m.group(2)))
+
+
+def hour_minute(value):
+    m = re.match(r'^(\d\d?):(\d\d)$', value)
+    if not m or int(m.group(1)) > 23 or int(m.group(2)) > 59:
+        raise argparse.ArgumentTypeError(value + " is not HH:MM")
+    return (int(m.group(1)), int(m.group(2)))
+
+
+def next_time(hour_minute, now=None):
+    """Return the timestamp of the next time it is hour:minute."""
+    now = now or datetime.datetime.now()
+    (hour, minute) = hour_minute
+    when = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if when <= now:
+        when += datetime.timedelta(days=1)
+    return when.timestamp()
+
+
 class Bot(object):
 
     def __init__(self, args):
         self.args = args
         logging.getLogger('FLOSSbot').setLevel(self.args.verbose)
-        self.site = pywikibot.Site(
-            code="wikidata" if not self.args.test else "test",
-            fam="wikidata",
-            user=self.args.user)
-        if self.args.test:
+        if self.args.record:
+            self.cassette = cassette.Cassette(self.args.record, 'record')
+        elif self.args.replay:
+            self.cassette = cassette.Cassette(self.args.replay, 'replay')
+        else:
+            self.cassette = None
+        if self.cassette:
+            self.cassette.install()
+        if self.args.local_wiki:
+            local.register(self.args.local_wiki)
+            pywikibot.config.usernames[local.FAMILY]['*'] = (
+                self.args.user or 'FLOSSbot')
+            self.site = pywikibot.Site(code="wikidata", fam=local.FAMILY,
+                                       user=self.args.user)
             self.site.throttle.setDelays(writedelay=0)
-        if self.args.test:
-            self.wikidata_site = pywikibot.Site(code="wikidata",
-                                                fam="wikidata")
         else:
-            self.wikidata_site = None
+            self.site = pywikibot.Site(
+                code="wikidata" if not self.args.test else "test",
+                fam="wikidata",
+                user=self.args.user)
+            if self.args.test:
+                self.site.throttle.setDelays(writedelay=0)
+        if self.args.replay:
+            #
+            # the responses are already there, there is no need to
+            # spare the wiki
+            #
+            self.site.throttle.setDelays(delay=0, writedelay=0)
+        self._wikidata_site = None
+        #
+        # label => ID of the properties and label => ItemPage of the
+        # items found by the plugins, and the plugins that have them as
+        # P_ and Q_ attributes
+        #
+        self.entities = {
+            'property': {},
+            'item': {},
+        }
+        self.entities_generation = 0
+        self.entities_lock = threading.Lock()
+        self.entity_plugins = weakref.WeakSet()
+        if self.args.entities_ttl > 0 and not self.cassette:
+            self.entity_cache = entities.Entities(
+                self.args.entities_cache or
+                os.path.join(config2.base_dir, 'FLOSSbot-entities.sqlite'),
+                self.args.entities_ttl * 24 * 60 * 60)
+        else:
+            #
+            # a recorded run looks up every entity so that it can be
+            # replayed anywhere
+            #
+            self.entity_cache = None
         self.plugins = []
         for name in self.args.plugin or name2plugin.keys():
             plugin = name2plugin[name]
             self.plugins.append(plugin(self, args))
+        self.filter_plugins = {}
+        if self.args.profile:
+            #
+            # cProfile cannot profile more than one thread at a time
+            #
+            if self.args.jobs > 1:
+                log.warning("--profile ignores --jobs " +
+                            str(self.args.jobs))
+                self.args.jobs = 1
+            self.profiler = profiler.Profiler(self.args.profile)
+        else:
+            self.profiler = None
+        self.http = util.Session(pool_size=max(self.args.jobs, 10),
+                                 timeout=self.args.http_timeout)
+        if self.args.jobs > 1:
+            self.log_buffer = util.LogBuffer()
+        else:
+            self.log_buffer = None
+        self.checkpoint = None
+        self.local = threading.local()
+        if self.args.write_queue > 0:
+            self.writer = writer.Writer(self.args.write_queue)
+        else:
+            self.writer = None
+        if self.args.plan:
+            self.plan = plan.Plan(self.args.plan)
+        else:
+            self.plan = None
+        if self.args.index:
+            self.index = index.Index(self.args.index)
+        else:
+            self.index = None
+        if self.args.deadline:
+            self.deadline = next_time(self.args.deadline)
+        else:
+            self.deadline = None
+        self.started = 0
+        self.exhausted = False
 
     @staticmethod
     def get_parser():
@@ -84,24 +199,179 @@ class Bot(object):
             '--user',
             default=None,
             help='wikidata user name')
+        parser.add_argument(
+            '--local-wiki',
+            default=None,
+            metavar='HOST:PORT',
+            help=('use the wikis served by python -m FLOSSbot.local at '
+                  'HOST:PORT instead of wikidata and the wikipedias'))
         parser.add_argument(
             '--plugin',
             default=[],
             choices=available_plugins,
             action='append',
             help='use this plugin instead of all of them (can be repeated)')
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=1,
+            help='number of items to work on concurrently')
+        parser.add_argument(
+            '--http-timeout',
+            type=float,
+            default=60,
+            help=('seconds to wait for a server to respond when verifying '
+                  'a claim'))
+        parser.add_argument(
+            '--write-queue',
+            type=int,
+            default=0,
+            help=('save the items from a background thread, with at most '
+                  'N items waiting to be saved (0 saves them right away)'))
+        parser.add_argument(
+            '--metrics-file',
+            default=None,
+            help=('write metrics in the Prometheus text format to this '
+                  'file every minute and at the end of the run'))
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            default=None,
+            help='serve metrics in the Prometheus text format on this port')
+        parser.add_argument(
+            '--profile',
+            default=None,
+            metavar='DIR',
+            help=('profile each plugin and write the results and a '
+                  'summary of the slowest items in DIR'))
+        parser.add_argument(
+            '--plan',
+            default=None,
+            help=('append the changes to this file instead of saving them '
+                  '(see --apply)'))
+        parser.add_argument(
+            '--preload',
+            type=int,
+            default=50,
+            help='load items from wikidata in batches of N (at most 50)')
+        parser.add_argument(
+            '--query-page-size',
+            type=int,
+            default=1000,
+            help='number of items fetched from each page of --filter')
+        parser.add_argument(
+            '--deadline',
+            type=hour_minute,
+            default=None,
+            metavar='HH:MM',
+            help=('stop working on new items when the items in flight '
+                  'may not be done by HH:MM'))
+        parser.add_argument(
+            '--max-items',
+            type=int,
+            default=None,
+            metavar='N',
+            help='stop after working on N items')
+        parser.add_argument(
+            '--order',
+            default='item',
+            choices=['item', 'staleness'],
+            help=('work on the items of --filter in the order of their '
+                  'QID or, with staleness, the items with claims that '
+                  'were never verified first and then those that were '
+                  'verified the longest time ago'))
+        parser.add_argument(
+            '--index',
+            default=None,
+            metavar='FILE',
+            help=('remember the revision of the items in this file and '
+                  'skip the items that did not change since the plugins '
+                  'passed, less than --verification-delay days ago'))
+        parser.add_argument(
+            '--entities-cache',
+            default=None,
+            metavar='FILE',
+            help=('remember the properties and items found for a label '
+                  'in this file (default FLOSSbot-entities.sqlite in '
+                  'the pywikibot directory)'))
+        parser.add_argument(
+            '--entities-ttl',
+            type=int,
+            default=7,
+            help=('days during which the properties and items found for '
+                  'a label are remembered (0 to always look them up)'))
+        parser.add_argument(
+            '--refresh-entities',
+            action='store_true',
+            default=None,
+            help=('look up the properties and items again instead of '
+                  'using those remembered in --entities-cache'))
+        parser.add_argument(
+            '--checkpoint',
+            default=None,
+            help=('remember the progress of --filter in this file '
+                  'and resume from there when it exists'))
+        parser.add_argument(
+            '--checkpoint-interval',
+            type=int,
+            default=100,
+            help='save the --checkpoint every N items')
+        parser.add_argument(
+            '--follow',
+            action='store_true',
+            default=None,
+            help=('do not stop after the items of --filter and work on '
+                  'the items that are edited, as they are edited'))
+        parser.add_argument(
+            '--follow-interval',
+            type=int,
+            default=60,
+            help='with --follow, look for edited items every N seconds')
+        parser.add_argument(
+            '--follow-rescan',
+            type=int,
+            default=24 * 60 * 60,
+            help=('with --follow, run the --filter queries again every '
+                  'N seconds to find the items to verify again'))
+        parser.add_argument(
+            '--shard',
+            type=shard,
+            default=None,
+            metavar='i/n',
+            help=('only work on the items of --filter that belong to '
+                  'the shard i (from 0 to n-1) out of n'))
+        http = parser.add_mutually_exclusive_group()
+        http.add_argument(
+            '--record',
+            default=None,
+            metavar='DIR',
+            help=('record the HTTP requests and the shell commands, with '
+                  'their responses, in DIR'))
+        http.add_argument(
+            '--replay',
+            default=None,
+            metavar='DIR',
+            help=('answer the HTTP requests and the shell commands with '
+                  'the responses recorded in DIR instead of sending them'))
         select = parser.add_mutually_exclusive_group()
         select.add_argument(
             '--filter',
-            default='',
+            default=[],
             choices=filters,
-            help='filter with a pre-defined query',
+            action='append',
+            help=('filter with a pre-defined query (can be repeated, '
+                  'each item then only goes to the plugins owning the '
+                  'filters that matched it)'),
         )
         select.add_argument(
             '--item',
             default=[],
             action='append',
             help='work on this QID (can be repeated)')
+        select.add_argument(
+            '--apply',
+            default=None,
+            help='save the changes recorded in this file with --plan')
         return parser
 
     @staticmethod
@@ -118,31 +388,570 @@ class Bot(object):
             A command-line toolbox for the wikidata FLOSS project.
             """),
             parents=parents)
-        return Bot(parser.parse_args(argv))
+        args = parser.parse_args(argv)
+        if args.checkpoint and args.order != 'item':
+            parser.error("--checkpoint requires --order item")
+        return Bot(args)
 
     def run(self):
-        if len(self.args.item) > 0:
-            self.run_items()
-        else:
-            self.run_query()
+        if self.args.metrics_port is not None:
+            metrics.registry.serve(self.args.metrics_port)
+        if self.args.metrics_file:
+            metrics.registry.write_every(self.args.metrics_file, 60)
+        try:
+            if self.args.apply:
+                plan.apply(self.site, self.args.apply, self.args.dry_run)
+            else:
+                self.resolve_entities()
+                if len(self.args.item) > 0:
+                    self.run_items()
+                elif self.args.follow:
+                    self.follow()
+                else:
+                    self.run_query()
+        finally:
+            if self.writer:
+                self.writer.close()
+            if self.plan:
+                self.plan.close()
+            if self.args.metrics_file:
+                metrics.registry.write(self.args.metrics_file)
+            if self.profiler:
+                self.profiler.close()
+            if self.index:
+                self.index.close()
+            if self.entity_cache:
+                self.entity_cache.close()
+            self.http.close()
+            if self.cassette:
+                self.cassette.uninstall()
+
+    def resolve_entities(self):
+        """Look up the entities of all the plugins before they work on
+        any item, so that a missing entity fails the bot right away.
+        The entities the plugins have in common are looked up once."""
+        missing = []
+        for plugin in self.plugins:
+            try:
+                plugin.resolve_entities()
+            except ValueError as e:
+                missing.append(plugin.__class__.__name__ + ": " + str(e))
+        if missing:
+            raise ValueError("; ".join(missing))
+
+    def forget_entity(self, id, labels=()):
+        """Forget the entity id and what was found for the labels,
+        when the labels of the entity are modified. What the plugins
+        found for the other labels is kept. The lookups in flight do
+        not remember what they find (see Plugin.lookup_entity)."""
+        def forgotten(label, value):
+            if label in labels:
+                return True
+            if isinstance(value, str):
+                return value == id
+            return value.getID() == id
+
+        with self.entities_lock:
+            self.entities_generation += 1
+            for found in self.entities.values():
+                for (label, value) in list(found.items()):
+                    if forgotten(label, value):
+                        del found[label]
+            for plugin in list(self.entity_plugins):
+                for (name, value) in list(plugin.__dict__.items()):
+                    if (name.startswith(('P_', 'Q_')) and
+                            forgotten(" ".join(name.split('_')[1:]),
+                                      value)):
+                        del plugin.__dict__[name]
+        if self.entity_cache:
+            self.entity_cache.forget(self.site, id, labels)
+
+    @property
+    def wikidata_site(self):
+        """The site where the entities missing from --test are
+        found, created when first used."""
+        if self.args.local_wiki:
+            return self.site
+        if not self.args.test:
+            return None
+        if self._wikidata_site is None:
+            self._wikidata_site = pywikibot.Site(code="wikidata",
+                                                 fam="wikidata")
+        return self._wikidata_site
+
+    def site_from_dbname(self, dbname):
+        """Return the site of a database name such as enwiki."""
+        if self.args.local_wiki:
+            return pywikibot.Site(code=re.sub('wiki$', '', dbname),
+                                  fam=local.FAMILY)
+        return pywikibot.site.APISite.fromDBName(dbname)
 
     def run_items(self):
-        for item in self.args.item:
-            item = pywikibot.ItemPage(self.site, item, 0)
-            for plugin in self.plugins:
-                plugin.run_catch(item)
+        self.run_plugins((pywikibot.ItemPage(self.site, item, 0), self.plugins)
+                         for item in self.args.item)
 
-    def run_query(self):
+    def get_filter_plugin(self, filter):
         for plugin in self.plugins:
-            query = plugin.get_query(self.args.filter)
-            if query is not None:
-                break
-        if query is None:
-            query = Plugin(self, self.args).get_query(self.args.filter)
-        query = query + " # " + str(time.time())
-        log.debug('running query ' + query)
-        for item in pg.WikidataSPARQLPageGenerator(query,
-                                                   site=self.site,
-                                                   result_type=list):
-            for plugin in self.plugins:
+            if filter in plugin.filter_names():
+                return plugin
+        #
+        # A plugin that is not selected is only built for its query,
+        # once.
+        #
+        if filter not in self.filter_plugins:
+            cls = Plugin
+            for plugin in plugins:
+                if filter in plugin.filter_names():
+                    cls = plugin
+            self.filter_plugins[filter] = cls(self, self.args)
+        return self.filter_plugins[filter]
+
+    def get_items(self, after):
+        if self.args.order == 'staleness':
+            return self.get_stale_items()
+        return self.get_sorted_items(after)
+
+    def get_sorted_items(self, after):
+        filters = self.args.filter or ['']
+        streams = []
+        for filter in filters:
+            query = self.get_filter_plugin(filter).get_query(filter)
+            streams.append((filter, sparql.items(
+                self.site, query,
+                page_size=self.args.query_page_size,
+                after=after,
+                shard=self.args.shard)))
+        if len(streams) == 1:
+            for item in streams[0][1]:
+                yield (item, self.plugins)
+            return
+        #
+        # When there is more than one filter, an item is only given
+        # to the plugins that own a filter that matched the item.
+        #
+        for (item, matched) in sparql.merge(streams):
+            yield (item, [
+                plugin for plugin in self.plugins
+                if set(matched) & set(plugin.filter_names())
+            ])
+
+    def get_stale_items(self):
+        """Return the items of all the --filter queries at once, the
+        most overdue first, as found by sparql.oldest."""
+        for (oldest, item, plugins) in self.get_oldest_items():
+            yield (item, plugins)
+
+    def get_oldest_items(self):
+        """Return the (oldest, item, plugins) of get_stale_items,
+        where oldest is the oldest ?retrieved date of the item."""
+        filters = self.args.filter or ['']
+        found = {}
+        for filter in filters:
+            query = self.get_filter_plugin(filter).get_query(filter)
+            for (oldest, item) in sparql.oldest(
+                    self.site, query,
+                    page_size=self.args.query_page_size,
+                    shard=self.args.shard):
+                id = item.getID()
+                if id in found:
+                    found[id][0] = min(found[id][0], oldest)
+                    found[id][3].append(filter)
+                else:
+                    found[id] = [oldest, int(id[1:]), item, [filter]]
+        log.info("order " + str(len(found)) + " items by staleness")
+        for (oldest, number, item, matched) in sorted(found.values()):
+            if len(filters) == 1:
+                yield (oldest, item, self.plugins)
+            else:
+                yield (oldest, item, [
+                    plugin for plugin in self.plugins
+                    if set(matched) & set(plugin.filter_names())
+                ])
+
+    def run_query(self):
+        if self.args.checkpoint:
+            name = ",".join(self.args.filter)
+            if self.args.shard:
+                name += " shard %d/%d" % self.args.shard
+            self.checkpoint = checkpoint.Checkpoint(
+                self.args.checkpoint,
+                name,
+                self.args.checkpoint_interval)
+            after = self.checkpoint.last
+            items = itertools.chain(self.get_failed_items(),
+                                    self.get_items(after))
+        else:
+            items = self.get_items(None)
+        complete = False
+        try:
+            self.run_plugins(items)
+            complete = not self.exhausted
+        finally:
+            if self.checkpoint:
+                self.checkpoint.save(complete)
+
+    def get_failed_items(self):
+        """The items of the --checkpoint that could not be saved."""
+        for (id, names) in self.checkpoint.retry():
+            log.info("retry " + id)
+            yield (pywikibot.ItemPage(self.site, id, 0), [
+                plugin for plugin in self.plugins
+                if plugin.__class__.__name__ in names
+            ])
+
+    def follow(self):
+        """Work on the items of --filter for which a verification is
+        due, and then on the items that are edited, as found in the
+        recent changes of the wiki. Only the items returned by --filter
+        are considered. The --filter queries run again every
+        --follow-rescan seconds to find the items for which a
+        verification became due."""
+        self.follow_since = self.site.server_time()
+        self.follow_rcid = 0
+        members = set()
+        rescan = 0
+        while True:
+            if time.time() >= rescan:
+                rescan = time.time() + self.args.follow_rescan
+                members = set()
+                self.run_plugins(self.rescan(members))
+            if self.exhausted:
+                return
+            changed = self.recent_changes(members)
+            if changed:
+                log.info("follow " + str(len(changed)) + " edited items")
+                metrics.registry.inc('flossbot_follow_items_total',
+                                     len(changed))
+                self.run_plugins((pywikibot.ItemPage(self.site, id, 0),
+                                  self.plugins)
+                                 for id in changed)
+                if self.exhausted:
+                    return
+            time.sleep(self.args.follow_interval)
+
+    def rescan(self, members):
+        """Return the items of the --filter queries for which a
+        verification is due, the most overdue first, and add all the
+        items of the queries to the members, in a single pass. The
+        items of a query that does not bind ?retrieved are always due,
+        unless --index knows they are fresh."""
+        due = (datetime.datetime.utcnow() -
+               datetime.timedelta(days=self.args.verification_delay))
+        due = due.strftime('%Y-%m-%dT%H:%M:%SZ')
+        for (oldest, item, plugins) in self.get_oldest_items():
+            members.add(item.getID())
+            if oldest < due:
+                yield (item, plugins)
+        log.info("follow " + str(len(members)) + " items")
+
+    def recent_changes(self, members):
+        """Return the QIDs of the members that were edited by someone
+        else since the last call, in the order of the edits.
+
+        The members are a small fraction of the items and there is no
+        way to only ask for their changes: all the edits of the items
+        made since the last call are read and the others are
+        discarded. The edits of the bot and the creation of items are
+        left out by the wiki and only the title, the ids and the
+        timestamp of each edit are returned, so that the cost is
+        proportional to the number of edits, i.e. to
+        --follow-interval, with a small constant."""
+        changed = []
+        changes = self.site.recentchanges(start=self.follow_since,
+                                          reverse=True,
+                                          namespaces=[0],
+                                          changetype='edit',
+                                          excludeuser=self.site.user())
+        changes.request['rcprop'] = 'title|ids|timestamp'
+        for change in changes:
+            if change['rcid'] <= self.follow_rcid:
+                continue
+            self.follow_rcid = change['rcid']
+            self.follow_since = pywikibot.Timestamp.fromISOformat(
+                change['timestamp'])
+            id = change['title']
+            if id in members and id not in changed:
+                changed.append(id)
+        return changed
+
+    @contextlib.contextmanager
+    def transaction(self, item, done=None, failed=None):
+        """Collect the changes made to the item in a transaction that
+        is committed when leaving the outermost transaction of the
+        item. Nothing is committed if an exception is raised. The done
+        function is called once the transaction is saved and the failed
+        function if the --write-queue cannot save it."""
+        if not hasattr(self.local, 'transactions'):
+            self.local.transactions = {}
+        transactions = self.local.transactions
+        id = item.getID()
+        if id in transactions:
+            yield transactions[id]
+            return
+        transactions[id] = transaction.Transaction(item)
+        try:
+            yield transactions[id]
+            self.commit(transactions[id], done, failed)
+        finally:
+            del transactions[id]
+
+    def commit(self, transaction, done=None, failed=None):
+        if self.args.dry_run:
+            pass
+        elif self.plan:
+            self.plan.write(transaction)
+        elif self.writer:
+            self.writer.put(transaction, done, failed)
+            return
+        else:
+            transaction.commit(bot=True)
+        if done:
+            done()
+
+    def item_done(self, item, outcomes=None, failed=()):
+        if self.checkpoint:
+            self.checkpoint.done(item.getID())
+        if (self.index and outcomes is not None and
+                not self.args.dry_run and not self.plan):
+            #
+            # the revision saved by the transaction, if any, so that
+            # the next run does not mistake it for an edit
+            #
+            self.index.record(item.getID(), item.latest_revision_id,
+                              outcomes, failed)
+
+    def item_failed(self, item, plugins):
+        if self.checkpoint:
+            self.checkpoint.fail(item.getID(),
+                                 [plugin.__class__.__name__
+                                  for plugin in plugins])
+
+    def run_item(self, item, plugins):
+        if self.log_buffer:
+            self.log_buffer.start()
+        #
+        # plugin name => phase => statuses, filled by Plugin.outcome
+        #
+        outcomes = {}
+        self.local.outcomes = outcomes
+        #
+        # the names of the plugins that reported an error, filled by
+        # Plugin.error
+        #
+        failed = set()
+        self.local.failed = failed
+        try:
+            with contextlib.ExitStack() as stack:
+                if self.profiler:
+                    stack.enter_context(self.profiler.item(item.getID()))
+                transaction = stack.enter_context(self.transaction(
+                    item,
+                    lambda: self.item_done(item, outcomes, failed),
+                    lambda: self.item_failed(item, plugins)))
+                for plugin in plugins:
+                    savepoint = transaction.savepoint()
+                    try:
+                        self.run_plugin(plugin, item)
+                    except Exception:
+                        #
+                        # the changes of the plugins that succeeded
+                        # are saved, as if each had its own transaction
+                        #
+                        transaction.rollback(savepoint)
+                        self.commit(transaction)
+                        raise
+                    outcomes.setdefault(plugin.__class__.__name__, {})
+        finally:
+            if self.log_buffer:
+                self.log_buffer.flush()
+
+    @staticmethod
+    def batches(items, size):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def preload(self, items):
+        for batch in self.batches(items, self.args.preload):
+            yield from self.preload_batch(batch)
+
+    def lastrevids(self, ids):
+        """Return a dict of QID => lastrevid, with a single request
+        that does not load the entities."""
+        metrics.registry.inc('flossbot_api_reads_total', action='info')
+        request = api.Request(site=self.site, parameters={
+            'action': 'query',
+            'prop': 'info',
+            'titles': '|'.join(ids),
+        })
+        found = {}
+        pages = request.submit().get('query', {}).get('pages', {})
+        for page in pages.values():
+            if 'lastrevid' in page:
+                found[page['title']] = page['lastrevid']
+        return found
+
+    def skip_unchanged(self, items):
+        """Skip the items that are fresh in the --index for all the
+        plugins they are given to."""
+        delay = self.args.verification_delay * 24 * 60 * 60
+        for batch in self.batches(items, 50):
+            try:
+                lastrevids = self.lastrevids(
+                    [item.getID() for (item, plugins) in batch])
+            except Exception as e:
+                log.debug("prop=info failed with " + str(e))
+                lastrevids = {}
+            for (item, plugins) in batch:
+                id = item.getID()
+                if (id in lastrevids and
+                    self.index.fresh(id, lastrevids[id],
+                                     [plugin.__class__.__name__
+                                      for plugin in plugins],
+                                     delay)):
+                    log.debug("skip unchanged " + id)
+                    metrics.registry.inc('flossbot_index_skipped_total')
+                    continue
+                yield (item, plugins)
+
+    def preload_batch(self, batch):
+        metrics.registry.inc('flossbot_api_reads_total',
+                             action='wbgetentities')
+        try:
+            loaded = {}
+            for item in self.site.preloaditempages(
+                    [item for (item, plugins) in batch],
+                    groupsize=len(batch)):
+                loaded[item.getID()] = item
+            batch = [(loaded.get(item.getID(), item), plugins)
+                     for (item, plugins) in batch]
+        except Exception as e:
+            #
+            # The plugins will load the items one by one, as if
+            # there was no preloading.
+            #
+            log.debug("preloading failed with " + str(e))
+        for pair in batch:
+            yield pair
+
+    def run_plugin(self, plugin, item):
+        name = plugin.__class__.__name__
+        try:
+            if self.profiler:
+                with self.profiler.plugin(name):
+                    plugin.run_catch(item)
+            else:
                 plugin.run_catch(item)
+        except Exception:
+            if self.checkpoint:
+                self.checkpoint.plugin(name, item.getID(), 'failed')
+            raise
+        if self.checkpoint:
+            self.checkpoint.plugin(name, item.getID(), 'done')
+
+    def budgeted(self):
+        return self.deadline is not None or self.args.max_items is not None
+
+    def count_candidates(self, items):
+        for pair in items:
+            self.candidates += 1
+            yield pair
+
+    def within_budget(self, items, start):
+        """Stop taking items when --max-items were started or when
+        the items in flight may not be done before --deadline, as
+        estimated from the time it took so far."""
+        count = 0
+        for pair in items:
+            if (self.args.max_items is not None and
+                    self.started >= self.args.max_items):
+                log.info("stop after --max-items " +
+                         str(self.args.max_items))
+                self.exhausted = True
+                return
+            if self.deadline is not None:
+                now = time.time()
+                if count > 0:
+                    margin = (now - start) / count * self.args.jobs
+                else:
+                    margin = 0
+                if now + margin >= self.deadline:
+                    log.info("stop before --deadline " +
+                             "%02d:%02d" % self.args.deadline)
+                    self.exhausted = True
+                    return
+            count += 1
+            self.started += 1
+            yield pair
+
+    def run_plugins(self, items):
+        """Run the plugins on each (item, plugins) pair."""
+        start = time.time()
+        if self.budgeted():
+            self.candidates = 0
+            items = self.count_candidates(items)
+        if self.index:
+            items = self.skip_unchanged(items)
+        #
+        # the budget is checked before preload so that no item past
+        # --max-items or --deadline is fetched
+        #
+        if self.budgeted():
+            items = self.within_budget(items, start)
+        if self.args.preload > 1:
+            items = self.preload(items)
+        try:
+            count = self.run_pool(items)
+        finally:
+            if self.writer:
+                self.writer.flush()
+        elapsed = time.time() - start
+        metrics.registry.inc('flossbot_run_items_total', count)
+        log.info("processed " + str(count) + " items in " +
+                 "%.1f" % elapsed + " seconds (" +
+                 "%.2f" % (count / max(elapsed, 0.001)) + " items/sec)")
+        if self.exhausted:
+            #
+            # the candidates that were not looked at are not counted:
+            # that would run the rest of the query after the budget
+            # is spent
+            #
+            log.info("stopped after " + str(count) + " items out of " +
+                     str(self.candidates) + " candidate items looked at")
+        return count
+
+    def run_pool(self, items):
+        count = 0
+        if self.args.jobs <= 1:
+            for (item, plugins) in items:
+                if self.checkpoint:
+                    self.checkpoint.start(item.getID())
+                self.run_item(item, plugins)
+                count += 1
+        else:
+            #
+            # Only keep a few items in flight so that a slow item
+            # does not let the workers drain the whole item stream
+            # into memory.
+            #
+            with futures.ThreadPoolExecutor(self.args.jobs) as executor:
+                pending = set()
+                for (item, plugins) in items:
+                    if len(pending) >= 2 * self.args.jobs:
+                        (done, pending) = futures.wait(
+                            pending, return_when=futures.FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                            count += 1
+                    if self.checkpoint:
+                        self.checkpoint.start(item.getID())
+                    pending.add(executor.submit(self.run_item, item, plugins))
+                for future in futures.as_completed(pending):
+                    future.result()
+                    count += 1
+        return count
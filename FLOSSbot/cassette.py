@@ -0,0 +1,210 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import base64
+import collections
+import datetime
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from FLOSSbot import util
+
+log = logging.getLogger(__name__)
+
+#
+# Parameters that change from one run to the next without changing the
+# response, or that are too specific to the run (the content of an edit)
+# to be part of the key of an exchange.
+#
+VOLATILE = ('token', 'lgtoken', 'logintoken', 'curtimestamp', 'requestid',
+            'data', 'value', 'snaks', 'summary')
+
+#
+# A cassette is meant to be shared: the credentials of the login
+# requests and the session cookies of the responses are not recorded.
+#
+CREDENTIALS = ('lgname', 'lgpassword', 'lgdomain', 'username', 'password',
+               'retype')
+PRIVATE_HEADERS = ('set-cookie',)
+
+
+def normalize(params):
+    found = []
+    for (key, value) in sorted(params):
+        if key in VOLATILE or key in CREDENTIALS:
+            continue
+        if key == 'query':
+            #
+            # the cache buster of sparql.items
+            #
+            value = re.sub(r'\s*#\s*[\d.]+\s*$', '', value)
+        found.append((key, value))
+    return urlencode(found)
+
+
+def request_key(request):
+    (scheme, netloc, path, query, fragment) = urlsplit(request.url)
+    params = parse_qsl(query, keep_blank_values=True)
+    body = request.body
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    content_type = request.headers.get('Content-Type', '')
+    if body and 'application/x-www-form-urlencoded' in content_type:
+        params += parse_qsl(body, keep_blank_values=True)
+    return (request.method + " " +
+            urlunsplit((scheme, netloc, path, normalize(params), '')))
+
+
+def sh_key(command):
+    #
+    # the temporary directories of the probes are different each time
+    #
+    return "sh " + re.sub(r'/tmp/[\w.-]+', '/tmp/TMP', command)
+
+
+class Cassette(object):
+    """Record every HTTP exchange (pywikibot API, SPARQL and the
+    requests of the plugins) and every shell command of a run in
+    directory/cassette.jsonl, or replay them instead of sending them.
+
+    An exchange is identified by a key made of the method, the URL and
+    the parameters of the request, except the VOLATILE ones and the
+    CREDENTIALS. When the
+    same key was recorded more than once, the responses are replayed in
+    the order they were recorded and the last one is repeated when
+    there are no more."""
+
+    def __init__(self, directory, mode):
+        assert mode in ('record', 'replay'), mode
+        self.directory = directory
+        self.mode = mode
+        self.path = os.path.join(directory, 'cassette.jsonl')
+        self.lock = threading.Lock()
+        self.exchanges = collections.defaultdict(collections.deque)
+        self.last = {}
+        self.file = None
+        self.send_orig = None
+        self.sh_orig = None
+
+    def load(self):
+        with open(self.path) as f:
+            for line in f:
+                exchange = json.loads(line)
+                self.exchanges[exchange['key']].append(exchange)
+        log.info("replay " + str(sum(map(len, self.exchanges.values()))) +
+                 " exchanges from " + self.path)
+
+    def install(self):
+        cassette = self
+        if self.mode == 'record':
+            os.makedirs(self.directory, exist_ok=True)
+            self.file = open(self.path, 'a')
+        else:
+            self.load()
+        self.send_orig = requests.adapters.HTTPAdapter.send
+        self.sh_orig = util.sh
+
+        def send(adapter, request, **kwargs):
+            return cassette.send(adapter, request, **kwargs)
+
+        requests.adapters.HTTPAdapter.send = send
+        util.sh = self.sh
+
+    def uninstall(self):
+        requests.adapters.HTTPAdapter.send = self.send_orig
+        util.sh = self.sh_orig
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *args):
+        self.uninstall()
+
+    def write(self, exchange):
+        with self.lock:
+            self.file.write(json.dumps(exchange, sort_keys=True) + "\n")
+            self.file.flush()
+
+    def next(self, key):
+        with self.lock:
+            if self.exchanges[key]:
+                self.last[key] = self.exchanges[key].popleft()
+            return self.last.get(key)
+
+    def send(self, adapter, request, **kwargs):
+        key = request_key(request)
+        if self.mode == 'record':
+            response = self.send_orig(adapter, request, **kwargs)
+            content = response.content
+            self.write({
+                'key': key,
+                'status': response.status_code,
+                'reason': response.reason,
+                'headers': dict([
+                    (k, v) for (k, v) in response.headers.items()
+                    if k.lower() not in PRIVATE_HEADERS]),
+                'content': base64.b64encode(content).decode('ascii'),
+                'elapsed': response.elapsed.total_seconds(),
+            })
+            return response
+        exchange = self.next(key)
+        if exchange is None:
+            raise requests.ConnectionError("no recorded response for " + key)
+        response = requests.models.Response()
+        response.status_code = exchange['status']
+        response.reason = exchange['reason']
+        response.headers = CaseInsensitiveDict(exchange['headers'])
+        response._content = base64.b64decode(exchange['content'])
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = adapter
+        response.elapsed = datetime.timedelta(0)
+        return response
+
+    def sh(self, command, input=None):
+        key = sh_key(command)
+        if self.mode == 'record':
+            try:
+                output = self.sh_orig(command, input)
+                status = 0
+            except subprocess.CalledProcessError as e:
+                output = ''
+                status = e.returncode
+            self.write({'key': key, 'status': status, 'output': output})
+        else:
+            exchange = self.next(key)
+            if exchange is None:
+                raise subprocess.CalledProcessError(returncode=255,
+                                                    cmd=command)
+            (status, output) = (exchange['status'], exchange['output'])
+        if status != 0:
+            raise subprocess.CalledProcessError(returncode=status,
+                                                cmd=command)
+        return output
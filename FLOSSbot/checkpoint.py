@@ -0,0 +1,144 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import collections
+import json
+import logging
+import os
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class Checkpoint(object):
+    """Remember the last QID of a query that was fully processed so
+    that an interrupted run can resume after it.
+
+    Items may complete out of order when they are processed
+    concurrently: an item only becomes the last one when all the
+    items that came before it in the query are also done.
+
+    An item that could not be saved is done as well, so that it does
+    not hold back the last one, and is remembered, with the plugins
+    it was given to, to be retried when the run resumes."""
+
+    def __init__(self, path, filter, interval=100):
+        self.path = path
+        self.filter = filter
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = collections.OrderedDict()
+        self.since_save = 0
+        self.last = None
+        self.count = 0
+        self.plugins = {}
+        self.failed = {}
+        self.retrying = set()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            state = json.load(f)
+        if state['filter'] != self.filter:
+            raise ValueError(self.path + " is a checkpoint for filter '" +
+                             str(state['filter']) + "' not '" +
+                             str(self.filter) + "'")
+        if state.get('complete'):
+            log.info(self.path + " is complete, start over")
+            return
+        self.last = state['last']
+        self.count = state['count']
+        self.plugins = state['plugins']
+        self.failed = state.get('failed', {})
+        log.info(self.path + " resume after " + str(self.last) +
+                 " (" + str(self.count) + " items already done)")
+
+    def save(self, complete=False):
+        with self.lock:
+            state = {
+                'filter': self.filter,
+                'last': self.last,
+                'count': self.count,
+                'plugins': self.plugins,
+                'failed': self.failed,
+                'complete': complete,
+            }
+            self.since_save = 0
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(state, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        log.debug("checkpoint " + self.path + " saved at " + str(self.last))
+
+    def retry(self):
+        """Return the (id, plugin names) of the items that could not
+        be saved, to be started again. They stay failed until they
+        are done."""
+        with self.lock:
+            self.retrying = set(self.failed.keys())
+            return sorted(self.failed.items())
+
+    def start(self, id):
+        with self.lock:
+            if id in self.retrying:
+                return
+            self.pending[id] = False
+
+    def plugin(self, name, id, status):
+        with self.lock:
+            plugin = self.plugins.setdefault(name, {})
+            plugin[status] = plugin.get(status, 0) + 1
+            plugin['last'] = id
+
+    def fail(self, id, plugins):
+        with self.lock:
+            self.failed[id] = plugins
+            if id in self.retrying:
+                self.retrying.discard(id)
+                return
+        self.advance(id)
+
+    def done(self, id):
+        with self.lock:
+            self.failed.pop(id, None)
+            if id in self.retrying:
+                #
+                # it came before the last one already
+                #
+                self.retrying.discard(id)
+                return
+        self.advance(id)
+
+    def advance(self, id):
+        with self.lock:
+            if id not in self.pending:
+                #
+                # not started or already done, for instance when the
+                # writer calls back twice for the same item
+                #
+                log.debug("checkpoint ignores " + str(id) +
+                          " which is not pending")
+                return
+            self.pending[id] = True
+            while self.pending and next(iter(self.pending.values())):
+                (self.last, _) = self.pending.popitem(last=False)
+                self.count += 1
+                self.since_save += 1
+            save = self.since_save >= self.interval
+        if save:
+            self.save()
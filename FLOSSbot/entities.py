@@ -0,0 +1,88 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import logging
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+def site_key(site):
+    return site.family.name + ':' + site.code
+
+
+class Entities(object):
+    """Remember the ID of the property or the item found for a label on
+    a site, for ttl seconds, in a SQLite database that can be shared by
+    the threads of a bot and by bots running concurrently."""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        #
+        # readers are not blocked while another bot writes
+        #
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entities (
+                site TEXT NOT NULL,
+                type TEXT NOT NULL,
+                label TEXT NOT NULL,
+                id TEXT NOT NULL,
+                found REAL NOT NULL,
+                PRIMARY KEY (site, type, label)
+            )
+            """)
+
+    def get(self, site, type, label, now=None):
+        """Return the ID found for the label less than ttl seconds ago
+        or None."""
+        now = now or time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT id FROM entities "
+                "WHERE site = ? AND type = ? AND label = ? AND found > ?",
+                (site_key(site), type, label, now - self.ttl)).fetchone()
+        if row:
+            return row[0]
+        return None
+
+    def set(self, site, type, label, id, now=None):
+        now = now or time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?)",
+                (site_key(site), type, label, id, now))
+
+    def forget(self, site, id, labels=()):
+        """Forget the labels of the entity, when they are modified, and
+        what was found for the labels."""
+        log.debug("forget the labels of " + id)
+        with self.lock, self.db:
+            self.db.execute(
+                "DELETE FROM entities WHERE site = ? AND id = ?",
+                (site_key(site), id))
+            self.db.executemany(
+                "DELETE FROM entities WHERE site = ? AND label = ?",
+                [(site_key(site), label) for label in labels])
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+The wikis served by FLOSSbot.local, on the host:port found in the
+FLOSSBOT_LOCAL_WIKI environment variable. The wikidata code is the
+wikibase repository, fsd stands for the Free Software Directory and
+the other codes for the wikipedias.
+"""
+import os
+
+from pywikibot import family
+
+from FLOSSbot import local
+
+LANGS = ('wikidata', 'fsd') + local.LANGUAGES
+
+
+class Family(family.Family):
+    def __init__(self):
+        family.Family.__init__(self)
+        self.name = 'flossbotlocal'
+        host = os.environ.get('FLOSSBOT_LOCAL_WIKI', 'localhost:8080')
+        self.langs = dict([(code, host) for code in LANGS])
+
+    def scriptpath(self, code):
+        return '/' + code
+
+    def protocol(self, code):
+        return 'http'
+
+    def interface(self, code):
+        if code == 'wikidata':
+            return 'DataSite'
+        return 'APISite'
+
+    def calendarmodel(self, code):
+        return 'http://www.wikidata.org/entity/Q1985727'
+
+    def shared_data_repository(self, code, transcluded=False):
+        return ('wikidata', 'flossbotlocal')
@@ -20,15 +20,18 @@ import os
 
 import pywikibot
 from pywikibot import config2
-from slugify import slugify
 
-from FLOSSbot import plugin
+from FLOSSbot import local, plugin
 
 log = logging.getLogger(__name__)
 
 
 class FSD(plugin.Plugin):
 
+    entities = [
+        'P_Free_Software_Directory_entry',
+    ]
+
     @staticmethod
     def get_parser():
         parser = argparse.ArgumentParser(add_help=False)
@@ -63,14 +66,24 @@ class FSD(plugin.Plugin):
 
     def __init__(self, *args):
         super(FSD, self).__init__(*args)
-        config2.register_family_file(
-            'fsd', os.path.join(os.path.dirname(__file__),
-                                'families/fsd_family.py'))
-        self.fsd = pywikibot.Site(code="en", fam="fsd")
+        self._fsd = None
+
+    @property
+    def fsd(self):
+        """The Free Software Directory site, created when first used."""
+        if self._fsd is None:
+            if self.args.local_wiki:
+                self._fsd = pywikibot.Site(code="fsd", fam=local.FAMILY)
+            else:
+                config2.register_family_file(
+                    'fsd', os.path.join(os.path.dirname(__file__),
+                                        'families/fsd_family.py'))
+                self._fsd = pywikibot.Site(code="en", fam="fsd")
+        return self._fsd
 
     def run(self, item):
-        self.fixup(item)
-        self.verify(item)
+        self.outcome('fixup', self.fixup(item))
+        self.outcome('verify', self.verify(item))
 
     def fixup(self, item):
         item.get()
@@ -96,8 +109,9 @@ class FSD(plugin.Plugin):
             entry = pywikibot.Claim(
                 self.bot.site, self.P_Free_Software_Directory_entry, 0)
             entry.setTarget(title.replace(' ', '_'))
-            item.addClaim(entry)
-            self.set_retrieved(item, entry)
+            with self.transaction(item) as transaction:
+                transaction.add_claim(entry)
+                self.set_retrieved(item, entry)
         self.info(item, "FOUND Free Software Directory entry " +
                   "http://directory.fsf.org/wiki/" + title)
         return 'found'
@@ -128,6 +142,8 @@ class FSD(plugin.Plugin):
         return p.templatesWithParams()
 
     def get_fsd(self, title):
+        from slugify import slugify
+
         r = self.fetch_fsd(title)
         log.debug("Free Software Directory " + title + ": " + str(r))
         entry = {}
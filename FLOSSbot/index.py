@@ -0,0 +1,85 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Index(object):
+    """Remember, for each item and plugin, the revision of the item
+    when the plugin was done with it, the outcome, whether it passed
+    and when it happened, in a SQLite database.
+
+    An item is fresh for a plugin when the plugin passed, it was not
+    modified since the plugin was done with it, less than delay
+    seconds ago. A plugin passes unless it reports an error about the
+    item, for instance when a verification fails."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                id TEXT NOT NULL,
+                plugin TEXT NOT NULL,
+                lastrevid INTEGER NOT NULL,
+                outcome TEXT,
+                passed INTEGER NOT NULL,
+                done REAL NOT NULL,
+                PRIMARY KEY (id, plugin)
+            )
+            """)
+
+    def record(self, id, lastrevid, outcomes, failed=(), now=None):
+        """outcomes is a dict of plugin name => outcome and failed
+        the names of the plugins that did not pass."""
+        now = now or time.time()
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?)",
+                [(id, plugin, lastrevid, json.dumps(outcome),
+                  plugin not in failed, now)
+                 for (plugin, outcome) in outcomes.items()])
+
+    def get(self, id):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT plugin, lastrevid, outcome, passed, done "
+                "FROM items WHERE id = ?", (id,)).fetchall()
+        return dict([(plugin,
+                      (lastrevid, json.loads(outcome), bool(passed), done))
+                     for (plugin, lastrevid, outcome, passed, done) in rows])
+
+    def fresh(self, id, lastrevid, plugins, delay, now=None):
+        now = now or time.time()
+        found = self.get(id)
+        for plugin in plugins:
+            if plugin not in found:
+                return False
+            (revid, outcome, passed, done) = found[plugin]
+            if not passed or revid != lastrevid or now - done >= delay:
+                return False
+        return True
+
+    def close(self):
+        self.db.close()
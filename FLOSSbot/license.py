@@ -17,21 +17,39 @@
 import argparse
 import logging
 import re
+import threading
 
 import pywikibot
-from pywikibot import pagegenerators as pg
 
-from FLOSSbot import plugin
+from FLOSSbot import plugin, sparql
 
 log = logging.getLogger(__name__)
 
 
 class License(plugin.Plugin):
 
+    entities = [
+        'P_imported_from',
+        'P_license',
+        'P_subclass_of',
+        'Q_free_and_open_source_software',
+        'Q_free_software',
+        'Q_free_software_license',
+        'Q_open_source_license',
+        'Q_open_source_software',
+        'Q_public_domain',
+        'Q_software',
+    ]
+
     def __init__(self, *args):
         super(License, self).__init__(*args)
         self.license2item = None
         self.licenses = None
+        #
+        # the plugin is shared by the --jobs threads and the licenses
+        # of a language are set by one of them at a time
+        #
+        self.licenses_lock = threading.Lock()
 
     @staticmethod
     def get_parser():
@@ -111,8 +129,8 @@ class License(plugin.Plugin):
         return query
 
     def run(self, item):
-        self.fixup(item)
-        self.verify(item)
+        self.outcome('fixup', self.fixup(item))
+        self.outcome('verify', self.verify(item))
 
     def verify(self, item):
         item.get()
@@ -128,14 +146,15 @@ class License(plugin.Plugin):
         }
 
     def get_names(self, lang):
-        if self.license2item is None:
-            self.set_license2item()
-            self.set_en_licenses()
-            self.set_redirects('en')
-        if lang not in self.licenses:
-            self.set_names(lang)
-            self.set_redirects(lang)
-        licenses = self.licenses[lang]
+        with self.licenses_lock:
+            if self.licenses is None:
+                self.set_license2item()
+                self.set_en_licenses()
+                self.set_redirects('en')
+            if lang not in self.licenses:
+                self.set_names(lang)
+                self.set_redirects(lang)
+            licenses = self.licenses[lang]
         return (list(licenses['names'].keys()) +
                 list(licenses['redirects'].keys()))
 
@@ -166,14 +185,12 @@ class License(plugin.Plugin):
         query = """
             SELECT DISTINCT ?item WHERE {{
               ?item wdt:{dbname} ?dbname.
-        }}
+        }} ORDER BY ?item
         """.format(dbname=self.P_Wikimedia_database_name)
         log.debug("set_dbname2item " + query)
         self.license2item = {}
-        enwiki = pywikibot.site.APISite.fromDBName('enwiki')
-        for item in pg.WikidataSPARQLPageGenerator(query,
-                                                   site=self.bot.site,
-                                                   result_type=list):
+        enwiki = self.bot.site_from_dbname('enwiki')
+        for item in sparql.items(self.bot.site, query):
             item.get()
             log.debug("set_dbname2item " + item.title() +
                       " " + str(item.labels.get('en')))
@@ -207,14 +224,12 @@ class License(plugin.Plugin):
                 ?item wdt:{instance_of}?/wdt:{subclass_of}* wd:{free_software}.
               }}
               {licenses}
-        }}
+        }} ORDER BY ?item
         """.format(**format_args)
         log.debug("set_license2item " + query)
-        self.license2item = {}
-        enwiki = pywikibot.site.APISite.fromDBName('enwiki')
-        for item in pg.WikidataSPARQLPageGenerator(query,
-                                                   site=self.bot.site,
-                                                   result_type=list):
+        license2item = {}
+        enwiki = self.bot.site_from_dbname('enwiki')
+        for item in sparql.items(self.bot.site, query):
             item.get()
             log.debug("set_license2item " + item.title() +
                       " " + str(item.labels.get('en')))
@@ -223,7 +238,8 @@ class License(plugin.Plugin):
                           " because it does not link to enwiki")
                 continue
             p = pywikibot.Page(enwiki, item.sitelinks['enwiki'])
-            self.license2item[p.title()] = item
+            license2item[p.title()] = item
+        self.license2item = license2item
 
     def template_parse_license(self, license, lang):
         free_software_licenses = self.get_names(lang)
@@ -274,22 +290,23 @@ class License(plugin.Plugin):
                        str(lang2value))
             return ['inconsistent']
         status = []
-        for license in lang2value[list(lang2value.keys())[0]]:
-            license.get()
-            langs = list(lang2value.keys())
-            self.info(item, "ADD license " + license.labels['en'] +
-                      " from " + str(langs))
-            status.append(license.labels['en'])
-            claim = pywikibot.Claim(self.bot.site, self.P_license, 0)
-            claim.setTarget(license)
-            if not self.args.dry_run:
-                item.addClaim(claim)
-            for lang in langs:
-                imported = pywikibot.Claim(self.bot.site,
-                                           self.P_imported_from,
-                                           isReference=True)
-                imported.setTarget(self.get_sitelink_item(lang + "wiki"))
+        with self.transaction(item) as transaction:
+            for license in lang2value[list(lang2value.keys())[0]]:
+                license.get()
+                langs = list(lang2value.keys())
+                self.info(item, "ADD license " + license.labels['en'] +
+                          " from " + str(langs))
+                status.append(license.labels['en'])
+                claim = pywikibot.Claim(self.bot.site, self.P_license, 0)
+                claim.setTarget(license)
                 if not self.args.dry_run:
-                    claim.addSource(imported)
-            self.set_retrieved(item, claim)
+                    transaction.add_claim(claim)
+                for lang in langs:
+                    imported = pywikibot.Claim(self.bot.site,
+                                               self.P_imported_from,
+                                               isReference=True)
+                    imported.setTarget(self.get_sitelink_item(lang + "wiki"))
+                    if not self.args.dry_run:
+                        transaction.add_source(claim, imported)
+                self.set_retrieved(item, claim)
         return status
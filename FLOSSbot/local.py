@@ -0,0 +1,1049 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import argparse
+import copy
+import http.server
+import json
+import logging
+import os
+import random
+import re
+import socketserver
+import sys
+import textwrap
+import threading
+import time
+from urllib.parse import parse_qsl, urlparse
+
+log = logging.getLogger(__name__)
+
+FAMILY = 'flossbotlocal'
+
+#
+# The languages of the wikipedias, also those of the labels
+#
+LANGUAGES = ('en', 'ca', 'de', 'es', 'fr', 'it', 'ja', 'ml', 'pt', 'ru', 'zh')
+
+
+def register(address):
+    """Make the flossbotlocal pywikibot family point to the wikis
+    served at address (host:port)."""
+    from pywikibot import config2
+    os.environ['FLOSSBOT_LOCAL_WIKI'] = address
+    config2.register_family_file(
+        FAMILY, os.path.join(os.path.dirname(__file__),
+                             'families/' + FAMILY + '_family.py'))
+
+
+class APIError(Exception):
+
+    def __init__(self, code, info):
+        self.code = code
+        self.info = info
+
+
+class Wiki(object):
+    """The content of the wikis served by Server, loaded from a JSON
+    file such as:
+
+    {
+      "entities": { "Q1": { ... as returned by wbgetentities ... } },
+      "pages": {
+        "en": {
+          "Title": {
+            "text": "wikitext",
+            "langlinks": { "fr": "Titre" },
+            "backlinks": [ "Other title" ]
+          }
+        }
+      }
+    }
+
+    The entities belong to the wikidata wiki and the pages are keyed
+    by the code of their wiki (en, fr, fsd, ...)."""
+
+    def __init__(self, path=None):
+        self.lock = threading.Lock()
+        self.entities = {}
+        self.pages = {}
+        self.revid = 1000
+        if path:
+            with open(path) as f:
+                fixtures = json.load(f)
+            self.entities = fixtures.get('entities', {})
+            self.pages = fixtures.get('pages', {})
+        for entity in self.entities.values():
+            self.revid = max(self.revid, entity.get('lastrevid', 0))
+
+    def next_revid(self):
+        self.revid += 1
+        return self.revid
+
+    def entity(self, id):
+        if id not in self.entities:
+            raise APIError('no-such-entity', "Could not find " + id)
+        return self.entities[id]
+
+    def new_id(self, type):
+        prefix = 'P' if type == 'property' else 'Q'
+        ids = [int(id[1:]) for id in self.entities.keys()
+               if id.startswith(prefix)]
+        return prefix + str(max(ids + [0]) + 1)
+
+    def datatype(self, property):
+        return self.entities.get(property, {}).get('datatype')
+
+    def snak(self, property, snaktype, value):
+        snak = {
+            'snaktype': snaktype,
+            'property': property,
+            'hash': '%040x' % random.getrandbits(160),
+        }
+        if self.datatype(property):
+            snak['datatype'] = self.datatype(property)
+        if snaktype == 'value':
+            if isinstance(value, dict) and 'numeric-id' in value:
+                datavalue = {'type': 'wikibase-entityid', 'value': value}
+            elif isinstance(value, dict) and 'time' in value:
+                datavalue = {'type': 'time', 'value': value}
+            else:
+                datavalue = {'type': 'string', 'value': value}
+            snak['datavalue'] = datavalue
+        return snak
+
+    def touch(self, entity):
+        entity['lastrevid'] = self.next_revid()
+        entity['modified'] = time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                           time.gmtime())
+
+    def find_claim(self, guid):
+        id = guid.split('$')[0].upper()
+        entity = self.entity(id)
+        for claims in entity.get('claims', {}).values():
+            for claim in claims:
+                if claim['id'] == guid:
+                    return (entity, claim)
+        raise APIError('no-such-claim', "Could not find " + guid)
+
+    @staticmethod
+    def check_baserevid(entity, params):
+        #
+        # only wbeditentity conflicts: wikibase patches the statement
+        # of wbcreateclaim, wbsetclaimvalue etc. into the current
+        # revision, and pywikibot gives them the revision the item had
+        # when it was loaded
+        #
+        baserevid = params.get('baserevid')
+        if baserevid and int(baserevid) != entity['lastrevid']:
+            raise APIError('editconflict',
+                           "Edit conflict: " + entity['id'] +
+                           " was modified since revision " + baserevid)
+
+    def edit_entity(self, params):
+        data = json.loads(params.get('data', '{}'))
+        with self.lock:
+            if 'new' in params:
+                id = self.new_id(params['new'])
+                entity = {
+                    'type': params['new'],
+                    'id': id,
+                    'title': id,
+                    'pageid': int(id[1:]),
+                    'ns': 120 if params['new'] == 'property' else 0,
+                    'labels': {},
+                    'descriptions': {},
+                    'aliases': {},
+                    'claims': {},
+                }
+                if params['new'] == 'item':
+                    entity['sitelinks'] = {}
+                self.entities[id] = entity
+            else:
+                entity = self.entity(params['id'])
+                Wiki.check_baserevid(entity, params)
+            for key in ('labels', 'descriptions', 'aliases', 'sitelinks'):
+                for (k, v) in data.get(key, {}).items():
+                    if (v.get('value', v.get('title')) == '' or
+                            'remove' in v):
+                        entity.setdefault(key, {}).pop(k, None)
+                    else:
+                        entity.setdefault(key, {})[k] = v
+            if 'datatype' in data:
+                entity['datatype'] = data['datatype']
+            claims = data.get('claims', [])
+            if isinstance(claims, dict):
+                claims = [c for cs in claims.values() for c in cs]
+            for claim in claims:
+                self.edit_claim(entity, claim)
+            self.touch(entity)
+            return {'entity': copy.deepcopy(entity), 'success': 1}
+
+    def edit_claim(self, entity, claim):
+        property = claim['mainsnak']['property']
+        claims = entity.setdefault('claims', {}).setdefault(property, [])
+        claim = dict(claim)
+        #
+        # wikibase hashes the qualifiers and references it is given
+        #
+        for qualifiers in claim.get('qualifiers', {}).values():
+            for qualifier in qualifiers:
+                qualifier.setdefault('hash', '%040x' % random.getrandbits(160))
+        for reference in claim.get('references', []):
+            reference.setdefault('hash', '%040x' % random.getrandbits(160))
+        # Claim(site, property, 0) is sent with an id of 0
+        if not claim.get('id'):
+            claim['id'] = (entity['id'] + '$' +
+                           '%08x' % random.getrandbits(32))
+            claim.setdefault('type', 'statement')
+            claim.setdefault('rank', 'normal')
+            claims.append(claim)
+            return
+        for (i, existing) in enumerate(claims):
+            if existing['id'] == claim['id']:
+                if 'remove' in claim:
+                    del claims[i]
+                else:
+                    claims[i] = claim
+                return
+        claims.append(claim)
+
+    def create_claim(self, params):
+        with self.lock:
+            entity = self.entity(params['entity'])
+            value = json.loads(params['value']) if 'value' in params else None
+            claim = {
+                'id': entity['id'] + '$' + '%08x' % random.getrandbits(32),
+                'type': 'statement',
+                'rank': 'normal',
+                'mainsnak': self.snak(params['property'],
+                                      params.get('snaktype', 'value'),
+                                      value),
+            }
+            entity.setdefault('claims', {}).setdefault(
+                params['property'], []).append(claim)
+            self.touch(entity)
+            return {'claim': claim,
+                    'pageinfo': {'lastrevid': entity['lastrevid']},
+                    'success': 1}
+
+    def set_claim_value(self, params):
+        with self.lock:
+            (entity, claim) = self.find_claim(params['claim'])
+            value = json.loads(params['value']) if 'value' in params else None
+            claim['mainsnak'] = self.snak(claim['mainsnak']['property'],
+                                          params.get('snaktype', 'value'),
+                                          value)
+            self.touch(entity)
+            return {'claim': claim,
+                    'pageinfo': {'lastrevid': entity['lastrevid']},
+                    'success': 1}
+
+    def set_qualifier(self, params):
+        with self.lock:
+            (entity, claim) = self.find_claim(params['claim'])
+            value = json.loads(params['value']) if 'value' in params else None
+            qualifier = self.snak(params['property'],
+                                  params.get('snaktype', 'value'),
+                                  value)
+            qualifiers = claim.setdefault('qualifiers', {})
+            qualifiers.setdefault(params['property'], []).append(qualifier)
+            order = claim.setdefault('qualifiers-order', [])
+            if params['property'] not in order:
+                order.append(params['property'])
+            self.touch(entity)
+            return {'claim': claim,
+                    'pageinfo': {'lastrevid': entity['lastrevid']},
+                    'success': 1}
+
+    def remove_qualifiers(self, params):
+        with self.lock:
+            (entity, claim) = self.find_claim(params['claim'])
+            hashes = params['qualifiers'].split('|')
+            qualifiers = claim.get('qualifiers', {})
+            for property in list(qualifiers.keys()):
+                qualifiers[property] = [q for q in qualifiers[property]
+                                        if q['hash'] not in hashes]
+                if not qualifiers[property]:
+                    del qualifiers[property]
+                    claim['qualifiers-order'].remove(property)
+            self.touch(entity)
+            return {'pageinfo': {'lastrevid': entity['lastrevid']},
+                    'success': 1}
+
+    def remove_claims(self, params):
+        with self.lock:
+            guids = params['claim'].split('|')
+            for guid in guids:
+                (entity, claim) = self.find_claim(guid)
+                claims = entity['claims'][claim['mainsnak']['property']]
+                claims.remove(claim)
+                if not claims:
+                    del entity['claims'][claim['mainsnak']['property']]
+                self.touch(entity)
+            return {'claims': guids,
+                    'pageinfo': {'lastrevid': entity['lastrevid']},
+                    'success': 1}
+
+    def set_reference(self, params):
+        with self.lock:
+            (entity, claim) = self.find_claim(params['statement'])
+            snaks = json.loads(params['snaks'])
+            reference = {
+                'hash': params.get('reference',
+                                   '%040x' % random.getrandbits(160)),
+                'snaks': snaks,
+                'snaks-order': list(snaks.keys()),
+            }
+            references = claim.setdefault('references', [])
+            for (i, existing) in enumerate(references):
+                if existing['hash'] == reference['hash']:
+                    references[i] = reference
+                    break
+            else:
+                references.append(reference)
+            self.touch(entity)
+            return {'reference': reference,
+                    'pageinfo': {'lastrevid': entity['lastrevid']},
+                    'success': 1}
+
+    def search(self, params):
+        search = params['search']
+        language = params.get('language', 'en')
+        type = params.get('type', 'item')
+        found = []
+        with self.lock:
+            for entity in self.entities.values():
+                if entity.get('type') != type:
+                    continue
+                label = entity.get('labels', {}).get(language, {})
+                label = label.get('value')
+                if label and label.lower().startswith(search.lower()):
+                    found.append({
+                        'id': entity['id'],
+                        'title': entity.get('title', entity['id']),
+                        'label': label,
+                        'match': {'type': 'label', 'language': language,
+                                  'text': label},
+                    })
+        limit = int(params.get('limit', 7))
+        offset = int(params.get('continue', 0))
+        result = {
+            'searchinfo': {'search': search},
+            'search': found[offset:offset + limit],
+            'success': 1,
+        }
+        if offset + limit < len(found):
+            result['search-continue'] = offset + limit
+        return result
+
+    def get_entities(self, params):
+        entities = {}
+        with self.lock:
+            for id in params['ids'].split('|'):
+                if id in self.entities:
+                    entities[id] = copy.deepcopy(self.entities[id])
+                else:
+                    entities[id] = {'id': id, 'missing': ''}
+        return {'entities': entities, 'success': 1}
+
+    def page(self, code, title):
+        return self.pages.get(code, {}).get(title)
+
+    @staticmethod
+    def templates(text):
+        return ['Template:' + name.strip()
+                for name in re.findall(r'{{\s*([^|}]+)', text)]
+
+    def query_pages(self, code, params):
+        prop = params.get('prop', '').split('|')
+        pages = {}
+        for (i, title) in enumerate(params['titles'].split('|')):
+            page = self.page(code, title)
+            entity = None
+            if code == 'wikidata':
+                with self.lock:
+                    entity = copy.deepcopy(self.entities.get(title))
+            if page is None and entity is None:
+                pages[str(-1 - i)] = {'ns': 0, 'title': title, 'missing': ''}
+                continue
+            result = {
+                'pageid': 1 + i,
+                'ns': 0,
+                'title': title,
+                'contentmodel': 'wikitext',
+                'pagelanguage': code,
+                'touched': '2016-01-01T00:00:00Z',
+                'lastrevid': 1,
+            }
+            if entity is not None:
+                result['contentmodel'] = 'wikibase-' + entity['type']
+                result['lastrevid'] = entity.get('lastrevid', 1)
+                result['length'] = len(json.dumps(entity))
+                pages[str(1 + i)] = result
+                continue
+            result['length'] = len(page['text'])
+            if 'revisions' in prop:
+                result['revisions'] = [{
+                    'revid': 1,
+                    'parentid': 0,
+                    'user': 'FLOSSbot',
+                    'timestamp': '2016-01-01T00:00:00Z',
+                    'comment': '',
+                    'contentformat': 'text/x-wiki',
+                    'contentmodel': 'wikitext',
+                    '*': page['text'],
+                }]
+            if 'templates' in prop:
+                result['templates'] = [
+                    {'ns': 10, 'title': template}
+                    for template in Wiki.templates(page['text'])
+                ]
+            if 'langlinks' in prop:
+                result['langlinks'] = [
+                    {'lang': lang, '*': title}
+                    for (lang, title) in sorted(
+                        page.get('langlinks', {}).items())
+                ]
+            pages[str(1 + i)] = result
+        return {'batchcomplete': '', 'query': {'pages': pages}}
+
+    def template_pages(self, code, params):
+        """The templates used by the pages, as generator=templates
+        returns them."""
+        pages = {}
+        for title in params['titles'].split('|'):
+            page = self.page(code, title) or {'text': ''}
+            for template in Wiki.templates(page['text']):
+                pages[str(-1 - len(pages))] = {'ns': 10, 'title': template,
+                                               'missing': ''}
+        return {'batchcomplete': '', 'query': {'pages': pages}}
+
+    def backlinks(self, code, title):
+        page = self.page(code, title) or {}
+        return page.get('backlinks', [])
+
+    def parse(self, code, params):
+        title = params.get('page')
+        page = self.page(code, title)
+        if page is None:
+            raise APIError('missingtitle',
+                           "The page you specified doesn't exist.")
+        prop = params.get('prop', 'text').split('|')
+        result = {'title': title, 'pageid': 1}
+        if 'templates' in prop:
+            result['templates'] = [
+                {'ns': 10, 'exists': '', '*': template}
+                for template in Wiki.templates(page['text'])
+            ]
+        if 'langlinks' in prop:
+            result['langlinks'] = [
+                {'lang': lang, '*': title}
+                for (lang, title) in sorted(
+                    page.get('langlinks', {}).items())
+            ]
+        if 'wikitext' in prop:
+            result['wikitext'] = {'*': page['text']}
+        return {'parse': result}
+
+
+PREFIXES = {
+    'wd': 'http://www.wikidata.org/entity/',
+    'wds': 'http://www.wikidata.org/entity/statement/',
+    'wdref': 'http://www.wikidata.org/reference/',
+    'wdt': 'http://www.wikidata.org/prop/direct/',
+    'p': 'http://www.wikidata.org/prop/',
+    'ps': 'http://www.wikidata.org/prop/statement/',
+    'pq': 'http://www.wikidata.org/prop/qualifier/',
+    'pr': 'http://www.wikidata.org/prop/reference/',
+    'prov': 'http://www.w3.org/ns/prov#',
+    'wikibase': 'http://wikiba.se/ontology#',
+    'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
+    'xsd': 'http://www.w3.org/2001/XMLSchema#',
+}
+
+RANKS = {
+    'preferred': 'PreferredRank',
+    'normal': 'NormalRank',
+    'deprecated': 'DeprecatedRank',
+}
+
+
+class Sparql(object):
+    """A stand-in for the Wikidata Query Service, backed by an rdflib
+    graph. The graph holds the entities of the wiki, mapped to RDF as
+    the query service does (wdt:, p:, ps:, pq:, prov:, pr:, ...), and
+    the triples of an optional Turtle file that may use the same
+    prefixes. The graph is rebuilt when the wiki was modified.
+
+    rdflib is only needed when a query is run."""
+
+    def __init__(self, wiki, triples=None):
+        self.wiki = wiki
+        self.triples = triples
+        self.lock = threading.Lock()
+        self.graph = None
+        self.revid = None
+
+    def value(self, rdflib, snak):
+        if snak.get('snaktype') != 'value':
+            return None
+        datavalue = snak['datavalue']
+        value = datavalue['value']
+        if datavalue['type'] == 'wikibase-entityid':
+            prefix = 'P' if value.get('entity-type') == 'property' else 'Q'
+            return rdflib.URIRef(PREFIXES['wd'] + prefix +
+                                 str(value['numeric-id']))
+        elif datavalue['type'] == 'time':
+            return rdflib.Literal(value['time'].lstrip('+'),
+                                  datatype=rdflib.XSD.dateTime)
+        elif snak.get('datatype') == 'url':
+            return rdflib.URIRef(value)
+        return rdflib.Literal(value)
+
+    def add_entity(self, rdflib, graph, entity):
+        wd = rdflib.Namespace(PREFIXES['wd'])
+        ns = dict([(k, rdflib.Namespace(v)) for (k, v) in PREFIXES.items()])
+        subject = wd[entity['id']]
+        for (lang, label) in entity.get('labels', {}).items():
+            graph.add((subject, rdflib.RDFS.label,
+                       rdflib.Literal(label['value'], lang=lang)))
+        for (property, claims) in entity.get('claims', {}).items():
+            best = [c for c in claims if c.get('rank') == 'preferred']
+            if not best:
+                best = [c for c in claims if c.get('rank') == 'normal']
+            for claim in claims:
+                statement = ns['wds'][claim['id'].replace('$', '-')]
+                graph.add((subject, ns['p'][property], statement))
+                graph.add((statement, ns['wikibase'].rank,
+                           ns['wikibase'][RANKS[claim.get('rank',
+                                                          'normal')]]))
+                value = self.value(rdflib, claim['mainsnak'])
+                if value is None:
+                    continue
+                graph.add((statement, ns['ps'][property], value))
+                if claim in best:
+                    graph.add((subject, ns['wdt'][property], value))
+                for (qualifier, snaks) in claim.get('qualifiers',
+                                                    {}).items():
+                    for snak in snaks:
+                        value = self.value(rdflib, snak)
+                        if value is not None:
+                            graph.add((statement, ns['pq'][qualifier],
+                                       value))
+                for reference in claim.get('references', []):
+                    node = ns['wdref'][reference['hash']]
+                    graph.add((statement, ns['prov'].wasDerivedFrom, node))
+                    for (p, snaks) in reference.get('snaks', {}).items():
+                        for snak in snaks:
+                            value = self.value(rdflib, snak)
+                            if value is not None:
+                                graph.add((node, ns['pr'][p], value))
+
+    def get_graph(self):
+        import rdflib
+        with self.lock:
+            if self.graph is None or self.revid != self.wiki.revid:
+                graph = rdflib.Graph()
+                for (prefix, uri) in PREFIXES.items():
+                    graph.bind(prefix, uri)
+                if self.triples:
+                    graph.parse(self.triples, format='turtle')
+                with self.wiki.lock:
+                    self.revid = self.wiki.revid
+                    for entity in self.wiki.entities.values():
+                        self.add_entity(rdflib, graph, entity)
+                self.graph = graph
+            return self.graph
+
+    def query(self, query):
+        """Return the result of the query in the SPARQL 1.1 JSON format
+        of the query service."""
+        graph = self.get_graph()
+        start = time.time()
+        result = graph.query(query, initNs=PREFIXES)
+        response = json.loads(result.serialize(format='json').decode(
+            'utf-8'))
+        log.debug("sparql query took %.3f seconds " % (time.time() - start) +
+                  query)
+        return response
+
+
+#
+# The modules described by action=paraminfo, which pywikibot needs to
+# build its requests. The query modules are name => (prefix, whether
+# it can be a generator, whether it has a limit).
+#
+ACTIONS = ('query', 'paraminfo', 'tokens', 'parse', 'login', 'clientlogin',
+           'logout', 'wbgetentities', 'wbsearchentities', 'wbeditentity',
+           'wbcreateclaim', 'wbsetclaimvalue', 'wbremoveclaims',
+           'wbsetqualifier', 'wbremovequalifiers', 'wbsetreference')
+POSTED = ('login', 'clientlogin', 'logout', 'wbeditentity', 'wbcreateclaim',
+          'wbsetclaimvalue', 'wbremoveclaims', 'wbsetqualifier',
+          'wbremovequalifiers', 'wbsetreference')
+QUERY_MODULES = {
+    'prop': {
+        'info': ('in', False, False),
+        'revisions': ('rv', False, True),
+        'templates': ('tl', True, True),
+        'langlinks': ('ll', False, True),
+        'categories': ('cl', True, True),
+        'links': ('pl', True, True),
+        'redirects': ('rd', True, True),
+        'pageprops': ('pp', False, False),
+    },
+    'list': {
+        'backlinks': ('bl', True, True),
+        'embeddedin': ('ei', True, True),
+        'recentchanges': ('rc', True, True),
+        'search': ('sr', True, True),
+        'allpages': ('ap', True, True),
+    },
+    'meta': {
+        'siteinfo': ('si', False, False),
+        'userinfo': ('ui', False, False),
+        'tokens': ('', False, False),
+        'wikibase': ('wb', False, False),
+    },
+}
+TOKENS = ['createaccount', 'csrf', 'login', 'patrol', 'rollback',
+          'userrights', 'watch']
+
+
+def paraminfo_module(path):
+    """Return the paraminfo of the module at path (such as query or
+    query+templates) or None if there is no such module."""
+    query = {}
+    for (group, modules) in QUERY_MODULES.items():
+        for (name, module) in modules.items():
+            query[name] = (group,) + module
+    if path == 'main':
+        return {
+            'name': 'main', 'path': 'main', 'classname': 'ApiMain',
+            'prefix': '',
+            'parameters': [
+                {'name': 'action', 'type': list(ACTIONS),
+                 'submodules': dict([(a, a) for a in ACTIONS])},
+                {'name': 'format', 'type': ['json'],
+                 'submodules': {'json': 'json'}},
+            ],
+        }
+    elif path == 'paraminfo':
+        parameters = [
+            {'name': 'modules', 'type': 'string', 'multi': '',
+             'limit': 50},
+            {'name': 'querymodules', 'type': sorted(query.keys()),
+             'multi': '', 'limit': 50},
+        ]
+    elif path == 'query':
+        parameters = [
+            {'name': group, 'type': sorted(modules.keys()), 'multi': '',
+             'submodules': dict([(name, 'query+' + name)
+                                 for name in modules.keys()])}
+            for (group, modules) in sorted(QUERY_MODULES.items())
+        ]
+        generators = [name for (name, module) in query.items()
+                      if module[2]]
+        parameters.append(
+            {'name': 'generator', 'type': sorted(generators),
+             'submodules': dict([(name, 'query+' + name)
+                                 for name in generators])})
+    elif path == 'tokens':
+        parameters = [{'name': 'type', 'type': TOKENS, 'multi': ''}]
+    elif path in ACTIONS:
+        parameters = []
+    elif path.startswith('query+') and path[6:] in query:
+        name = path[6:]
+        (group, prefix, generator, limit) = query[name]
+        parameters = []
+        if limit:
+            parameters.append({'name': 'limit', 'type': 'limit',
+                               'default': 10, 'min': 1,
+                               'max': 500, 'highmax': 5000})
+        if name == 'info':
+            parameters += [
+                {'name': 'prop', 'type': ['protection', 'url'],
+                 'multi': '', 'limit': 50, 'highlimit': 500},
+                {'name': 'token', 'type': ['edit', 'watch'],
+                 'deprecated': ''},
+            ]
+        elif name == 'tokens':
+            parameters.append({'name': 'type', 'type': TOKENS,
+                               'multi': ''})
+        module = {
+            'name': name, 'path': path, 'group': group, 'prefix': prefix,
+            'classname': 'ApiQuery' + name.capitalize(),
+            'parameters': parameters,
+        }
+        if generator:
+            module['generator'] = ''
+        return module
+    else:
+        return None
+    module = {
+        'name': path, 'path': path, 'prefix': '',
+        'classname': 'Api' + path.capitalize(),
+        'parameters': parameters,
+    }
+    if path in POSTED:
+        module['mustbeposted'] = ''
+    return module
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                          http.server.HTTPServer):
+    daemon_threads = True
+
+
+class Server(object):
+    """A stand-in for the action API of wikidata and of the wikis
+    the plugins read from, at http://host:port/<code>/api.php, and
+    for the query service at http://host:port/sparql.
+
+    Every request is delayed by latency seconds. A maxlag fraction
+    of the requests fail with a maxlag error and an errors fraction
+    of them with an internal_api_error, as a busy wiki would."""
+
+    def __init__(self, wiki, latency=0, maxlag=0, errors=0,
+                 user='FLOSSbot', sparql=None):
+        self.wiki = wiki
+        self.sparql = sparql
+        self.latency = latency
+        self.maxlag = maxlag
+        self.errors = errors
+        self.user = user
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def siteinfo(self, code, host, params):
+        properties = params.get('siprop', 'general').split('|')
+        namespaces = {
+            '-2': ('Media', ''),
+            '-1': ('Special', ''),
+            '0': ('', 'wikibase-item' if code == 'wikidata' else None),
+            '1': ('Talk', None),
+            '2': ('User', None),
+            '3': ('User talk', None),
+            '4': ('Project', None),
+            '6': ('File', None),
+            '8': ('MediaWiki', None),
+            '10': ('Template', None),
+            '12': ('Help', None),
+            '14': ('Category', None),
+        }
+        if code == 'wikidata':
+            namespaces['120'] = ('Property', 'wikibase-property')
+            namespaces['121'] = ('Property talk', None)
+        query = {}
+        if 'general' in properties:
+            query['general'] = {
+                'mainpage': 'Main Page',
+                'base': 'http://' + host + '/' + code + '/Main_Page',
+                'sitename': 'FLOSSbot ' + code,
+                'generator': 'MediaWiki 1.28.0-wmf.20',
+                'phpversion': '5.6',
+                'phpsapi': 'fpm-fcgi',
+                'dbtype': 'mysql',
+                'case': 'first-letter',
+                'lang': 'en' if code in ('wikidata', 'fsd') else code,
+                'fallback': [],
+                'server': 'http://' + host,
+                'servername': host.split(':')[0],
+                'articlepath': '/' + code + '/$1',
+                'scriptpath': '/' + code,
+                'script': '/' + code + '/index.php',
+                'wikiid': code + 'wiki',
+                'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'timezone': 'UTC',
+                'timeoffset': 0,
+                'maxuploadsize': 0,
+                'legaltitlechars': (" %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`"
+                                    "a-z~\\x80-\\xFF+"),
+                'invalidusernamechars': '@:',
+                'wikibase-conceptbaseuri': 'http://www.wikidata.org/entity/',
+            }
+            if self.sparql and code == 'wikidata':
+                query['general']['wikibase-sparql'] = (
+                    'http://' + host + '/sparql')
+        if 'namespaces' in properties:
+            query['namespaces'] = {}
+            for (id, (name, model)) in namespaces.items():
+                namespace = {
+                    'id': int(id),
+                    'case': 'first-letter',
+                    '*': name,
+                }
+                if name:
+                    namespace['canonical'] = name
+                if id in ('0', '120'):
+                    namespace['content'] = ''
+                if model:
+                    namespace['defaultcontentmodel'] = model
+                query['namespaces'][id] = namespace
+        if 'languages' in properties:
+            query['languages'] = [{'code': lang, '*': lang}
+                                  for lang in LANGUAGES]
+        for (property, empty) in (('namespacealiases', []),
+                                  ('extensions', []),
+                                  ('interwikimap', []),
+                                  ('magicwords', []),
+                                  ('restrictions', {'types': [],
+                                                    'levels': []})):
+            if property in properties:
+                query[property] = empty
+        return query
+
+    def userinfo(self):
+        return {
+            'id': 1,
+            'name': self.user,
+            'groups': ['*', 'user', 'autoconfirmed', 'bot'],
+            'rights': ['read', 'edit', 'createpage', 'writeapi', 'bot',
+                       'apihighlimits', 'noratelimit', 'item-term',
+                       'property-create'],
+            'messages': False,
+        }
+
+    def query(self, code, host, params):
+        if params.get('generator') == 'templates':
+            return self.wiki.template_pages(code, params)
+        if 'titles' in params:
+            return self.wiki.query_pages(code, params)
+        if (params.get('list') == 'backlinks' or
+                params.get('generator') == 'backlinks'):
+            title = params.get('bltitle', params.get('gbltitle'))
+            titles = self.wiki.backlinks(code, title)
+            if params.get('list') == 'backlinks':
+                return {'batchcomplete': '', 'query': {'backlinks': [
+                    {'pageid': 100 + i, 'ns': 0, 'title': t,
+                     'redirect': ''} for (i, t) in enumerate(titles)]}}
+            if not titles:
+                return {'batchcomplete': ''}
+            return {'batchcomplete': '', 'query': {'pages': dict([
+                (str(100 + i), {'pageid': 100 + i, 'ns': 0, 'title': t,
+                                'redirect': ''})
+                for (i, t) in enumerate(titles)])}}
+        query = {}
+        meta = params.get('meta', '').split('|')
+        if 'siteinfo' in meta:
+            query.update(self.siteinfo(code, host, params))
+        if 'userinfo' in meta:
+            query['userinfo'] = self.userinfo()
+        if 'tokens' in meta:
+            #
+            # +\ alone is the token of anonymous users, which pywikibot
+            # does not use
+            #
+            query['tokens'] = dict([
+                (type + 'token', '0' * 40 + '+\\')
+                for type in params.get('type', 'csrf').split('|')])
+        if 'wikibase' in meta:
+            query['wikibase'] = {'repo': {'url': {
+                'base': 'http://' + host,
+                'scriptpath': '/wikidata',
+                'articlepath': '/wikidata/$1',
+            }}}
+        return {'batchcomplete': '', 'query': query}
+
+    def handle(self, code, host, params):
+        action = params.get('action')
+        with self.lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+        if action == 'query':
+            return self.query(code, host, params)
+        elif action == 'login':
+            return {'login': {'result': 'Success', 'lguserid': 1,
+                              'lgusername': self.user}}
+        elif action == 'clientlogin':
+            return {'clientlogin': {'status': 'PASS',
+                                    'username': self.user}}
+        elif action == 'logout':
+            return {}
+        elif action == 'parse':
+            return self.wiki.parse(code, params)
+        elif action == 'paraminfo':
+            return {'paraminfo': {'modules': [
+                paraminfo_module(path) or {'name': path, 'missing': ''}
+                for path in params.get('modules', '').split('|') if path
+            ]}}
+        if code != 'wikidata':
+            raise APIError('unknown_action',
+                           "Unrecognized value for parameter 'action': " +
+                           str(action))
+        if action == 'wbgetentities':
+            return self.wiki.get_entities(params)
+        elif action == 'wbsearchentities':
+            return self.wiki.search(params)
+        elif action == 'wbeditentity':
+            return self.wiki.edit_entity(params)
+        elif action == 'wbcreateclaim':
+            return self.wiki.create_claim(params)
+        elif action == 'wbsetclaimvalue':
+            return self.wiki.set_claim_value(params)
+        elif action == 'wbremoveclaims':
+            return self.wiki.remove_claims(params)
+        elif action == 'wbsetqualifier':
+            return self.wiki.set_qualifier(params)
+        elif action == 'wbremovequalifiers':
+            return self.wiki.remove_qualifiers(params)
+        elif action == 'wbsetreference':
+            return self.wiki.set_reference(params)
+        raise APIError('unknown_action',
+                       "Unrecognized value for parameter 'action': " +
+                       str(action))
+
+    def respond(self, path, host, params):
+        """Return the (status, headers, body) of the response."""
+        if path == '/sparql' and self.sparql:
+            with self.lock:
+                self.calls['sparql'] = self.calls.get('sparql', 0) + 1
+            if self.latency:
+                time.sleep(self.latency)
+            try:
+                return (200, {}, self.sparql.query(params['query']))
+            except Exception as e:
+                log.exception("sparql query failed " +
+                              str(params.get('query')))
+                return (500, {}, {'error': str(e)})
+        m = re.match('^/([^/]+)/api.php$', path)
+        if not m:
+            return (404, {}, {'error': {'code': 'notfound', 'info': path}})
+        code = m.group(1)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.maxlag and random.random() < self.maxlag:
+            return (200, {'Retry-After': '1', 'X-Database-Lag': '10'},
+                    {'error': {'code': 'maxlag',
+                               'info': 'Waiting for db1: 10 seconds lagged',
+                               'host': 'db1', 'lag': 10}})
+        if self.errors and random.random() < self.errors:
+            return (200, {}, {'error': {
+                'code': 'internal_api_error_DBQueryError',
+                'info': '[local] Database query error'}})
+        try:
+            return (200, {}, self.handle(code, host, params))
+        except APIError as e:
+            return (200, {}, {'error': {'code': e.code, 'info': e.info}})
+
+    def serve(self, port, host='127.0.0.1'):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                self.reply(b'')
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self.reply(self.rfile.read(length))
+
+            def reply(self, body):
+                url = urlparse(self.path)
+                params = dict(parse_qsl(url.query, keep_blank_values=True))
+                params.update(parse_qsl(body.decode('utf-8'),
+                                        keep_blank_values=True))
+                (status, headers, response) = server.respond(
+                    url.path, self.headers.get('Host', host), params)
+                body = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type',
+                                 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                for (k, v) in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug("local " + format % args)
+
+        httpd = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=httpd.serve_forever,
+                                  name='FLOSSbot local wiki',
+                                  daemon=True)
+        thread.start()
+        log.info("wikis served at http://" + host + ":" +
+                 str(httpd.server_address[1]) + "/<code>/api.php")
+        return httpd
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=textwrap.dedent("""\
+        Serve a local stand-in of the wikidata action API, to be used
+        with FLOSSbot --local-wiki HOST:PORT.
+        """))
+    parser.add_argument(
+        '--fixtures',
+        default=None,
+        help='JSON file with the entities and the pages of the wikis')
+    parser.add_argument(
+        '--triples',
+        default=None,
+        help=('Turtle file with triples to add to those of the entities, '
+              'for the SPARQL queries'))
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1')
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8080)
+    parser.add_argument(
+        '--user',
+        default='FLOSSbot',
+        help='the name of the user who is always logged in')
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0,
+        help='seconds to wait before answering each request')
+    parser.add_argument(
+        '--maxlag',
+        type=float,
+        default=0,
+        help='fraction of the requests that fail with maxlag')
+    parser.add_argument(
+        '--errors',
+        type=float,
+        default=0,
+        help='fraction of the requests that fail with an internal error')
+    return parser
+
+
+def main(argv=sys.argv[1:]):
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                        level=logging.INFO)
+    args = get_parser().parse_args(argv)
+    wiki = Wiki(args.fixtures)
+    server = Server(wiki,
+                    sparql=Sparql(wiki, args.triples),
+                    latency=args.latency,
+                    maxlag=args.maxlag,
+                    errors=args.errors,
+                    user=args.user)
+    httpd = server.serve(args.port, args.host)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        httpd.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import bisect
+import contextlib
+import http.server
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Metrics(object):
+    """Counters and latency histograms, exported in the Prometheus
+    text format.
+
+    A metric is identified by its name and its labels, for instance
+    inc('flossbot_items_total', plugin='QA')."""
+
+    buckets = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = Metrics.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = Metrics.key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = {
+                    'buckets': [0] * len(Metrics.buckets),
+                    'sum': 0.0,
+                    'count': 0,
+                }
+            histogram = self.histograms[key]
+            index = bisect.bisect_left(Metrics.buckets, seconds)
+            for i in range(index, len(Metrics.buckets)):
+                histogram['buckets'][i] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    @staticmethod
+    def format(name, labels, value):
+        if labels:
+            name += '{' + ','.join([
+                k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"') +
+                '"' for (k, v) in labels
+            ]) + '}'
+        return name + ' ' + str(value) + "\n"
+
+    def render(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        lines = []
+        types = set()
+        for ((name, labels), value) in counters:
+            if name not in types:
+                types.add(name)
+                lines.append('# TYPE ' + name + " counter\n")
+            lines.append(Metrics.format(name, labels, value))
+        for ((name, labels), histogram) in histograms:
+            if name not in types:
+                types.add(name)
+                lines.append('# TYPE ' + name + " histogram\n")
+            for (le, count) in zip(Metrics.buckets, histogram['buckets']):
+                lines.append(Metrics.format(name + '_bucket',
+                                            labels + (('le', le),),
+                                            count))
+            lines.append(Metrics.format(name + '_bucket',
+                                        labels + (('le', '+Inf'),),
+                                        histogram['count']))
+            lines.append(Metrics.format(name + '_sum', labels,
+                                        histogram['sum']))
+            lines.append(Metrics.format(name + '_count', labels,
+                                        histogram['count']))
+        return "".join(lines)
+
+    def write(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def write_every(self, path, interval):
+        def run():
+            while True:
+                time.sleep(interval)
+                self.write(path)
+        thread = threading.Thread(target=run, name='FLOSSbot metrics file',
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def serve(self, port, host='127.0.0.1'):
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug("metrics " + format % args)
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever,
+                                  name='FLOSSbot metrics server',
+                                  daemon=True)
+        thread.start()
+        log.info("metrics served at http://" + host + ":" +
+                 str(server.server_address[1]) + "/metrics")
+        return server
+
+
+registry = Metrics()
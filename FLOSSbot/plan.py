@@ -0,0 +1,91 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import threading
+
+from FLOSSbot import metrics
+
+log = logging.getLogger(__name__)
+
+
+class Plan(object):
+    """Record transactions in a JSON Lines file instead of saving
+    them, so that they can be applied later with apply().
+
+    Each line is the change set of an item: the item QID, the revision
+    of the item the changes are based on, the list of changes and the
+    wbeditentity data that saves them."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+
+    def write(self, transaction):
+        if len(transaction.claims) == 0:
+            return False
+        line = json.dumps({
+            'item': transaction.item.getID(),
+            'baserevid': transaction.item.latest_revision_id,
+            'changes': transaction.changes,
+            'data': transaction.data(),
+        }, sort_keys=True)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+        return True
+
+    def close(self):
+        self.file.close()
+
+
+def apply(site, path, dry_run=False):
+    """Save the change sets recorded in path. A change set is not
+    saved if the item was modified in a way that conflicts with it
+    since it was recorded. With dry_run the change sets are only
+    logged."""
+    saved = 0
+    failed = 0
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            change = json.loads(line)
+            if dry_run:
+                saved += 1
+                log.info("http://wikidata.org/wiki/" + change['item'] +
+                         " WOULD APPLY " + str(len(change['changes'])) +
+                         " changes")
+                continue
+            metrics.registry.inc('flossbot_api_writes_total',
+                                 action='wbeditentity')
+            try:
+                site.editEntity({'id': change['item']}, change['data'],
+                                baserevid=change['baserevid'],
+                                bot=True)
+                saved += 1
+                log.info("http://wikidata.org/wiki/" + change['item'] +
+                         " APPLIED " + str(len(change['changes'])) +
+                         " changes")
+            except Exception as e:
+                failed += 1
+                log.error("http://wikidata.org/wiki/" + change['item'] +
+                          " APPLY FAIL " + str(e))
+    log.info("applied " + str(saved) + " change sets from " + path +
+             ", " + str(failed) + " failed")
+    return (saved, failed)
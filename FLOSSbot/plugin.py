@@ -23,15 +23,35 @@ import pywikibot
 import requests
 from pywikibot import pagegenerators as pg
 
+from FLOSSbot import metrics, util
+
 log = logging.getLogger(__name__)
 
 
 class Plugin(object):
 
+    #
+    # The properties (P_) and the items (Q_) the plugin needs, named
+    # after their english label. They are all looked up when the bot
+    # starts (see Bot.resolve_entities) and then are attributes of the
+    # plugin.
+    #
+    entities = [
+        'P_Wikimedia_database_name',
+        'P_instance_of',
+        'P_retrieved',
+        'P_source_code_repository',
+        'Q_Wikimedia_disambiguation_page',
+    ]
+
     def __init__(self, bot, args):
         self.args = args
         self.bot = bot
-        self.reset_cache()
+        self.bot.entity_plugins.add(self)
+        #
+        # shared by the --jobs threads: an entry is only set once
+        # complete, at worst two threads look up the same one
+        #
         self.title_translation = {}
         self.dbname2item = {}
 
@@ -61,6 +81,12 @@ class Plugin(object):
 
     def error(self, item, message):
         self.log(log.error, item, message)
+        #
+        # the item is not skipped by the next run with --index
+        #
+        failed = getattr(self.bot.local, 'failed', None)
+        if failed is not None:
+            failed.add(self.__class__.__name__)
 
     def log(self, fun, item, message):
         label = item.labels.get('en', 'no label')
@@ -70,30 +96,74 @@ class Plugin(object):
             " " + message)
 
     def run_catch(self, item):
+        name = self.__class__.__name__
+        metrics.registry.inc('flossbot_items_total', plugin=name)
         try:
-            self.run(item)
+            with metrics.registry.timer('flossbot_plugin_seconds',
+                                        plugin=name):
+                self.run(item)
         except:
+            metrics.registry.inc('flossbot_plugin_failures_total',
+                                 plugin=name)
             self.error(item, "failed with an exception")
             raise
 
-    def reset_cache(self):
-        self.bot.entities = {
-            'property': {},
-            'item': {},
-        }
+    def outcome(self, phase, status):
+        """Count the status returned by the fixup or verify phase
+        of the plugin, which can be a string, a list of strings or a
+        dict of url => string."""
+        if status is None:
+            return
+        if isinstance(status, dict):
+            status = list(status.values())
+        elif not isinstance(status, list):
+            status = [status]
+        for s in status:
+            metrics.registry.inc('flossbot_outcomes_total',
+                                 plugin=self.__class__.__name__,
+                                 phase=phase,
+                                 status=s)
+        outcomes = getattr(self.bot.local, 'outcomes', None)
+        if outcomes is not None:
+            outcomes.setdefault(self.__class__.__name__, {})[phase] = status
+
+    def transaction(self, item):
+        return self.bot.transaction(item)
 
     def lookup_entity(self, name, **kwargs):
         type = kwargs['type']
         found = self.bot.entities[type].get(name)
         if found:
             return found
+        #
+        # what is found is not remembered if an entity was forgotten
+        # in the meantime because it may be what was forgotten
+        #
+        generation = self.bot.entities_generation
+        cache = self.bot.entity_cache
+        if cache and not self.args.refresh_entities:
+            found = cache.get(self.bot.site, type, name)
+            if found:
+                if type == 'item':
+                    found = pywikibot.ItemPage(self.bot.site, found, 0)
+                self.remember_entity(generation, type, name, found)
+                return found
         found = self.search_entity(self.bot.site, name, **kwargs)
         if found:
             if type == 'property':
                 found = found['id']
-            self.bot.entities[type][name] = found
+            if self.remember_entity(generation, type, name, found) and cache:
+                cache.set(self.bot.site, type, name,
+                          found if type == 'property' else found.getID())
         return found
 
+    def remember_entity(self, generation, type, name, found):
+        with self.bot.entities_lock:
+            if generation != self.bot.entities_generation:
+                return False
+            self.bot.entities[type][name] = found
+            return True
+
     #
     # Hardcode the desired wikidata item when there are
     # multiple items with the same english label and no
@@ -101,11 +171,17 @@ class Plugin(object):
     #
     authoritative = {
         'wikidata': {
-            'git': 'Q186055',
-            'Fossil': 'Q1439431',
-            'Subversion': 'Q46794',
+            'wikidata': {
+                'git': 'Q186055',
+                'Fossil': 'Q1439431',
+                'Subversion': 'Q46794',
+            },
+            'test': {
+            },
         },
-        'test': {
+        'flossbotlocal': {
+            'wikidata': {
+            },
         },
     }
 
@@ -114,12 +190,14 @@ class Plugin(object):
         return re.sub('[-_]', ' ', name)
 
     def search_entity(self, site, name, **kwargs):
-        if name in Plugin.authoritative[site.code]:
-            candidate = pywikibot.ItemPage(
-                site, Plugin.authoritative[site.code][name], 0)
+        authoritative = Plugin.authoritative[site.family.name][site.code]
+        if name in authoritative:
+            candidate = pywikibot.ItemPage(site, authoritative[name], 0)
             if candidate.get()['labels']['en'] == name:
                 return candidate
         candidates = []
+        metrics.registry.inc('flossbot_api_reads_total',
+                             action='wbsearchentities')
         for p in site.search_entities(name, 'en', **kwargs):
             log.debug("looking for entity " + name + ", found " + str(p))
             if ('label' in p and
@@ -132,13 +210,21 @@ class Plugin(object):
         if len(candidates) == 0:
             return None
         elif len(candidates) > 1 and kwargs['type'] == 'item':
+            #
+            # looked up directly because the P_ and Q_ attributes may
+            # not be set yet, while the entities of the plugin resolve
+            #
+            P_instance_of = self.lookup_entity('instance of',
+                                               type='property')
+            Q_Wikimedia_disambiguation_page = self.lookup_entity(
+                'Wikimedia disambiguation page', type='item')
             found = []
-            for candidate in candidates:
+            for candidate in site.preloaditempages(candidates):
                 item = candidate.get()
                 ok = True
-                for instance_of in item['claims'].get(self.P_instance_of, []):
+                for instance_of in item['claims'].get(P_instance_of, []):
                     if (instance_of.getTarget() ==
-                            self.Q_Wikimedia_disambiguation_page):
+                            Q_Wikimedia_disambiguation_page):
                         log.debug("ignore disambiguation page " +
                                   candidate.getID() + " for " + name)
                         ok = False
@@ -190,36 +276,74 @@ class Plugin(object):
         }
         log.debug("set " + id + " label to '" + label + "'")
         self.bot.site.editEntity({'id': id}, data)
-        while True:
-            if id.startswith('P'):
-                entity = pywikibot.PropertyPage(self.bot.site, id)
-            else:
-                entity = pywikibot.ItemPage(self.bot.site, id, 0)
-            entity.get(force=True)
-            if label == '' and entity.labels.get('en') is None:
-                break
-            if label != '' and label == entity.labels.get('en'):
-                break
-        self.reset_cache()
-
-    def __getattribute__(self, name):
+
+        def label_is_set():
+            found = self.bot.site.loadcontent({'ids': id}, 'labels')
+            en = found[id].get('labels', {}).get('en', {})
+            return en.get('value', '') == label
+
+        util.wait_for(label_is_set, 'label', id)
+        self.bot.forget_entity(id, [label])
+
+    @classmethod
+    def entity_names(cls):
+        """The entities of the plugin and of the classes it derives
+        from."""
+        names = []
+        for c in reversed(cls.__mro__):
+            for name in c.__dict__.get('entities', []):
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def resolve_entity(self, name):
         if name.startswith('P_'):
             type = 'property'
-        elif name.startswith('Q_'):
-            type = 'item'
         else:
-            return super(Plugin, self).__getattribute__(name)
+            type = 'item'
         label = " ".join(name.split('_')[1:])
         found = self.lookup_entity(label, type=type)
-        if not found:
-            if self.args.test:
-                self.create_entity(type, label)
-                for i in range(120):
-                    found = self.lookup_entity(label, type=type)
-                    if found is not None:
-                        break
-            else:
-                raise ValueError("found no items for " + name)
+        if not found and self.args.test:
+            self.create_entity(type, label)
+            found = util.wait_for(
+                lambda: self.lookup_entity(label, type=type),
+                'search', type + " " + label)
+        return found
+
+    def resolve_entities(self, names=None):
+        """Look up the entities and set each of them as an attribute
+        of the plugin as soon as it is found. Raise ValueError listing
+        all those that are not found."""
+        missing = []
+        for name in names or self.entity_names():
+            if name in self.__dict__:
+                continue
+            if self.set_entity(name) is None:
+                missing.append(name)
+        if missing:
+            raise ValueError("found no items for " + ", ".join(missing))
+
+    def set_entity(self, name):
+        generation = self.bot.entities_generation
+        found = self.resolve_entity(name)
+        if found:
+            with self.bot.entities_lock:
+                if generation == self.bot.entities_generation:
+                    self.__dict__[name] = found
+            return found
+        return None
+
+    def __getattr__(self, name):
+        #
+        # only called when the attribute is not set, i.e. for the
+        # entities that are not declared, such as those of the tests,
+        # and for those that were forgotten (see Bot.forget_entity)
+        #
+        if not name.startswith(('P_', 'Q_')):
+            raise AttributeError(name)
+        found = self.set_entity(name)
+        if found is None:
+            raise AttributeError("found no items for " + name)
         return found
 
     def get_source(self, claim, id):
@@ -242,21 +366,38 @@ class Plugin(object):
             return True
 
     def set_retrieved(self, item, claim, now=datetime.utcnow()):
-        when = pywikibot.WbTime(now.year, now.month, now.day)
+        when = pywikibot.WbTime(now.year, now.month, now.day,
+                                site=self.bot.site)
         retrieved = self.get_source(claim, self.P_retrieved)
-        if retrieved:
-            self.debug(item, "updating retrieved")
-            retrieved[0].setTarget(when)
-            if not self.args.dry_run:
-                self.bot.site.save_claim(claim)
-        else:
-            self.debug(item, "setting retrieved")
-            retrieved = pywikibot.Claim(self.bot.site,
-                                        self.P_retrieved,
-                                        isReference=True)
-            retrieved.setTarget(when)
-            if not self.args.dry_run:
-                claim.addSource(retrieved)
+        with self.transaction(item) as transaction:
+            if retrieved:
+                self.debug(item, "updating retrieved")
+                if self.args.dry_run:
+                    retrieved[0].setTarget(when)
+                else:
+                    transaction.change_source(claim, retrieved[0], when)
+            else:
+                self.debug(item, "setting retrieved")
+                retrieved = pywikibot.Claim(self.bot.site,
+                                            self.P_retrieved,
+                                            isReference=True)
+                retrieved.setTarget(when)
+                if not self.args.dry_run:
+                    transaction.add_source(claim, retrieved)
+
+    def http_request(self, url, **kwargs):
+        name = self.__class__.__name__
+        try:
+            with metrics.registry.timer('flossbot_http_seconds',
+                                        plugin=name):
+                r = self.bot.http.get(url, **kwargs)
+        except Exception:
+            metrics.registry.inc('flossbot_http_requests_total',
+                                 plugin=name, status='error')
+            raise
+        metrics.registry.inc('flossbot_http_requests_total',
+                             plugin=name, status=r.status_code)
+        return r
 
     def http_get(self, url):
         try:
@@ -265,13 +406,7 @@ class Plugin(object):
             # servers do not respond to it. For instance
             # https://src.openvz.org/projects/OVZ/ returned 405
             #
-            # The user agent is required for some servers. For
-            # instance http://marabunta.laotracara.com/descargas/
-            # returns 406 if no User-Agent header is set.
-            #
-            r = requests.get(url,
-                             headers={'User-Agent': 'FLOSSbot'},
-                             verify=False)
+            r = self.http_request(url, verify=False)
             log.debug("GET " + url + " status " + str(r.status_code))
             if r.status_code != requests.codes.ok:
                 log.debug("GET " + url + " " + r.text)
@@ -286,7 +421,7 @@ class Plugin(object):
     def get_template_field(self, item, lang2field, lang2pattern):
         lang2value = {}
         for dbname in item.sitelinks.keys():
-            site = pywikibot.site.APISite.fromDBName(dbname)
+            site = self.bot.site_from_dbname(dbname)
             pattern = lang2pattern.get(site.code, lang2pattern['*'])
             p = pywikibot.Page(site, item.sitelinks[dbname])
             for (template, pairs) in p.templatesWithParams():
@@ -316,7 +451,7 @@ class Plugin(object):
 
     def translate_title(self, title, lang):
         if title not in self.title_translation:
-            site = pywikibot.site.APISite.fromDBName('enwiki')
+            site = self.bot.site_from_dbname('enwiki')
             translation = {'en': title}
             p = pywikibot.Page(site, title)
             for l in p.langlinks():
@@ -326,7 +461,7 @@ class Plugin(object):
         return self.title_translation[title].get(lang)
 
     def get_redirects(self, title, lang):
-        site = pywikibot.site.APISite.fromDBName(lang + 'wiki')
+        site = self.bot.site_from_dbname(lang + 'wiki')
         p = pywikibot.Page(site, title)
         r = [r.title() for r in p.getReferences(follow_redirects=False,
                                                 withTemplateInclusion=False,
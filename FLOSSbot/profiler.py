@@ -0,0 +1,119 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import contextlib
+import cProfile
+import heapq
+import logging
+import os
+import pstats
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Profiler(object):
+    """Profile the plugins with cProfile, one item at a time.
+
+    The profiles of a plugin are aggregated over all the items and
+    saved in directory/<plugin>.pstats when the profiler is closed.
+    The directory/summary.txt file shows the top functions of each
+    plugin and the slowest items, with the time spent in each plugin
+    and the functions that took most of it."""
+
+    def __init__(self, directory, top=30, slowest=10, functions=5):
+        self.directory = directory
+        self.top = top
+        self.slowest = slowest
+        self.functions = functions
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.seconds = {}
+        self.items = []
+        self.local = threading.local()
+
+    @contextlib.contextmanager
+    def item(self, id):
+        self.local.profiles = []
+        try:
+            yield
+        finally:
+            profiles = self.local.profiles
+            self.local.profiles = None
+            self.item_done(id, profiles)
+
+    @contextlib.contextmanager
+    def plugin(self, name):
+        profile = cProfile.Profile()
+        start = time.time()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            seconds = time.time() - start
+            if getattr(self.local, 'profiles', None) is not None:
+                self.local.profiles.append((name, seconds, profile))
+            with self.lock:
+                if name in self.stats:
+                    self.stats[name].add(profile)
+                else:
+                    self.stats[name] = pstats.Stats(profile)
+                self.seconds[name] = self.seconds.get(name, 0) + seconds
+
+    def item_done(self, id, profiles):
+        seconds = sum([s for (name, s, profile) in profiles])
+        with self.lock:
+            if (len(self.items) >= self.slowest and
+                    seconds <= self.items[0][0]):
+                return
+        breakdown = [(name, s, self.top_functions(profile))
+                     for (name, s, profile) in profiles]
+        with self.lock:
+            if len(self.items) < self.slowest:
+                heapq.heappush(self.items, (seconds, id, breakdown))
+            elif seconds > self.items[0][0]:
+                heapq.heapreplace(self.items, (seconds, id, breakdown))
+
+    def top_functions(self, profile):
+        stats = pstats.Stats(profile).stats
+        functions = sorted(stats.items(),
+                           key=lambda f: f[1][3], reverse=True)
+        return [(pstats.func_std_string(function), cumulative)
+                for (function, (cc, nc, tt, cumulative, callers))
+                in functions[:self.functions]]
+
+    def close(self):
+        with open(os.path.join(self.directory, 'summary.txt'), 'w') as f:
+            for name in sorted(self.stats.keys()):
+                stats = self.stats[name]
+                stats.dump_stats(os.path.join(self.directory,
+                                              name + '.pstats'))
+                f.write("==== " + name + " %.3f" % self.seconds[name] +
+                        " seconds\n")
+                stats.stream = f
+                stats.sort_stats('cumulative').print_stats(self.top)
+            f.write("==== slowest items\n")
+            for (seconds, id, breakdown) in sorted(self.items,
+                                                   reverse=True):
+                f.write(id + " %.3f" % seconds + " seconds\n")
+                for (name, s, functions) in breakdown:
+                    f.write("  " + name + " %.3f" % s + " seconds\n")
+                    for (function, cumulative) in functions:
+                        f.write("    %.3f " % cumulative + function + "\n")
+        log.info("profile saved in " + self.directory)
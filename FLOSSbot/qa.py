@@ -29,6 +29,13 @@ log = logging.getLogger(__name__)
 
 class QA(plugin.Plugin):
 
+    entities = [
+        'P_archive_URL',
+        'P_described_at_URL',
+        'P_software_quality_assurance',
+        'Q_Continuous_integration',
+    ]
+
     @staticmethod
     def get_parser():
         parser = argparse.ArgumentParser(add_help=False)
@@ -63,8 +70,8 @@ class QA(plugin.Plugin):
         return query
 
     def run(self, item):
-        self.fixup(item)
-        self.verify(item)
+        self.outcome('fixup', self.fixup(item))
+        self.outcome('verify', self.verify(item))
 
     def verify(self, item):
         item.get()
@@ -145,30 +152,33 @@ class QA(plugin.Plugin):
         return result
 
     def get(self, *args, **kwargs):
-        return requests.get(*args, **kwargs)
+        return self.http_request(*args, **kwargs)
 
     def github2travis(self, item, url):
         if not url or 'github.com' not in url:
             return None
-        headers = {'User-Agent': 'FLOSSbot'}
         path = os.path.normpath(urlparse(url).path)[1:]
         if len(path.split("/", -1)) != 2:
             self.debug(item, "SKIP: GET " + url +
                        " path does not have exactly two elements")
             return None
-        r = self.get(url, headers=headers)
-        if r.status_code != requests.codes.ok:
-            self.debug(item, "ERROR: GET " + url + " failed")
-            return None
-        travis = url + "/blob/master/.travis.yml"
-        r = self.get(travis, headers=headers)
-        if r.status_code != requests.codes.ok:
-            self.debug(item, "SKIP: GET " + travis + " not found")
-            return None
-        travis_ci = "https://travis-ci.org/" + path
-        r = self.get(travis_ci, headers=headers)
-        if r.status_code != requests.codes.ok:
-            self.debug(item, "SKIP: GET " + travis_ci + " not found")
+        try:
+            r = self.get(url)
+            if r.status_code != requests.codes.ok:
+                self.debug(item, "ERROR: GET " + url + " failed")
+                return None
+            travis = url + "/blob/master/.travis.yml"
+            r = self.get(travis)
+            if r.status_code != requests.codes.ok:
+                self.debug(item, "SKIP: GET " + travis + " not found")
+                return None
+            travis_ci = "https://travis-ci.org/" + path
+            r = self.get(travis_ci)
+            if r.status_code != requests.codes.ok:
+                self.debug(item, "SKIP: GET " + travis_ci + " not found")
+                return None
+        except requests.RequestException as e:
+            self.debug(item, "ERROR: GET failed with " + str(e))
             return None
         return (travis, travis_ci, url)
 
@@ -190,17 +200,20 @@ class QA(plugin.Plugin):
                       travis + " and " + travis_ci)
             if self.args.dry_run:
                 continue
-            software_quality_assurance = pywikibot.Claim(
-                self.bot.site, self.P_software_quality_assurance, 0)
-            software_quality_assurance.setTarget(self.Q_Continuous_integration)
-            item.addClaim(software_quality_assurance)
-            qualifiers = {
-                self.P_described_at_URL: travis,
-                self.P_archive_URL: travis_ci,
-            }
-            for (qualifier, target) in qualifiers.items():
-                claim = pywikibot.Claim(self.bot.site, qualifier, 0)
-                claim.setTarget(target)
-                software_quality_assurance.addQualifier(claim, bot=True)
-
-            self.set_retrieved(item, software_quality_assurance)
+            with self.transaction(item) as transaction:
+                software_quality_assurance = pywikibot.Claim(
+                    self.bot.site, self.P_software_quality_assurance, 0)
+                software_quality_assurance.setTarget(
+                    self.Q_Continuous_integration)
+                transaction.add_claim(software_quality_assurance)
+                qualifiers = {
+                    self.P_described_at_URL: travis,
+                    self.P_archive_URL: travis_ci,
+                }
+                for (qualifier, target) in qualifiers.items():
+                    claim = pywikibot.Claim(self.bot.site, qualifier, 0)
+                    claim.setTarget(target)
+                    transaction.add_qualifier(software_quality_assurance,
+                                              claim)
+
+                self.set_retrieved(item, software_quality_assurance)
@@ -17,6 +17,7 @@
 import argparse
 import logging
 import re
+import tempfile
 from urllib.parse import urlparse
 
 import pywikibot
@@ -29,6 +30,20 @@ log = logging.getLogger(__name__)
 
 class Repository(plugin.Plugin):
 
+    entities = [
+        'P_protocol',
+        'P_website_username',
+        'Q_Concurrent_Versions_System',
+        'Q_File_Transfer_Protocol',
+        'Q_Fossil',
+        'Q_GNU_Bazaar',
+        'Q_HTTPS',
+        'Q_Hypertext_Transfer_Protocol',
+        'Q_Mercurial',
+        'Q_Subversion',
+        'Q_git',
+    ]
+
     @staticmethod
     def get_parser():
         parser = argparse.ArgumentParser(add_help=False)
@@ -71,8 +86,8 @@ class Repository(plugin.Plugin):
         return query
 
     def run(self, item):
-        self.fixup(item)
-        self.verify(item)
+        self.outcome('fixup', self.fixup(item))
+        self.outcome('verify', self.verify(item))
 
     def verify(self, item):
         item.get()
@@ -138,7 +153,8 @@ class Repository(plugin.Plugin):
                        " URLs with the http protocol")
             return False
         if not self.args.dry_run:
-            http[0].changeRank('preferred')
+            with self.transaction(item) as transaction:
+                transaction.change_rank(http[0], 'preferred')
         self.info(item, "PREFERRED set to " + http[0].getTarget())
         return True
 
@@ -155,54 +171,55 @@ class Repository(plugin.Plugin):
         if self.P_source_code_repository not in item.claims:
             return False
 
-        repositories = self.get_source_code_repositories(item)
-
-        urls = []
-        for claim in repositories:
-            urls.append(claim.getTarget())
-
-        for claim in repositories:
-            url = claim.getTarget()
-            extracted = self.extract_repository(url)
-            if extracted and extracted not in urls:
-                self.debug(item, "ADDING " + extracted +
-                           " as a source repository discovered in " + url)
-                source_code_repository = pywikibot.Claim(
-                    self.bot.site,
-                    self.P_source_code_repository,
-                    0)
-                source_code_repository.setTarget(extracted)
-                if not self.args.dry_run:
-                    item.addClaim(source_code_repository)
-
-                if claim.getRank() == 'normal':
+        with self.transaction(item) as transaction:
+            repositories = self.get_source_code_repositories(item)
+
+            urls = []
+            for claim in repositories:
+                urls.append(claim.getTarget())
+
+            for claim in repositories:
+                url = claim.getTarget()
+                extracted = self.extract_repository(url)
+                if extracted and extracted not in urls:
+                    self.debug(item, "ADDING " + extracted +
+                               " as a source repository discovered in " + url)
+                    source_code_repository = pywikibot.Claim(
+                        self.bot.site,
+                        self.P_source_code_repository,
+                        0)
+                    source_code_repository.setTarget(extracted)
                     if not self.args.dry_run:
-                        claim.changeRank('preferred')
-                    self.info(item, "PREFERRED set to " + url)
-
-        repositories = self.get_source_code_repositories(item)
-
-        for claim in repositories:
-            self.fixup_url(claim)
-
-        for claim in repositories:
-            if self.P_protocol in claim.qualifiers:
-                self.debug(item, "IGNORE " + claim.getTarget() +
-                           " because it already has a protocol")
-                continue
-            target_protocol = self.guess_protocol(claim)
-            if not target_protocol:
-                self.error(item,
-                           claim.getTarget() + " misses a protocol qualifier")
-                continue
-            protocol = pywikibot.Claim(self.bot.site, self.P_protocol, 0)
-            protocol.setTarget(target_protocol)
-            if not self.args.dry_run:
-                claim.addQualifier(protocol, bot=True)
-                self.set_retrieved(item, claim)
-            target_protocol.get()
-            self.info(item, "SET protocol of " + claim.getTarget() + " to " +
-                      target_protocol.labels['en'])
+                        transaction.add_claim(source_code_repository)
+
+                    if claim.getRank() == 'normal':
+                        if not self.args.dry_run:
+                            transaction.change_rank(claim, 'preferred')
+                        self.info(item, "PREFERRED set to " + url)
+
+            repositories = self.get_source_code_repositories(item)
+
+            for claim in repositories:
+                self.fixup_url(claim)
+
+            for claim in repositories:
+                if self.P_protocol in claim.qualifiers:
+                    self.debug(item, "IGNORE " + claim.getTarget() +
+                               " because it already has a protocol")
+                    continue
+                target_protocol = self.guess_protocol(claim)
+                if not target_protocol:
+                    self.error(item, claim.getTarget() +
+                               " misses a protocol qualifier")
+                    continue
+                protocol = pywikibot.Claim(self.bot.site, self.P_protocol, 0)
+                protocol.setTarget(target_protocol)
+                if not self.args.dry_run:
+                    transaction.add_qualifier(claim, protocol)
+                    self.set_retrieved(item, claim)
+                target_protocol.get()
+                self.info(item, "SET protocol of " + claim.getTarget() +
+                          " to " + target_protocol.labels['en'])
 
     def guess_protocol_from_url(self, url):
         if 'github.com' in url:
@@ -242,14 +259,17 @@ class Repository(plugin.Plugin):
     def verify_cvs(self, url, credentials):
         parsed = urlparse(url)
         cvsroot = ':pserver:' + parsed.netloc + ':' + parsed.path
-        return util.sh_bool("""
-        set -e
-        rm -fr /tmp/tmpclone
-        mkdir -p /tmp/tmpclone
-        cd /tmp/tmpclone
-        timeout 30 cvs -d {cvsroot} -z3 get . || true
-        test -d CVSROOT
-        """.format(cvsroot=cvsroot))
+        #
+        # each verification gets its own directory because items
+        # may be verified concurrently (see --jobs)
+        #
+        with tempfile.TemporaryDirectory() as tmpclone:
+            return util.sh_bool("""
+            set -e
+            cd {tmpclone}
+            timeout 30 cvs -d {cvsroot} -z3 get . || true
+            test -d CVSROOT
+            """.format(cvsroot=cvsroot, tmpclone=tmpclone))
 
     def verify_git(self, url):
         return util.sh_bool("timeout 30 git ls-remote " + url + " HEAD")
@@ -278,12 +298,12 @@ class Repository(plugin.Plugin):
         """.format(url=url, user=user, password=password))
 
     def verify_fossil(self, url):
-        return util.sh_bool("""
-        set -e
-        rm -fr /tmp/tmpclone
-        timeout 30 fossil clone {url} /tmp/tmpclone |
-            grep -q -m 1 -e 'Round-trips'
-        """.format(url=url))
+        with tempfile.TemporaryDirectory() as tmpclone:
+            return util.sh_bool("""
+            set -e
+            timeout 30 fossil clone {url} {tmpclone}/clone |
+                grep -q -m 1 -e 'Round-trips'
+            """.format(url=url, tmpclone=tmpclone))
 
     def verify_bzr(self, url):
         #
@@ -376,7 +396,9 @@ class Repository(plugin.Plugin):
 
         if new_url:
             self.info(repository, "REPLACE " + url + " with " + new_url)
-            repository.changeTarget(new_url)
+            if not self.args.dry_run:
+                with self.transaction(repository.on_item) as transaction:
+                    transaction.change_target(repository, new_url)
             return True
         else:
             return False
@@ -404,7 +426,7 @@ class Repository(plugin.Plugin):
         if re.match('https?://sourceforge.net/p/'
                     '.*/(git|code|code-git)/ci/(default|master)/tree/', url):
             try:
-                r = requests.get(url)
+                r = self.http_request(url)
                 if r.status_code != requests.codes.ok:
                     return None
                 u = re.findall('git clone (git://git.code.sf.net/p/.*/'
@@ -415,30 +437,30 @@ class Repository(plugin.Plugin):
                                r.text)
                 if len(u) >= 1:
                     return u[0]
-            except requests.ConnectionError as e:
+            except requests.RequestException:
                 pass
         if re.match('https?://sourceforge.net/p/'
                     '.*?/.*?/ci/(default|master)/tree/', url):
             try:
-                r = requests.get(url)
+                r = self.http_request(url)
                 if r.status_code != requests.codes.ok:
                     return None
                 u = re.findall('hg clone (http://hg.code.sf.net/p/.*?) ',
                                r.text)
                 if len(u) >= 1:
                     return u[0]
-            except requests.ConnectionError as e:
+            except requests.RequestException:
                 pass
         if re.match('https?://sourceforge.net/p/'
                     '.*/(svn|code|code-0)/HEAD/tree/', url):
             try:
-                r = requests.get(url)
+                r = self.http_request(url)
                 if r.status_code != requests.codes.ok:
                     return None
                 u = re.findall('svn checkout (svn://svn.code.sf.net.*/trunk)',
                                r.text)
                 if len(u) == 1:
                     return u[0]
-            except requests.ConnectionError as e:
+            except requests.RequestException:
                 pass
         return None
@@ -0,0 +1,199 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import heapq
+import logging
+import re
+import time
+
+import pywikibot
+from pywikibot import pagegenerators as pg
+from pywikibot.data.sparql import SparqlQuery
+
+from FLOSSbot import metrics
+
+log = logging.getLogger(__name__)
+
+#
+# The QID of ?item, i.e. Q123 for http://www.wikidata.org/entity/Q123.
+# It does not depend on the host (test.wikidata.org or wikidata.org)
+# and is used both to sort and to filter the pages so that they are
+# consistent with each other.
+#
+ITEM_ID = 'STRAFTER(STR(?item), "/entity/")'
+
+#
+# The ?oldest date of an item with a claim that was never verified,
+# so that it comes before all the others.
+#
+NEVER = '1000-01-01T00:00:00Z'
+
+
+def add_filter(query, condition):
+    """Add FILTER(condition) at the end of the WHERE clause of the query,
+    i.e. right before the GROUP BY or ORDER BY that follows it."""
+    m = re.search(r'}\s*(GROUP|ORDER)\s+BY', query)
+    if not m:
+        raise ValueError("no GROUP BY or ORDER BY in " + query)
+    return (query[:m.start()] +
+            "FILTER(" + condition + ") " +
+            query[m.start():])
+
+
+def shard_filter(shard):
+    """Return a condition that is true for the items of the shard, a
+    (index, count) tuple. The items are spread over the shards
+    according to the numerical part of their QID."""
+    (index, count) = shard
+    number = 'xsd:integer(SUBSTR(' + ITEM_ID + ', 2))'
+    return ('(' + number + ' - ' + str(count) + ' * FLOOR(' + number +
+            ' / ' + str(count) + ')) = ' + str(index))
+
+
+def in_shard(id, shard):
+    (index, count) = shard
+    return int(id[1:]) % count == index
+
+
+def paginate(query, after, limit):
+    """Return the page of query containing the limit items that come
+    after the after QID. The query must end with ORDER BY ?item."""
+    if after:
+        query = add_filter(query, ITEM_ID + ' > "' + after + '"')
+    (query, count) = re.subn(r'ORDER\s+BY\s+\?item\s*$',
+                             'ORDER BY ' + ITEM_ID + ' LIMIT ' + str(limit),
+                             query.rstrip())
+    if count != 1:
+        raise ValueError("query must end with ORDER BY ?item " + query)
+    return query
+
+
+def oldest_query(query):
+    """Turn a SELECT DISTINCT ?item query binding the ?retrieved date
+    of the claims into a query that also returns the ?oldest of them
+    for each item, or NEVER if one of them was never verified."""
+    (query, count) = re.subn(
+        r'SELECT\s+DISTINCT\s+\?item\s+WHERE',
+        'SELECT ?item (MIN(COALESCE(?retrieved, "' + NEVER +
+        '"^^xsd:dateTime)) AS ?oldest) WHERE',
+        query)
+    if count != 1:
+        raise ValueError("query must SELECT DISTINCT ?item " + query)
+    (query, count) = re.subn(r'}\s*ORDER\s+BY\s+\?item\s*$',
+                             '} GROUP BY ?item ORDER BY ?item',
+                             query.rstrip())
+    if count != 1:
+        raise ValueError("query must end with ORDER BY ?item " + query)
+    return query
+
+
+def select(site, query):
+    """Return the rows of the query as a list of dicts."""
+    return SparqlQuery(repo=site.data_repository()).select(query)
+
+
+def fetch(site, query, retries, rows=False):
+    for attempt in range(retries + 1):
+        try:
+            with metrics.registry.timer('flossbot_sparql_seconds'):
+                if rows:
+                    return select(site, query)
+                return list(pg.WikidataSPARQLPageGenerator(
+                    query, site=site, result_type=list))
+        except Exception as e:
+            metrics.registry.inc('flossbot_sparql_failures_total')
+            if attempt >= retries:
+                raise
+            delay = min(2 ** attempt, 60)
+            log.warning("query failed with " + str(e) +
+                        ", retry in " + str(delay) + " seconds")
+            time.sleep(delay)
+
+
+def items(site, query, page_size=1000, retries=5, after=None, shard=None):
+    """Iterate over the items returned by the query, one page of
+    page_size items at a time. The next page starts after the last
+    QID of the previous page and a page that fails is retried on its
+    own. When shard is set, only the items of this shard are
+    returned."""
+    if shard:
+        query = add_filter(query, shard_filter(shard))
+    while True:
+        page = paginate(query, after, page_size)
+        page = page + " # " + str(time.time())
+        log.debug('running query ' + page)
+        found = fetch(site, page, retries)
+        for item in found:
+            if shard and not in_shard(item.getID(), shard):
+                continue
+            yield item
+        if len(found) < page_size:
+            break
+        after = found[-1].getID()
+
+
+def oldest(site, query, page_size=1000, retries=5, shard=None):
+    """Iterate over the (oldest, item) pairs of the query, in the
+    same order and with the same pages as items(), where oldest is the
+    oldest ?retrieved date of the claims of the item, as an ISO 8601
+    string. When the query does not bind ?retrieved, oldest is
+    NEVER."""
+    if '?retrieved' not in query:
+        for item in items(site, query, page_size=page_size,
+                          retries=retries, shard=shard):
+            yield (NEVER, item)
+        return
+    query = oldest_query(query)
+    if shard:
+        query = add_filter(query, shard_filter(shard))
+    after = None
+    while True:
+        page = paginate(query, after, page_size)
+        page = page + " # " + str(time.time())
+        log.debug('running query ' + page)
+        found = fetch(site, page, retries, rows=True)
+        for row in found:
+            id = row['item'].split('/entity/')[-1]
+            if shard and not in_shard(id, shard):
+                continue
+            yield (row.get('oldest') or NEVER,
+                   pywikibot.ItemPage(site, id))
+        if len(found) < page_size:
+            break
+        after = found[-1]['item'].split('/entity/')[-1]
+
+
+def tag(key, items):
+    for item in items:
+        yield (item.getID(), key, item)
+
+
+def merge(streams):
+    """Merge the (key, items) streams, each of them sorted by QID as
+    returned by items(), into a single stream of (item, keys) where
+    keys are the keys of all the streams in which the item was found.
+    """
+    current = None
+    for (id, key, item) in heapq.merge(*[tag(key, items)
+                                         for (key, items) in streams]):
+        if current and current[0] == id:
+            current[1].append(key)
+            continue
+        if current:
+            yield (current[2], current[1])
+        current = (id, [key], item)
+    if current:
+        yield (current[2], current[1])
@@ -0,0 +1,164 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import collections
+import logging
+
+from FLOSSbot import metrics
+
+log = logging.getLogger(__name__)
+
+
+class Transaction(object):
+    """The changes made to the claims of an item.
+
+    The changes are applied to the item and its claims right away, as
+    pywikibot would, but nothing is sent to wikidata until commit(),
+    which saves all the claims that were added or modified with a
+    single wbeditentity call. The changes are also described, one by
+    one, in the changes list. What each change overwrites is kept in
+    the undo list so that rollback() can restore it."""
+
+    def __init__(self, item):
+        self.item = item
+        self.claims = []
+        self.changes = []
+        self.undo = []
+
+    def change(self, action, claim, **kwargs):
+        change = {
+            'action': action,
+            'property': claim.getID(),
+            'claim': getattr(claim, 'snak', None),
+        }
+        change.update(kwargs)
+        self.changes.append(change)
+
+    def touch(self, claim):
+        for touched in self.claims:
+            if touched is claim:
+                return
+        self.claims.append(claim)
+
+    @staticmethod
+    def state(claim):
+        return {
+            'target': claim.target,
+            'rank': claim.rank,
+            'qualifiers': [(id, list(qualifiers))
+                           for (id, qualifiers) in claim.qualifiers.items()],
+            'sources': list(claim.sources),
+            'targets': [(source, source.target)
+                        for sources in claim.sources
+                        for claims in sources.values()
+                        for source in claims],
+        }
+
+    @staticmethod
+    def restore(claim, state):
+        claim.target = state['target']
+        claim.rank = state['rank']
+        claim.qualifiers.clear()
+        claim.qualifiers.update(state['qualifiers'])
+        claim.sources[:] = state['sources']
+        for (source, target) in state['targets']:
+            source.target = target
+
+    def remember(self, claim):
+        self.undo.append((claim, self.state(claim)))
+
+    def add_claim(self, claim):
+        self.undo.append((claim, None))
+        claim.on_item = self.item
+        self.item.claims.setdefault(claim.getID(), []).append(claim)
+        self.touch(claim)
+        self.change('add claim', claim, snak=claim.toJSON()['mainsnak'])
+
+    def add_qualifier(self, claim, qualifier):
+        self.remember(claim)
+        qualifier.isQualifier = True
+        qualifier.on_item = self.item
+        claim.qualifiers.setdefault(qualifier.getID(), []).append(qualifier)
+        self.touch(claim)
+        self.change('add qualifier', claim, qualifier=qualifier.toJSON())
+
+    def add_source(self, claim, source):
+        self.remember(claim)
+        source.isReference = True
+        source.on_item = self.item
+        claim.sources.append(collections.OrderedDict([
+            (source.getID(), [source]),
+        ]))
+        self.touch(claim)
+        self.change('add reference', claim, reference=source.toJSON())
+
+    def change_source(self, claim, source, target):
+        self.remember(claim)
+        source.setTarget(target)
+        self.touch(claim)
+        self.change('change reference', claim, reference=source.toJSON())
+
+    def change_rank(self, claim, rank):
+        self.remember(claim)
+        claim.setRank(rank)
+        self.touch(claim)
+        self.change('change rank', claim, rank=rank)
+
+    def change_target(self, claim, target):
+        self.remember(claim)
+        claim.setTarget(target)
+        self.touch(claim)
+        self.change('change target', claim, snak=claim.toJSON()['mainsnak'])
+
+    def savepoint(self):
+        return (len(self.claims), len(self.changes), len(self.undo))
+
+    def rollback(self, savepoint):
+        """Undo the changes made after the savepoint, most recent
+        first: the claims added are removed from the item and the
+        claims modified are restored as they were at the savepoint,
+        including those that were touched before it."""
+        (touched, changes, undo) = savepoint
+        for (claim, state) in reversed(self.undo[undo:]):
+            if state is None:
+                claims = self.item.claims[claim.getID()]
+                claims[:] = [c for c in claims if c is not claim]
+                if not claims:
+                    del self.item.claims[claim.getID()]
+            else:
+                self.restore(claim, state)
+        del self.undo[undo:]
+        del self.claims[touched:]
+        del self.changes[changes:]
+
+    def data(self):
+        return {
+            'claims': [claim.toJSON() for claim in self.claims],
+        }
+
+    def commit(self, **kwargs):
+        if len(self.claims) == 0:
+            return False
+        log.debug("commit " + str(len(self.claims)) + " claims of " +
+                  self.item.getID())
+        metrics.registry.inc('flossbot_api_writes_total',
+                             action='wbeditentity')
+        with metrics.registry.timer('flossbot_api_write_seconds'):
+            self.item.editEntity(self.data(), **kwargs)
+        self.claims = []
+        self.changes = []
+        self.undo = []
+        return True
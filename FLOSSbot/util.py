@@ -16,10 +16,85 @@
 #
 import logging
 import subprocess
+import threading
+import time
+
+import requests
+
+from FLOSSbot import metrics
 
 log = logging.getLogger(__name__)
 
 
+class LogBuffer(object):
+    """Hold the log records of the current thread until flush() so
+    that the lines about an item are not interleaved with the lines
+    of items processed concurrently by other threads."""
+
+    def __init__(self, logger=None):
+        self.local = threading.local()
+        logger = logger or logging.getLogger()
+        for handler in logger.handlers:
+            handler.addFilter(LogBufferFilter(self, handler))
+
+    def start(self):
+        self.local.records = []
+
+    def hold(self, handler, record):
+        records = getattr(self.local, 'records', None)
+        if records is None:
+            return False
+        records.append((handler, record))
+        return True
+
+    def flush(self):
+        records = self.local.records
+        self.local.records = None
+        for (handler, record) in records:
+            handler.handle(record)
+
+
+class LogBufferFilter(logging.Filter):
+
+    def __init__(self, buffer, handler):
+        super(LogBufferFilter, self).__init__()
+        self.buffer = buffer
+        self.handler = handler
+
+    def filter(self, record):
+        return not self.buffer.hold(self.handler, record)
+
+
+class Session(requests.Session):
+    """The HTTP client shared by the plugins. The connections are kept
+    alive, up to pool_size for each host, the responses compressed when
+    the server can and a request fails after timeout seconds unless
+    told otherwise."""
+
+    def __init__(self, pool_size=10, timeout=60):
+        super(Session, self).__init__()
+        self.timeout = timeout
+        adapter = requests.adapters.HTTPAdapter(pool_connections=100,
+                                                pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        #
+        # The user agent is required for some servers. For
+        # instance http://marabunta.laotracara.com/descargas/
+        # returns 406 if no User-Agent header is set.
+        #
+        self.headers['User-Agent'] = 'FLOSSbot'
+        #
+        # br when urllib3 can decode it
+        #
+        self.headers['Accept-Encoding'] = getattr(
+            requests.utils, 'DEFAULT_ACCEPT_ENCODING', 'gzip, deflate')
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super(Session, self).request(method, url, **kwargs)
+
+
 def sh_bool(command):
     try:
         sh(command)
@@ -30,6 +105,7 @@ def sh_bool(command):
 
 def sh(command, input=None):
     log.debug(":sh: " + command)
+    start = time.time()
     if input is None:
         stdin = None
     else:
@@ -50,9 +126,50 @@ def sh(command, input=None):
             line = line.decode('utf-8', 'ignore')
             lines.append(line)
             log.debug(line.strip().encode('ascii', 'ignore'))
-    if proc.wait() != 0:
+    status = proc.wait()
+    metrics.registry.observe('flossbot_subprocess_seconds',
+                             time.time() - start)
+    metrics.registry.inc('flossbot_subprocess_total',
+                         status='ok' if status == 0 else 'fail')
+    if status != 0:
         raise subprocess.CalledProcessError(
             returncode=proc.returncode,
             cmd=command
         )
     return "".join(lines)
+
+
+def wait_for(condition, what, details='', timeout=120, delay=0.5,
+             max_delay=16):
+    """Call condition until it returns something true and return it,
+    for instance while waiting for the wiki to catch up with an edit.
+    Wait delay seconds after the first call, twice as long after the
+    next and so on, up to max_delay seconds. Raise TimeoutError when
+    the condition is still not true after timeout seconds.
+
+    what is the kind of wait, such as label or search, and the label
+    of the metrics: it must be one of a few values. The details, such
+    as the entity waited for, are only logged."""
+    start = time.time()
+    polls = 0
+    while True:
+        polls += 1
+        found = condition()
+        elapsed = time.time() - start
+        if found:
+            status = 'ok'
+            break
+        if elapsed >= timeout:
+            status = 'timeout'
+            break
+        time.sleep(min(delay, max_delay, timeout - elapsed))
+        delay *= 2
+    metrics.registry.inc('flossbot_wait_total', what=what, status=status)
+    metrics.registry.inc('flossbot_wait_polls_total', polls, what=what)
+    metrics.registry.observe('flossbot_wait_seconds', elapsed, what=what)
+    message = (" ".join(filter(None, [what, details])) + " after " +
+               str(polls) + " attempts in " + "%.1f" % elapsed + " seconds")
+    if status == 'timeout':
+        raise TimeoutError("no " + message)
+    log.debug("found " + message)
+    return found
@@ -0,0 +1,77 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import logging
+import queue
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class Writer(object):
+    """Commit transactions from a thread of its own so that the
+    plugins keep verifying items while the writes wait for the
+    put_throttle or the maxlag of the wiki.
+
+    At most size transactions are waiting to be written and put()
+    blocks when the queue is full. The done function is called once
+    the transaction is saved and the failed function if it cannot
+    be."""
+
+    def __init__(self, size):
+        self.queue = queue.Queue(maxsize=size)
+        self.errors = 0
+        self.thread = threading.Thread(target=self.run,
+                                       name='FLOSSbot writer',
+                                       daemon=True)
+        self.thread.start()
+
+    def put(self, transaction, done=None, failed=None):
+        self.queue.put((transaction, done, failed))
+
+    def run(self):
+        while True:
+            (transaction, done, failed) = self.queue.get()
+            try:
+                if transaction is None:
+                    return
+                transaction.commit(bot=True)
+                if done:
+                    done()
+            except Exception:
+                self.errors += 1
+                self.call_failed(failed)
+                log.exception("saving " + transaction.item.getID() +
+                              " failed")
+            finally:
+                self.queue.task_done()
+
+    def call_failed(self, failed):
+        if not failed:
+            return
+        try:
+            failed()
+        except Exception:
+            log.exception("recording the failure failed")
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        self.queue.put((None, None, None))
+        self.thread.join()
+        if self.errors:
+            log.error(str(self.errors) + " items could not be saved")
@@ -0,0 +1,267 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+log = logging.getLogger(__name__)
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+RECORDED = os.path.join(DIRECTORY, 'recorded.json')
+BASELINE = os.path.join(DIRECTORY, 'baseline.json')
+
+#
+# How much worse than the baseline a result can be before it is
+# reported as a regression.
+#
+TOLERANCE = {
+    'items_per_second': 0.8,
+    'api_calls_per_item': 1.0,
+    'peak_rss_kb': 1.2,
+    'startup_seconds': 1.2,
+}
+
+
+def run(plugin, mode, count, record=False, argv=[]):
+    """Run the bot with the plugin on count synthetic items and return
+    its measures. The items are selected with the --filter of the plugin
+    when mode is query and with --item when mode is items."""
+    import pywikibot
+    from benchmarks.fixtures import Fixtures
+    from benchmarks.scenarios import SCENARIOS
+    from FLOSSbot.bot import Bot
+
+    (scenario, filter) = SCENARIOS[plugin]
+    world = scenario(count)
+    fixtures = Fixtures(world, RECORDED, record=record)
+    with tempfile.TemporaryDirectory() as tmp:
+        #
+        # pywikibot keeps the siteinfo, paraminfo and datatypes it
+        # caches in its base_dir: every run starts without them, as
+        # they would otherwise depend on the runs that came before
+        #
+        pywikibot.config.base_dir = tmp
+        #
+        # The changes are recorded with --plan instead of being
+        # saved so that the benchmark does not need to login.
+        #
+        args = ['--plugin', plugin, '--plan', os.path.join(tmp, 'plan'),
+                '--entities-cache', os.path.join(tmp, 'entities')]
+        if mode == 'query':
+            args += ['--filter', filter]
+        else:
+            for id in world.items:
+                args += ['--item', id]
+        with fixtures.installed():
+            bot = Bot.factory(args + argv)
+            start = time.time()
+            bot.run()
+            elapsed = time.time() - start
+        with open(os.path.join(tmp, 'plan')) as f:
+            changed = len(f.readlines())
+    api_calls = sum([n for (kind, n) in fixtures.calls.items()
+                     if kind not in ('sparql', 'http', 'sh')])
+    return {
+        'items': count,
+        'changed': changed,
+        'seconds': elapsed,
+        'items_per_second': count / max(elapsed, 0.001),
+        'api_calls_per_item': api_calls / count,
+        'calls': dict(fixtures.calls),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_isolated(plugin, mode, count, argv):
+    """Run the benchmark in a process of its own so that the peak RSS
+    is the peak RSS of this benchmark only."""
+    output = subprocess.check_output([
+        sys.executable, '-m', 'benchmarks.bench',
+        '--run', plugin + ':' + mode,
+        '--count', str(count),
+        '--',
+    ] + argv)
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def startup(argv=[]):
+    """Return the time it takes to import the bot and build it for a
+    single item with a single plugin, which only makes sense in a
+    process of its own (see startup_isolated)."""
+    start = time.time()
+    from FLOSSbot.bot import Bot
+    imported = time.time()
+    Bot.factory(['--plugin', 'Repository', '--item', 'Q1',
+                 '--dry-run', '--entities-ttl', '0'] + argv)
+    built = time.time()
+    return {
+        'import_seconds': imported - start,
+        'startup_seconds': built - start,
+        'modules': len(sys.modules),
+    }
+
+
+def startup_isolated(argv):
+    output = subprocess.check_output([
+        sys.executable, '-m', 'benchmarks.bench', '--run', 'startup',
+        '--',
+    ] + argv)
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def compare(results, baseline):
+    """Return the list of measures that regressed from the baseline."""
+    regressions = []
+    for (name, result) in sorted(results.items()):
+        if name not in baseline:
+            continue
+        for (measure, tolerance) in sorted(TOLERANCE.items()):
+            if measure not in result or measure not in baseline[name]:
+                continue
+            was = baseline[name][measure]
+            now = result[measure]
+            if measure == 'items_per_second':
+                regressed = now < was * tolerance
+            else:
+                regressed = now > was * tolerance
+            if regressed:
+                regressions.append((name, measure, was, now))
+    return regressions
+
+
+def report(results, baseline):
+    lines = []
+    for (name, result) in sorted(results.items()):
+        if name == 'startup':
+            line = ("%-20s %8.2f seconds %d modules" %
+                    (name, result['startup_seconds'], result['modules']))
+            if name in baseline:
+                line += (" (baseline %.2f seconds)" %
+                         baseline[name]['startup_seconds'])
+            lines.append(line)
+            continue
+        line = ("%-20s %8.2f items/sec %6.2f api calls/item %8d KB" %
+                (name, result['items_per_second'],
+                 result['api_calls_per_item'], result['peak_rss_kb']))
+        if name in baseline:
+            line += (" (baseline %.2f items/sec)" %
+                     baseline[name]['items_per_second'])
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=textwrap.dedent("""\
+        Measure the throughput of the plugins on synthetic items,
+        without network, and the time it takes for the bot to start,
+        and compare them with the baseline.
+        """))
+    parser.add_argument(
+        '--plugin',
+        action='append',
+        default=[],
+        help='only benchmark this plugin (can be repeated)')
+    parser.add_argument(
+        '--mode',
+        action='append',
+        default=[],
+        choices=['query', 'items'],
+        help='only run with --filter (query) or --item (items)')
+    parser.add_argument(
+        '--count',
+        type=int,
+        default=100,
+        help='number of items of each benchmark')
+    parser.add_argument(
+        '--baseline',
+        default=BASELINE,
+        help='compare with the results in this file')
+    parser.add_argument(
+        '--save-baseline',
+        action='store_true',
+        help='save the results as the new baseline')
+    parser.add_argument(
+        '--no-startup',
+        action='store_true',
+        help='do not measure the time it takes for the bot to start')
+    parser.add_argument(
+        '--record',
+        action='store_true',
+        help=('send the API requests that have no recorded response to '
+              'the wiki and record the response'))
+    parser.add_argument(
+        '--run',
+        help=argparse.SUPPRESS)
+    parser.add_argument(
+        'argv',
+        nargs='*',
+        help='additional arguments for FLOSSbot, after --')
+    return parser
+
+
+def main(argv=sys.argv[1:]):
+    from benchmarks.scenarios import SCENARIOS
+
+    args = get_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    if args.run == 'startup':
+        print(json.dumps(startup(args.argv), sort_keys=True))
+        return 0
+    if args.run:
+        (plugin, mode) = args.run.split(':')
+        result = run(plugin, mode, args.count, args.record, args.argv)
+        print(json.dumps(result, sort_keys=True))
+        return 0
+    results = {}
+    if not args.no_startup:
+        results['startup'] = startup_isolated(args.argv)
+    for plugin in args.plugin or sorted(SCENARIOS.keys()):
+        for mode in args.mode or ['query', 'items']:
+            if args.record:
+                result = run(plugin, mode, args.count, True, args.argv)
+            else:
+                result = run_isolated(plugin, mode, args.count, args.argv)
+            results[plugin + ':' + mode] = result
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    else:
+        baseline = {}
+    print(report(results, baseline))
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        return 0
+    regressions = compare(results, baseline)
+    for (name, measure, was, now) in regressions:
+        print("REGRESSION " + name + " " + measure + " was " +
+              str(was) + " is now " + str(now))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,428 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import collections
+import contextlib
+import json
+import logging
+import os
+import re
+import threading
+
+import mock
+import pywikibot
+from pywikibot.data import api, sparql
+
+from FLOSSbot import local, util
+
+log = logging.getLogger(__name__)
+
+#
+# Parameters that do not change the response of the API and are left
+# out of the key of a recorded response.
+#
+VOLATILE = ('maxlag', 'token', 'curtimestamp', 'assert', 'requestid')
+
+
+class World(object):
+    """The synthetic content of wikidata and of the wikis the plugins
+    read from.
+
+    Entities are stored as returned by wbgetentities, pages as
+    wikitext keyed by (family, title) and HTTP resources as a status
+    code keyed by URL. A SPARQL query returns the items of the first
+    (pattern, items) of queries for which the pattern is found in the
+    query or, if there is none, the items the bot works on."""
+
+    def __init__(self):
+        self.items = []
+        self.entities = collections.OrderedDict()
+        self.pages = {}
+        self.http = {}
+        self.http_default = 200
+        self.queries = []
+        self.revid = 1000
+
+    def next_revid(self):
+        self.revid += 1
+        return self.revid
+
+    def add_property(self, id, label, datatype):
+        self.entities[id] = {
+            'type': 'property',
+            'id': id,
+            'title': 'Property:' + id,
+            'ns': 120,
+            'pageid': int(id[1:]),
+            'lastrevid': self.next_revid(),
+            'modified': '2016-01-01T00:00:00Z',
+            'datatype': datatype,
+            'labels': {'en': {'language': 'en', 'value': label}},
+            'descriptions': {},
+            'aliases': {},
+            'claims': {},
+        }
+        return id
+
+    def add_item(self, id, label=None, claims=None, sitelinks=None):
+        labels = {}
+        if label is not None:
+            labels['en'] = {'language': 'en', 'value': label}
+        self.entities[id] = {
+            'type': 'item',
+            'id': id,
+            'title': id,
+            'ns': 0,
+            'pageid': int(id[1:]),
+            'lastrevid': self.next_revid(),
+            'modified': '2016-01-01T00:00:00Z',
+            'labels': labels,
+            'descriptions': {},
+            'aliases': {},
+            'claims': {},
+            'sitelinks': dict([
+                (dbname, {'site': dbname, 'title': title, 'badges': []})
+                for (dbname, title) in (sitelinks or {}).items()
+            ]),
+        }
+        for (property, value, kwargs) in (claims or []):
+            self.add_claim(id, property, value, **kwargs)
+        return id
+
+    def snak(self, property, value):
+        datatype = self.entities[property]['datatype']
+        if datatype == 'wikibase-item':
+            datavalue = {
+                'type': 'wikibase-entityid',
+                'value': {'entity-type': 'item',
+                          'numeric-id': int(value[1:])},
+            }
+        elif datatype == 'time':
+            datavalue = {
+                'type': 'time',
+                'value': {'time': '+' + value + 'T00:00:00Z',
+                          'timezone': 0, 'before': 0, 'after': 0,
+                          'precision': 11,
+                          'calendarmodel':
+                          'http://www.wikidata.org/entity/Q1985727'},
+            }
+        else:
+            datavalue = {'type': 'string', 'value': value}
+        return {
+            'snaktype': 'value',
+            'property': property,
+            'datatype': datatype,
+            'datavalue': datavalue,
+        }
+
+    def add_claim(self, id, property, value, rank='normal',
+                  qualifiers=None, retrieved=None):
+        claims = self.entities[id]['claims'].setdefault(property, [])
+        claim = {
+            'id': id + '$' + property + '-' + str(len(claims)),
+            'type': 'statement',
+            'rank': rank,
+            'mainsnak': self.snak(property, value),
+        }
+        if qualifiers:
+            claim['qualifiers'] = collections.OrderedDict([
+                (p, [dict(self.snak(p, v), hash=claim['id'] + p)])
+                for (p, v) in qualifiers
+            ])
+            claim['qualifiers-order'] = [p for (p, v) in qualifiers]
+        if retrieved:
+            (p, date) = retrieved
+            claim['references'] = [{
+                'hash': id + property + date,
+                'snaks': {p: [self.snak(p, date)]},
+                'snaks-order': [p],
+            }]
+        claims.append(claim)
+
+    def search(self, name, type):
+        found = []
+        for entity in self.entities.values():
+            label = entity['labels'].get('en', {}).get('value')
+            if entity['type'] == type and label == name:
+                found.append({'id': entity['id'], 'label': label})
+        return found
+
+
+class Fixtures(object):
+    """Answer the requests of the bot without a network connection.
+
+    The wikibase, SPARQL, HTTP and shell requests of the plugins are
+    answered from a World and the siteinfo and paraminfo of each wiki
+    as FLOSSbot.local answers them. The other API requests are replayed
+    from responses that were recorded in a JSON file. When record is
+    True, the requests that are not found in the file are sent to the
+    wiki and their responses are added to the file.
+
+    The number of calls is counted in self.calls, by API action and
+    for the sparql, http and sh requests."""
+
+    def __init__(self, world, recorded, record=False):
+        self.world = world
+        self.recorded_path = recorded
+        self.record = record
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+        if os.path.exists(recorded):
+            with open(recorded) as f:
+                self.recorded = json.load(f)
+        else:
+            self.recorded = {}
+        self.submit_orig = api.Request.submit
+
+    @contextlib.contextmanager
+    def installed(self):
+        fixtures = self
+
+        def submit(request):
+            return fixtures.submit(request)
+
+        def query(sparql_query, query, headers=None):
+            return fixtures.sparql(query)
+
+        with mock.patch.object(api.Request, 'submit', submit), \
+                mock.patch.object(sparql.SparqlQuery, 'query', query), \
+                mock.patch.object(util.Session, 'get', self.http_get), \
+                mock.patch.object(util, 'sh', self.sh):
+            try:
+                yield self
+            finally:
+                if self.record:
+                    self.save()
+
+    def count(self, kind):
+        with self.lock:
+            self.calls[kind] += 1
+
+    @staticmethod
+    def params(request):
+        params = {}
+        for (key, value) in request._params.items():
+            if key in VOLATILE:
+                continue
+            if isinstance(value, (list, tuple)):
+                value = "|".join([str(v) for v in value])
+            params[key] = str(value)
+        return params
+
+    @staticmethod
+    def key(request, params):
+        return (request.site.family.name + ":" + request.site.code + " " +
+                json.dumps(params, sort_keys=True))
+
+    def submit(self, request):
+        params = Fixtures.params(request)
+        action = params.get('action')
+        self.count(action)
+        if action == 'wbgetentities':
+            return self.wbgetentities(params)
+        elif action == 'wbsearchentities':
+            return self.wbsearchentities(params)
+        elif action == 'query' and 'titles' in params:
+            return self.pages(request, params)
+        elif action == 'query' and params.get('generator') == 'backlinks':
+            return {'batchcomplete': ''}
+        elif action == 'sitematrix':
+            return self.sitematrix()
+        elif (action == 'paraminfo' or
+              action == 'query' and 'meta' in params):
+            return self.meta(request, params)
+        key = Fixtures.key(request, params)
+        with self.lock:
+            if key in self.recorded:
+                return self.recorded[key]
+        if not self.record:
+            raise KeyError("no recorded response for " + key +
+                           " (see --record)")
+        response = self.submit_orig(request)
+        with self.lock:
+            self.recorded[key] = response
+        return response
+
+    @staticmethod
+    def sitematrix():
+        """The wikipedias of the languages of FLOSSbot.local."""
+        matrix = {'count': len(local.LANGUAGES)}
+        for (i, lang) in enumerate(local.LANGUAGES):
+            matrix[str(i)] = {'code': lang, 'site': [{
+                'url': 'https://' + lang + '.wikipedia.org',
+                'dbname': lang + 'wiki',
+                'code': 'wiki',
+            }]}
+        return {'sitematrix': matrix}
+
+    @staticmethod
+    def repository(site):
+        """The wikibase repository of the site, as it is for the
+        wikimedia wikis."""
+        if site.family.name == 'wikidata':
+            return site
+        elif site.family.name == 'wikipedia':
+            return pywikibot.Site('test' if site.code == 'test'
+                                  else 'wikidata', 'wikidata')
+        return None
+
+    def meta(self, request, params):
+        """The paraminfo, siteinfo, userinfo, tokens and wikibase of
+        the wiki, as the local stand-in answers them, with the paths of
+        the family of the site."""
+        site = request.site
+        response = local.Server(local.Wiki()).handle(
+            site.code, site.hostname(), params)
+        if 'query' not in response:
+            return response
+        general = response['query'].get('general')
+        if general:
+            general.update({
+                'server': site.protocol() + '://' + site.hostname(),
+                'servername': site.hostname(),
+                'base': (site.protocol() + '://' + site.hostname() +
+                         site.family.nicepath(site.code) + 'Main_Page'),
+                'articlepath': site.family.nicepath(site.code) + '$1',
+                'scriptpath': site.scriptpath(),
+                'script': site.scriptpath() + '/index.php',
+            })
+            if site.family.name == 'wikidata':
+                general['wikibase-sparql'] = (
+                    'https://query.wikidata.org/sparql')
+        if 'wikibase' in response['query']:
+            repo = Fixtures.repository(site)
+            if repo is None:
+                del response['query']['wikibase']
+                response['warnings'] = {'query': {
+                    '*': "Unrecognized value for parameter 'meta': wikibase"}}
+                return response
+            response['query']['wikibase']['repo']['url'] = {
+                'base': repo.protocol() + '://' + repo.hostname(),
+                'scriptpath': repo.scriptpath(),
+                'articlepath': repo.family.nicepath(repo.code) + '$1',
+            }
+        return response
+
+    def save(self):
+        with open(self.recorded_path, 'w') as f:
+            json.dump(self.recorded, f, indent=1, sort_keys=True)
+
+    def wbgetentities(self, params):
+        entities = {}
+        for id in params['ids'].split('|'):
+            if id in self.world.entities:
+                entities[id] = self.world.entities[id]
+            else:
+                entities[id] = {'id': id, 'missing': ''}
+        return {'entities': entities, 'success': 1}
+
+    def wbsearchentities(self, params):
+        found = self.world.search(params['search'],
+                                  params.get('type', 'item'))
+        return {
+            'searchinfo': {'search': params['search']},
+            'search': found[int(params.get('continue', 0)):],
+            'success': 1,
+        }
+
+    def pages(self, request, params):
+        if params.get('generator') == 'templates':
+            return self.templates(request, params)
+        pages = {}
+        for (i, title) in enumerate(params['titles'].split('|')):
+            text = self.world.pages.get((request.site.family.name, title))
+            if text is None:
+                pages[str(-1 - i)] = {'ns': 0, 'title': title,
+                                      'missing': ''}
+                continue
+            page = {
+                'pageid': 1 + i,
+                'ns': 0,
+                'title': title,
+                'contentmodel': 'wikitext',
+                'lastrevid': 1,
+                'touched': '2016-01-01T00:00:00Z',
+                'length': len(text),
+            }
+            prop = params.get('prop', '')
+            if 'revisions' in prop:
+                page['revisions'] = [{
+                    'revid': 1,
+                    'parentid': 0,
+                    'user': 'FLOSSbot',
+                    'timestamp': '2016-01-01T00:00:00Z',
+                    'comment': '',
+                    'contentformat': 'text/x-wiki',
+                    'contentmodel': 'wikitext',
+                    '*': text,
+                }]
+            if 'templates' in prop:
+                page['templates'] = [
+                    {'ns': 10, 'title': 'Template:' + name.strip()}
+                    for name in re.findall('{{([^|}]+)', text)
+                ]
+            pages[str(1 + i)] = page
+        return {'batchcomplete': '', 'query': {'pages': pages}}
+
+    def templates(self, request, params):
+        """The templates used by the pages, as generator=templates
+        returns them."""
+        pages = {}
+        for title in params['titles'].split('|'):
+            text = self.world.pages.get((request.site.family.name, title))
+            for name in re.findall(r'{{([^|}]+)', text or ''):
+                title = 'Template:' + name.strip()
+                pages[str(-1 - len(pages))] = {'ns': 10, 'title': title,
+                                               'missing': ''}
+        return {'batchcomplete': '', 'query': {'pages': pages}}
+
+    def sparql(self, query):
+        self.count('sparql')
+        ids = None
+        for (pattern, found) in self.world.queries:
+            if pattern in query:
+                ids = found
+                break
+        if ids is None:
+            ids = self.world.items
+        ids = sorted(ids)
+        m = re.search(r'> "(Q\d+)"', query)
+        if m:
+            ids = [id for id in ids if id > m.group(1)]
+        m = re.search(r'LIMIT (\d+)', query)
+        if m:
+            ids = ids[:int(m.group(1))]
+        return {
+            'head': {'vars': ['item']},
+            'results': {'bindings': [
+                {'item': {'type': 'uri',
+                          'value': 'http://www.wikidata.org/entity/' + id}}
+                for id in ids
+            ]},
+        }
+
+    def http_get(self, url, **kwargs):
+        self.count('http')
+        response = mock.Mock()
+        response.status_code = self.world.http.get(url,
+                                                   self.world.http_default)
+        response.text = ''
+        return response
+
+    def sh(self, command, input=None):
+        self.count('sh')
+        log.debug(":sh: " + command)
+        return ''
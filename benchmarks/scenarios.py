@@ -0,0 +1,156 @@
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from benchmarks.fixtures import World
+
+#
+# The first QID of the items the plugins work on. The QIDs below are
+# those of the properties and items the plugins look up by label.
+#
+FIRST = 2000000
+
+PROPERTIES = (
+    ('P1324', 'source code repository', 'url'),
+    ('P2700', 'protocol', 'wikibase-item'),
+    ('P813', 'retrieved', 'time'),
+    ('P2992', 'software quality assurance', 'wikibase-item'),
+    ('P973', 'described at URL', 'url'),
+    ('P1065', 'archive URL', 'url'),
+    ('P554', 'website username', 'string'),
+    ('P2537', 'Free Software Directory entry', 'external-id'),
+    ('P275', 'license', 'wikibase-item'),
+    ('P31', 'instance of', 'wikibase-item'),
+    ('P279', 'subclass of', 'wikibase-item'),
+    ('P1800', 'Wikimedia database name', 'external-id'),
+    ('P143', 'imported from', 'wikibase-item'),
+)
+
+ITEMS = (
+    ('Q186055', 'git'),
+    ('Q1439431', 'Fossil'),
+    ('Q46794', 'Subversion'),
+    ('Q79719', 'Mercurial'),
+    ('Q812656', 'GNU Bazaar'),
+    ('Q467707', 'Concurrent Versions System'),
+    ('Q8777', 'Hypertext Transfer Protocol'),
+    ('Q44484', 'HTTPS'),
+    ('Q42283', 'File Transfer Protocol'),
+    ('Q965769', 'Continuous integration'),
+    ('Q4167410', 'Wikimedia disambiguation page'),
+    ('Q97044024', 'open source license'),
+    ('Q3943414', 'free software license'),
+    ('Q506883', 'free and open source software'),
+    ('Q341', 'free software'),
+    ('Q1130645', 'open source software'),
+    ('Q19652', 'public domain'),
+    ('Q7397', 'software'),
+)
+
+OLD = '2016-01-01'
+
+
+def world(count):
+    w = World()
+    for (id, label, datatype) in PROPERTIES:
+        w.add_property(id, label, datatype)
+    for (id, label) in ITEMS:
+        w.add_item(id, label)
+    w.items = ['Q' + str(FIRST + i) for i in range(count)]
+    return w
+
+
+def repository(count):
+    """Half of the items have a git URL without protocol, to be fixed,
+    and the other half an URL with a protocol, to be verified."""
+    w = world(count)
+    for (i, id) in enumerate(w.items):
+        if i % 2:
+            claim = ('P1324', 'https://github.com/FLOSSbot/p' + str(i), {
+                'qualifiers': [('P2700', 'Q186055')],
+                'retrieved': ('P813', OLD),
+            })
+        else:
+            claim = ('P1324', 'git://example.org/p' + str(i) + '.git', {})
+        w.add_item(id, 'p' + str(i), claims=[claim])
+    return w
+
+
+def qa(count):
+    """Half of the items have a github repository with continuous
+    integration, to be fixed, and the other half a continuous
+    integration claim, to be verified."""
+    w = world(count)
+    for (i, id) in enumerate(w.items):
+        url = 'https://github.com/FLOSSbot/p' + str(i)
+        claims = [('P1324', url, {})]
+        if i % 2:
+            claims.append(('P2992', 'Q965769', {
+                'qualifiers': [
+                    ('P973', url + '/blob/master/.travis.yml'),
+                    ('P1065', 'https://travis-ci.org/FLOSSbot/p' + str(i)),
+                ],
+                'retrieved': ('P813', OLD),
+            }))
+        w.add_item(id, 'p' + str(i), claims=claims)
+    return w
+
+
+def fsd(count):
+    """Half of the items have a Free Software Directory entry, to be
+    verified, and the other half do not, to be fixed."""
+    w = world(count)
+    for (i, id) in enumerate(w.items):
+        name = 'p' + str(i)
+        claims = []
+        if i % 2:
+            claims.append(('P2537', name, {'retrieved': ('P813', OLD)}))
+        w.add_item(id, name, claims=claims)
+        w.pages[('fsd', name.capitalize())] = (
+            '{{Entry|Name=' + name + '|License=GPLv3}}')
+    return w
+
+
+def license(count):
+    """The items have an english wikipedia page with a license in the
+    infobox."""
+    w = world(count)
+    w.add_item('Q328', 'English Wikipedia',
+               claims=[('P1800', 'enwiki', {})])
+    w.queries.append(("'enwiki'", ['Q328']))
+    licenses = ('GNU General Public License', 'MIT License')
+    license_ids = []
+    for (i, name) in enumerate(licenses):
+        id = 'Q' + str(FIRST - 1 - i)
+        w.add_item(id, name, claims=[('P31', 'Q3943414', {})],
+                   sitelinks={'enwiki': name})
+        license_ids.append(id)
+    w.queries.append(('?item wdt:P31?/wdt:P279*', license_ids))
+    for (i, id) in enumerate(w.items):
+        title = 'P' + str(i)
+        w.add_item(id, 'p' + str(i), claims=[('P31', 'Q341', {})],
+                   sitelinks={'enwiki': title})
+        w.pages[('wikipedia', title)] = (
+            '{{Infobox software|name=' + title +
+            '|license=[[' + licenses[i % 2] + ']]}}')
+    return w
+
+
+SCENARIOS = {
+    'Repository': (repository, 'repository-no-protocol'),
+    'QA': (qa, 'qa-verify'),
+    'FSD': (fsd, 'fsd-verify'),
+    'License': (license, 'no-license'),
+}
@@ -0,0 +1,71 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from benchmarks import bench, scenarios
+from benchmarks.fixtures import Fixtures
+from FLOSSbot import sparql
+
+
+class TestBenchmarks(object):
+
+    def test_sparql(self, tmpdir):
+        world = scenarios.repository(5)
+        fixtures = Fixtures(world, str(tmpdir.join('recorded.json')))
+        query = "SELECT ?item WHERE { ?item wdt:P1 ?url } ORDER BY ?item"
+        page = sparql.paginate(query, 'Q2000001', 2)
+        bindings = fixtures.sparql(page)['results']['bindings']
+        assert (['Q2000002', 'Q2000003'] ==
+                [b['item']['value'].split('/')[-1] for b in bindings])
+        assert 1 == fixtures.calls['sparql']
+
+    def test_scenarios(self):
+        for (scenario, filter) in scenarios.SCENARIOS.values():
+            world = scenario(4)
+            assert 4 == len(world.items)
+            for id in world.items:
+                assert id in world.entities
+
+    def test_compare(self):
+        baseline = {
+            'QA:query': {
+                'items_per_second': 10.0,
+                'api_calls_per_item': 2.0,
+                'peak_rss_kb': 1000,
+            },
+        }
+        results = {
+            'QA:query': {
+                'items_per_second': 9.0,
+                'api_calls_per_item': 3.0,
+                'peak_rss_kb': 1000,
+            },
+            'FSD:query': {
+                'items_per_second': 1.0,
+                'api_calls_per_item': 1.0,
+                'peak_rss_kb': 1000,
+            },
+        }
+        assert ([('QA:query', 'api_calls_per_item', 2.0, 3.0)] ==
+                bench.compare(results, baseline))
+        results['QA:query']['items_per_second'] = 7.0
+        assert 2 == len(bench.compare(results, baseline))
+
+        baseline['startup'] = {'startup_seconds': 1.0}
+        results['startup'] = {'startup_seconds': 1.5, 'modules': 100}
+        assert (('startup', 'startup_seconds', 1.0, 1.5) ==
+                bench.compare(results, baseline)[-1])
+        assert 'startup' in bench.report(results, baseline)
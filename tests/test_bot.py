@@ -15,12 +15,16 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import argparse
+import datetime
 import logging
 
 import mock
-import pytest  # noqa # caplog
+import pytest
+import pywikibot
 
-from FLOSSbot.bot import Bot
+from FLOSSbot import index, sparql
+from FLOSSbot.bot import Bot, hour_minute, next_time
 from tests.wikidata import WikidataHelper
 
 
@@ -29,40 +33,61 @@ class TestBot(object):
     def setup_class(cls):
         WikidataHelper().login()
 
+    def setup_method(self, method):
+        #
+        # the plugins run by the tests are mocked and their entities
+        # are looked up when used, if at all
+        #
+        self.resolve_entities = mock.patch.object(Bot, 'resolve_entities')
+        self.resolve_entities.start()
+
+    def teardown_method(self, method):
+        self.resolve_entities.stop()
+
     def test_factory(self):
-        Bot.factory(['--verbose'])
+        Bot.factory(['--entities-ttl=0', '--verbose'])
         assert (logging.getLogger('FLOSSbot').getEffectiveLevel() ==
                 logging.DEBUG)
 
-        b = Bot.factory([])
+        b = Bot.factory(['--entities-ttl=0'])
         assert (logging.getLogger('FLOSSbot').getEffectiveLevel() ==
                 logging.INFO)
 
         assert len(b.plugins) > 0
 
         plugin = 'QA'
-        b = Bot.factory(['--verbose', '--plugin=' + plugin])
+        b = Bot.factory(['--entities-ttl=0', '--verbose',
+                         '--plugin=' + plugin])
         assert 1 == len(b.plugins)
         assert plugin == b.plugins[0].__class__.__name__
 
         b = Bot.factory([
+            '--entities-ttl=0',
             '--verbose',
             '--plugin=QA',
             '--plugin=Repository',
         ])
         assert 2 == len(b.plugins)
 
+    def test_shard(self):
+        b = Bot.factory(['--entities-ttl=0', '--shard=1/4'])
+        assert (1, 4) == b.args.shard
+        for shard in ('4/4', '1', 'a/b'):
+            with pytest.raises(SystemExit):
+                Bot.factory(['--shard=' + shard])
+
     @mock.patch.object(Bot, 'run_items')
     @mock.patch.object(Bot, 'run_query')
     def test_run(self, m_query, m_items):
-        b = Bot.factory([])
+        b = Bot.factory(['--entities-ttl=0'])
         b.run()
         m_query.assert_called_with()
         m_items.assert_not_called()
+        Bot.resolve_entities.assert_called_with()
 
         m_query.reset_mock()
         m_items.reset_mock()
-        b = Bot.factory(['--verbose', '--item=Q1'])
+        b = Bot.factory(['--entities-ttl=0', '--verbose', '--item=Q1'])
         b.run()
         m_items.assert_called_with()
         m_query.assert_not_called()
@@ -70,6 +95,7 @@ class TestBot(object):
     @mock.patch('FLOSSbot.qa.QA.run')
     def test_run_items(self, m_run):
         b = Bot.factory([
+            '--entities-ttl=0',
             '--verbose',
             '--item=Q1',
             '--plugin=QA',
@@ -77,10 +103,45 @@ class TestBot(object):
         b.run()
         m_run.assert_called_with(mock.ANY)
 
+    @mock.patch('FLOSSbot.qa.QA.run')
+    def test_run_items_jobs(self, m_run, caplog):
+        b = Bot.factory([
+            '--entities-ttl=0',
+            '--verbose',
+            '--jobs=4',
+            '--item=Q1',
+            '--item=Q2',
+            '--item=Q3',
+            '--plugin=QA',
+        ])
+        b.run()
+        assert 3 == m_run.call_count
+        assert any('processed 3 items' in record.message
+                   for record in caplog.records())
+
+    @mock.patch('FLOSSbot.qa.QA.run')
+    def test_run_items_profile(self, m_run, tmpdir):
+        directory = str(tmpdir.join('profile'))
+        b = Bot.factory([
+            '--entities-ttl=0',
+            '--verbose',
+            '--jobs=4',
+            '--profile=' + directory,
+            '--item=Q1',
+            '--item=Q2',
+            '--plugin=QA',
+        ])
+        assert 1 == b.args.jobs
+        b.run()
+        assert 2 == m_run.call_count
+        assert tmpdir.join('profile', 'QA.pstats').check()
+        assert tmpdir.join('profile', 'summary.txt').check()
+
     @mock.patch('FLOSSbot.qa.QA.run')
     @mock.patch('pywikibot.pagegenerators.WikidataSPARQLPageGenerator')
     def test_run_query_default(self, m_query, m_run):
         b = Bot.factory([
+            '--entities-ttl=0',
             '--verbose',
             '--plugin=QA',
         ])
@@ -92,6 +153,7 @@ class TestBot(object):
     @mock.patch('pywikibot.pagegenerators.WikidataSPARQLPageGenerator')
     def test_run_query_items(self, m_query, m_run, caplog):
         b = Bot.factory([
+            '--entities-ttl=0',
             '--verbose',
             '--filter=qa-verify',
             '--plugin=QA',
@@ -102,3 +164,292 @@ class TestBot(object):
         for record in caplog.records():
             if 'running query' in record.message:
                 assert '?qa' in record.message
+
+    @mock.patch('FLOSSbot.qa.QA.run')
+    def test_run_items_preload(self, m_run):
+        b = Bot.factory([
+            '--entities-ttl=0',
+            '--verbose',
+            '--preload=2',
+            '--item=Q1',
+            '--item=Q2',
+            '--item=Q3',
+            '--plugin=QA',
+        ])
+        with mock.patch.object(b.site, 'preloaditempages') as m_preload:
+            m_preload.side_effect = lambda batch, **kwargs: iter(batch)
+            b.run()
+            assert [2, 1] == [len(c[0][0]) for c in m_preload.call_args_list]
+        assert 3 == m_run.call_count
+
+    @mock.patch('FLOSSbot.qa.QA.run')
+    def test_run_items_index(self, m_run, tmpdir):
+        path = str(tmpdir.join('index'))
+        b = Bot.factory([
+            '--entities-ttl=0',
+            '--preload=0',
+            '--index=' + path,
+            '--item=Q1',
+            '--item=Q2',
+            '--item=Q3',
+            '--item=Q4',
+            '--plugin=QA',
+        ])
+        b.index.record('Q1', 5, {'QA': {}})
+        b.index.record('Q2', 5, {'QA': {}})
+        b.index.record('Q4', 5, {'QA': {}}, failed={'QA'})
+
+        def run(item):
+            plugin = b.plugins[0]
+            if item.getID() == 'Q4':
+                plugin.error(item, "VERIFY FAIL")
+                plugin.outcome('verify', 'fail')
+            else:
+                plugin.outcome('verify', 'verified')
+        m_run.side_effect = run
+        with mock.patch.object(b, 'lastrevids') as m_lastrevids, \
+                mock.patch.object(pywikibot.ItemPage, 'latest_revision_id',
+                                  7, create=True):
+            m_lastrevids.return_value = {'Q1': 5, 'Q2': 6, 'Q3': 1, 'Q4': 5}
+            b.run()
+            m_lastrevids.assert_called_once_with(['Q1', 'Q2', 'Q3', 'Q4'])
+        assert (['Q2', 'Q3', 'Q4'] ==
+                [c[0][0].getID() for c in m_run.call_args_list])
+        i = index.Index(path)
+        assert 7 == i.get('Q2')['QA'][0]
+        assert {'verify': ['verified']} == i.get('Q3')['QA'][1]
+        assert i.get('Q3')['QA'][2]
+        assert (7, {'verify': ['fail']}, False) == i.get('Q4')['QA'][:3]
+
+    @mock.patch('FLOSSbot.fsd.FSD.run')
+    @mock.patch('FLOSSbot.qa.QA.run')
+    @mock.patch('pywikibot.pagegenerators.WikidataSPARQLPageGenerator')
+    def test_run_query_filters(self, m_query, m_qa, m_fsd):
+        b = Bot.factory([
+            '--entities-ttl=0',
+            '--verbose',
+            '--preload=0',
+            '--filter=qa-verify',
+            '--filter=fsd-verify',
+            '--plugin=QA',
+            '--plugin=FSD',
+        ])
+
+        def query(query, **kwargs):
+            if '?qa' in query:
+                ids = ['Q1', 'Q2']
+            else:
+                ids = ['Q2', 'Q3']
+            return [pywikibot.ItemPage(b.site, id, 0) for id in ids]
+        m_query.side_effect = query
+        b.run()
+        assert ['Q1', 'Q2'] == [c[0][0].getID() for c in m_qa.call_args_list]
+        assert ['Q2', 'Q3'] == [c[0][0].getID() for c in m_fsd.call_args_list]
+
+    def test_lazy_sites(self):
+        with mock.patch('pywikibot.Site') as m_site:
+            b = Bot.factory(['--entities-ttl=0', '--plugin=FSD'])
+            assert 1 == m_site.call_count
+            assert b.wikidata_site is None
+            assert b.plugins[0].fsd is b.plugins[0].fsd
+            assert 2 == m_site.call_count
+
+            b = Bot.factory(['--entities-ttl=0', '--plugin=QA', '--test'])
+            m_site.reset_mock()
+            assert b.wikidata_site is b.wikidata_site
+            m_site.assert_called_once_with(code="wikidata", fam="wikidata")
+            assert b.get_filter_plugin('fsd-verify') is (
+                b.get_filter_plugin('fsd-verify'))
+
+    def test_next_time(self):
+        assert (9, 5) == hour_minute('9:05')
+        with pytest.raises(argparse.ArgumentTypeError):
+            hour_minute('24:00')
+        now = datetime.datetime(2016, 10, 1, 12, 0)
+        assert (datetime.datetime(2016, 10, 1, 18, 30).timestamp() ==
+                next_time((18, 30), now))
+        assert (datetime.datetime(2016, 10, 2, 6, 0).timestamp() ==
+                next_time((6, 0), now))
+
+    @mock.patch('FLOSSbot.qa.QA.run')
+    def test_run_items_budget(self, m_run):
+        b = Bot.factory([
+            '--entities-ttl=0',
+            '--preload=0',
+            '--max-items=2',
+            '--item=Q1',
+            '--item=Q2',
+            '--item=Q3',
+            '--plugin=QA',
+        ])
+        b.run()
+        assert ['Q1', 'Q2'] == [c[0][0].getID() for c in m_run.call_args_list]
+        assert b.exhausted
+        assert 3 == b.candidates
+
+        #
+        # the items past the budget are neither preloaded nor counted
+        #
+        b = Bot.factory(['--entities-ttl=0', '--preload=10', '--max-items=2'])
+        items = iter([(pywikibot.ItemPage(b.site, 'Q' + str(i), 0), [])
+                      for i in range(1, 6)])
+        preloaded = []
+
+        def preload(items):
+            preloaded.extend(items)
+            return iter(preloaded)
+        with mock.patch.object(b, 'preload', side_effect=preload), \
+                mock.patch.object(b, 'run_item'):
+            assert 2 == b.run_plugins(items)
+        assert ['Q1', 'Q2'] == [item.getID() for (item, _) in preloaded]
+        assert 'Q4' == next(items)[0].getID()
+
+        b = Bot.factory(['--entities-ttl=0', '--deadline=12:00'])
+        b.deadline = 1000
+        with mock.patch('FLOSSbot.bot.time.time') as m_time:
+            items = b.within_budget(iter(['Q1', 'Q2', 'Q3']), 900)
+            m_time.return_value = 940
+            assert 'Q1' == next(items)
+            #
+            # Q1 took 40 seconds, Q2 would not be done before 1000
+            #
+            m_time.return_value = 980
+            assert [] == list(items)
+        assert b.exhausted
+
+    @mock.patch('FLOSSbot.fsd.FSD.run')
+    @mock.patch('FLOSSbot.qa.QA.run')
+    @mock.patch('FLOSSbot.sparql.oldest')
+    def test_run_query_staleness(self, m_oldest, m_qa, m_fsd):
+        b = Bot.factory([
+            '--entities-ttl=0',
+            '--preload=0',
+            '--order=staleness',
+            '--filter=qa-verify',
+            '--filter=fsd-verify',
+            '--plugin=QA',
+            '--plugin=FSD',
+        ])
+
+        def oldest(site, query, **kwargs):
+            if '?qa' in query:
+                found = [('2016-03-01', 'Q1'), ('2016-01-01', 'Q2')]
+            else:
+                found = [('2016-02-01', 'Q2'), ('1000-01-01', 'Q10'),
+                         ('2016-02-01', 'Q3')]
+            return [(date, pywikibot.ItemPage(b.site, id, 0))
+                    for (date, id) in found]
+        m_oldest.side_effect = oldest
+        b.run()
+        assert ['Q2', 'Q1'] == [c[0][0].getID() for c in m_qa.call_args_list]
+        assert ['Q10', 'Q2', 'Q3'] == [c[0][0].getID()
+                                       for c in m_fsd.call_args_list]
+
+        with pytest.raises(SystemExit):
+            Bot.factory(['--order=staleness', '--checkpoint=FILE'])
+
+    def test_transaction(self):
+        b = Bot.factory(['--entities-ttl=0'])
+        item = mock.Mock()
+        item.getID.return_value = 'Q1'
+        with mock.patch.object(Bot, 'commit') as m_commit:
+            with b.transaction(item) as outer:
+                with b.transaction(item) as inner:
+                    assert outer is inner
+                m_commit.assert_not_called()
+            m_commit.assert_called_once_with(outer, None, None)
+
+            m_commit.reset_mock()
+            with pytest.raises(ValueError):
+                with b.transaction(item):
+                    raise ValueError()
+            m_commit.assert_not_called()
+
+    def test_run_item_failure(self):
+        b = Bot.factory(['--entities-ttl=0'])
+        item = mock.Mock()
+        item.getID.return_value = 'Q1'
+        item.claims = {}
+        claims = [mock.Mock(), mock.Mock()]
+        for claim in claims:
+            claim.toJSON.return_value = {'mainsnak': {}}
+
+        def adds(claim):
+            def run_catch(item):
+                with b.transaction(item) as transaction:
+                    transaction.add_claim(claim)
+            return run_catch
+        first = mock.Mock()
+        first.run_catch.side_effect = adds(claims[0])
+        second = mock.Mock()
+
+        def fails(item):
+            adds(claims[1])(item)
+            raise ValueError()
+        second.run_catch.side_effect = fails
+        with mock.patch.object(Bot, 'commit') as m_commit, \
+                mock.patch.object(Bot, 'item_done') as m_item_done:
+            with pytest.raises(ValueError):
+                b.run_item(item, [first, second])
+            (transaction,) = m_commit.call_args[0]
+            assert [claims[0]] == transaction.claims
+            m_item_done.assert_not_called()
+
+    def test_recent_changes(self):
+        b = Bot.factory(['--entities-ttl=0', '--plugin=QA'])
+        b.follow_since = None
+        b.follow_rcid = 10
+        site = mock.Mock()
+        site.user.return_value = 'FLOSSbot'
+        changes = mock.MagicMock()
+        changes.__iter__.return_value = iter([
+            {'rcid': 9, 'title': 'Q1',
+             'timestamp': '2016-10-01T00:00:00Z'},
+            {'rcid': 11, 'title': 'Q2',
+             'timestamp': '2016-10-01T00:00:01Z'},
+            {'rcid': 13, 'title': 'Q4',
+             'timestamp': '2016-10-01T00:00:03Z'},
+            {'rcid': 14, 'title': 'Q2',
+             'timestamp': '2016-10-01T00:00:04Z'},
+        ])
+        site.recentchanges.return_value = changes
+        with mock.patch.object(b, 'site', site):
+            assert ['Q2'] == b.recent_changes(set(['Q1', 'Q2', 'Q3']))
+        site.recentchanges.assert_called_once_with(
+            start=None, reverse=True, namespaces=[0], changetype='edit',
+            excludeuser='FLOSSbot')
+        changes.request.__setitem__.assert_called_once_with(
+            'rcprop', 'title|ids|timestamp')
+        assert 14 == b.follow_rcid
+        assert (pywikibot.Timestamp.fromISOformat('2016-10-01T00:00:04Z') ==
+                b.follow_since)
+
+    @mock.patch('FLOSSbot.bot.time.sleep')
+    def test_follow(self, m_sleep):
+        b = Bot.factory(['--entities-ttl=0', '--plugin=QA', '--follow',
+                         '--filter=qa-verify', '--verification-delay=7'])
+        (due, fresh) = (mock.Mock(), mock.Mock())
+        due.getID.return_value = 'Q2'
+        fresh.getID.return_value = 'Q3'
+        m_sleep.side_effect = [None, KeyboardInterrupt]
+        with mock.patch.object(b, 'site'), \
+                mock.patch.object(b, 'get_oldest_items') as m_oldest, \
+                mock.patch.object(b, 'recent_changes') as m_changes, \
+                mock.patch.object(b, 'run_plugins') as m_run, \
+                mock.patch('pywikibot.ItemPage'):
+            m_oldest.return_value = iter([
+                (sparql.NEVER, due, b.plugins),
+                ('2999-01-01T00:00:00Z', fresh, b.plugins),
+            ])
+            runs = []
+            m_run.side_effect = lambda items: runs.append(list(items))
+            m_changes.side_effect = [[], ['Q3']]
+            with pytest.raises(KeyboardInterrupt):
+                b.run()
+            #
+            # the query runs once and only the due item is verified
+            #
+            m_oldest.assert_called_once_with()
+            assert [(due, b.plugins)] == runs[0]
+            assert set(['Q2', 'Q3']) == m_changes.call_args[0][0]
+            assert 2 == m_run.call_count
@@ -0,0 +1,103 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import subprocess
+
+import mock
+import pytest
+import requests
+
+from FLOSSbot import cassette, util
+from FLOSSbot.local import Server, Wiki
+
+
+class TestCassette(object):
+
+    def test_key(self):
+        request = requests.Request(
+            'POST', 'http://a.org/w/api.php?format=json',
+            data={'action': 'wbeditentity', 'id': 'Q1',
+                  'data': '{}', 'token': '+\\'}).prepare()
+        assert ('POST http://a.org/w/api.php?action=wbeditentity&'
+                'format=json&id=Q1' == cassette.request_key(request))
+        request = requests.Request(
+            'GET', 'http://a.org/sparql',
+            params={'query': 'SELECT ?item # 1475.3'}).prepare()
+        assert ('GET http://a.org/sparql?query=SELECT+%3Fitem' ==
+                cassette.request_key(request))
+        assert ('sh cd /tmp/TMP && cvs' ==
+                cassette.sh_key('cd /tmp/tmpab_1c && cvs'))
+
+    def test_record_replay(self, tmpdir):
+        directory = str(tmpdir.join('cassette'))
+        wiki = Wiki()
+        wiki.entities['Q1'] = {'type': 'item', 'id': 'Q1', 'lastrevid': 1}
+        httpd = Server(wiki).serve(0)
+        url = ('http://127.0.0.1:' + str(httpd.server_address[1]) +
+               '/wikidata/api.php')
+        params = {'action': 'wbgetentities', 'ids': 'Q1'}
+        try:
+            with cassette.Cassette(directory, 'record'):
+                first = requests.get(url, params=params).json()
+                wiki.entities['Q1']['lastrevid'] = 2
+                second = requests.get(url, params=params).json()
+                assert 'ok\n' == util.sh('echo ok')
+                assert util.sh_bool('false') is False
+        finally:
+            httpd.shutdown()
+        assert 1 == first['entities']['Q1']['lastrevid']
+        assert 2 == second['entities']['Q1']['lastrevid']
+
+        with cassette.Cassette(directory, 'replay'):
+            assert first == requests.get(url, params=params).json()
+            assert second == requests.get(url, params=params).json()
+            assert second == requests.get(url, params=params).json()
+            assert 'ok\n' == util.sh('echo ok')
+            with pytest.raises(subprocess.CalledProcessError):
+                util.sh('false')
+            with pytest.raises(requests.ConnectionError):
+                requests.get(url, params={'action': 'other'})
+        assert util.sh('echo ok') == 'ok\n'
+
+    def test_credentials(self, tmpdir):
+        directory = str(tmpdir.join('cassette'))
+        server = Server(Wiki())
+        respond = server.respond
+
+        def login(path, host, params):
+            (status, headers, body) = respond(path, host, params)
+            return (status, {'Set-Cookie': 'session=SESSIONSECRET'}, body)
+        httpd = server.serve(0)
+        url = ('http://127.0.0.1:' + str(httpd.server_address[1]) +
+               '/wikidata/api.php')
+        try:
+            with mock.patch.object(server, 'respond', side_effect=login), \
+                    cassette.Cassette(directory, 'record'):
+                r = requests.post(url, data={
+                    'action': 'login', 'lgname': 'FLOSSbotCI',
+                    'lgpassword': 'PASSWORDSECRET', 'lgtoken': '+\\',
+                    'format': 'json'})
+                assert 'Success' == r.json()['login']['result']
+                assert 'session=SESSIONSECRET' == r.headers['Set-Cookie']
+        finally:
+            httpd.shutdown()
+        with open(str(tmpdir.join('cassette', 'cassette.jsonl'))) as f:
+            recorded = f.read()
+        assert 'action=login' in recorded
+        assert 'PASSWORDSECRET' not in recorded
+        assert 'FLOSSbotCI' not in recorded
+        assert 'SESSIONSECRET' not in recorded
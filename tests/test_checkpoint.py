@@ -0,0 +1,107 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+
+import pytest
+
+from FLOSSbot.checkpoint import Checkpoint
+
+
+class TestCheckpoint(object):
+
+    def test_done_in_order(self, tmpdir):
+        path = str(tmpdir.join('checkpoint'))
+        c = Checkpoint(path, 'qa-verify', interval=2)
+        for id in ('Q1', 'Q2', 'Q3'):
+            c.start(id)
+        c.done('Q2')
+        assert c.last is None
+        c.done('Q1')
+        assert 'Q2' == c.last
+        c.plugin('QA', 'Q1', 'done')
+        c.plugin('QA', 'Q2', 'failed')
+        state = json.load(open(path))
+        assert 'Q2' == state['last']
+        assert 2 == state['count']
+
+        c.save()
+        c = Checkpoint(path, 'qa-verify')
+        assert 'Q2' == c.last
+        assert 2 == c.count
+        assert {'done': 1, 'failed': 1, 'last': 'Q2'} == c.plugins['QA']
+
+    def test_done_unknown(self, tmpdir):
+        path = str(tmpdir.join('checkpoint'))
+        c = Checkpoint(path, 'qa-verify')
+        c.done('Q1')
+        assert c.last is None
+        assert 0 == c.count
+        c.start('Q1')
+        c.start('Q2')
+        c.done('Q1')
+        c.done('Q1')
+        c.done('Q3')
+        assert 'Q1' == c.last
+        assert 1 == c.count
+        c.done('Q2')
+        assert 'Q2' == c.last
+        assert 2 == c.count
+
+    def test_load(self, tmpdir):
+        path = str(tmpdir.join('checkpoint'))
+        c = Checkpoint(path, 'qa-verify')
+        c.start('Q1')
+        c.done('Q1')
+        c.save()
+        with pytest.raises(ValueError) as e:
+            Checkpoint(path, 'fsd-verify')
+        assert 'not' in str(e.value)
+
+        c.save(complete=True)
+        c = Checkpoint(path, 'qa-verify')
+        assert c.last is None
+
+    def test_fail(self, tmpdir):
+        path = str(tmpdir.join('checkpoint'))
+        c = Checkpoint(path, 'qa-verify')
+        for id in ('Q1', 'Q2', 'Q3'):
+            c.start(id)
+        c.fail('Q1', ['QA'])
+        c.done('Q2')
+        assert 'Q2' == c.last
+        c.save()
+
+        c = Checkpoint(path, 'qa-verify')
+        assert {'Q1': ['QA']} == c.failed
+        assert [('Q1', ['QA'])] == c.retry()
+        c.start('Q1')
+        c.start('Q3')
+        c.done('Q1')
+        assert 'Q2' == c.last
+        assert {} == c.failed
+        c.done('Q3')
+        assert 'Q3' == c.last
+
+        assert [] == c.retry()
+        c.start('Q4')
+        c.fail('Q4', ['QA'])
+        assert [('Q4', ['QA'])] == c.retry()
+        c.start('Q4')
+        c.fail('Q4', ['QA'])
+        assert {'Q4': ['QA']} == c.failed
+        assert 'Q4' == c.last
@@ -0,0 +1,86 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import mock
+
+from FLOSSbot.bot import Bot
+from FLOSSbot.entities import Entities
+from FLOSSbot.plugin import Plugin
+
+
+class TestEntities(object):
+
+    def test_get(self, tmpdir):
+        path = str(tmpdir.join('entities'))
+        site = mock.Mock()
+        site.family.name = 'wikidata'
+        site.code = 'test'
+        e = Entities(path, 100)
+        assert e.get(site, 'item', 'git') is None
+        e.set(site, 'item', 'git', 'Q1', now=1000)
+        e.set(site, 'property', 'license', 'P2', now=1000)
+        assert 'Q1' == e.get(site, 'item', 'git', now=1050)
+        assert e.get(site, 'item', 'git', now=1100) is None
+        assert e.get(site, 'property', 'git', now=1050) is None
+
+        #
+        # shared with another bot
+        #
+        other = Entities(path, 100)
+        assert 'P2' == other.get(site, 'property', 'license', now=1050)
+        other.forget(site, 'P2')
+        assert e.get(site, 'property', 'license', now=1050) is None
+        assert 'Q1' == e.get(site, 'item', 'git', now=1050)
+        other.forget(site, 'Q3', ['git'])
+        assert e.get(site, 'item', 'git', now=1050) is None
+
+        site.code = 'wikidata'
+        assert e.get(site, 'item', 'git', now=1050) is None
+
+    @mock.patch('pywikibot.Site')
+    @mock.patch('pywikibot.ItemPage')
+    @mock.patch('FLOSSbot.plugin.Plugin.search_entity')
+    def test_lookup_entity(self, m_search, m_item, m_site, tmpdir):
+        m_site.return_value.family.name = 'wikidata'
+        m_site.return_value.code = 'wikidata'
+        path = str(tmpdir.join('entities'))
+        found = {'property': {'id': 'P10'}, 'item': mock.Mock()}
+        found['item'].getID.return_value = 'Q10'
+        m_search.side_effect = lambda site, name, type: found[type]
+        count = len(Plugin.entity_names())
+        bot = Bot.factory(['--entities-cache=' + path])
+        plugin = Plugin(bot, bot.args)
+        plugin.resolve_entities()
+        assert 'P10' == plugin.P_source_code_repository
+        assert count == m_search.call_count
+
+        bot = Bot.factory(['--entities-cache=' + path])
+        plugin = Plugin(bot, bot.args)
+        plugin.resolve_entities()
+        assert 'P10' == plugin.P_source_code_repository
+        assert count == m_search.call_count
+        m_item.assert_any_call(bot.site, 'Q10', 0)
+
+        found['property'] = {'id': 'P11'}
+        bot = Bot.factory(['--entities-cache=' + path, '--refresh-entities'])
+        plugin = Plugin(bot, bot.args)
+        plugin.resolve_entities()
+        assert 'P11' == plugin.P_source_code_repository
+        assert 2 * count == m_search.call_count
+
+        bot = Bot.factory(['--entities-ttl=0'])
+        assert bot.entity_cache is None
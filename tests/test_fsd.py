@@ -37,20 +37,20 @@ class TestFSD(object):
             '--verbose',
             '--test',
             '--user=FLOSSbotCI',
-        ])
+        ] + WikidataHelper.argv())
         fsd = FSD(bot, bot.args)
 
-        to_fixup = fsd.__getattribute__('Q_' + WikidataHelper.random_name())
+        to_fixup = getattr(fsd, 'Q_' + WikidataHelper.random_name())
         assert 'not found' == fsd.fixup(to_fixup)
         fsd.clear_entity_label(to_fixup.getID())
         to_fixup = pywikibot.ItemPage(fsd.bot.site, to_fixup.getID(), 0)
         assert 'no label' == fsd.fixup(to_fixup)
 
         label = 'Loomio'
-        item = fsd.__getattribute__('Q_' + label)
+        item = getattr(fsd, 'Q_' + label)
         # get rid of leftovers in case the item already exists
         fsd.clear_entity_label(item.getID())
-        item = fsd.__getattribute__('Q_' + label)
+        item = getattr(fsd, 'Q_' + label)
 
         to_fixup = pywikibot.ItemPage(fsd.bot.site, item.getID(), 0)
         assert 'found' == fsd.fixup(to_fixup)
@@ -66,13 +66,13 @@ class TestFSD(object):
             '--test',
             '--user=FLOSSbotCI',
             '--verification-delay=0',
-        ])
+        ] + WikidataHelper.argv())
         fsd = FSD(bot, bot.args)
         label = 'Loomio'
-        item = fsd.__getattribute__('Q_' + label)
+        item = getattr(fsd, 'Q_' + label)
         # get rid of leftovers in case the item already exists
         fsd.clear_entity_label(item.getID())
-        item = fsd.__getattribute__('Q_' + label)
+        item = getattr(fsd, 'Q_' + label)
 
         log.debug(">> do nothing if there is no Free Software Directory entry")
         to_verify = pywikibot.ItemPage(fsd.bot.site, item.getID(), 0)
@@ -102,7 +102,7 @@ class TestFSD(object):
             '--verbose',
             '--test',
             '--user=FLOSSbotCI',
-        ])
+        ] + WikidataHelper.argv())
         fsd = FSD(bot, bot.args)
 
         class Page:
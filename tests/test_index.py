@@ -0,0 +1,54 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from FLOSSbot.index import Index
+
+
+class TestIndex(object):
+
+    def test_fresh(self, tmpdir):
+        path = str(tmpdir.join('index'))
+        i = Index(path)
+        assert not i.fresh('Q1', 10, ['QA'], 100)
+        i.record('Q1', 10, {
+            'QA': {'verify': ['verified']},
+            'FSD': {},
+        }, now=1000)
+        assert i.fresh('Q1', 10, ['QA', 'FSD'], 100, now=1050)
+        assert not i.fresh('Q1', 11, ['QA'], 100, now=1050)
+        assert not i.fresh('Q1', 10, ['QA'], 100, now=1100)
+        assert not i.fresh('Q1', 10, ['QA', 'License'], 100, now=1050)
+        i.close()
+
+        i = Index(path)
+        assert ((10, {'verify': ['verified']}, True, 1000) ==
+                i.get('Q1')['QA'])
+        i.record('Q1', 12, {'QA': {}}, now=2000)
+        assert (12, {}, True, 2000) == i.get('Q1')['QA']
+        assert (10, {}, True, 1000) == i.get('Q1')['FSD']
+
+    def test_fresh_failed(self, tmpdir):
+        i = Index(str(tmpdir.join('index')))
+        i.record('Q1', 10, {
+            'QA': {'verify': ['fail']},
+            'FSD': {},
+        }, failed={'QA'}, now=1000)
+        assert not i.get('Q1')['QA'][2]
+        assert not i.fresh('Q1', 10, ['QA'], 100, now=1050)
+        assert i.fresh('Q1', 10, ['FSD'], 100, now=1050)
+        i.record('Q1', 10, {'QA': {}}, now=1060)
+        assert i.fresh('Q1', 10, ['QA'], 100, now=1070)
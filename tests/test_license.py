@@ -15,7 +15,9 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import concurrent.futures
 import logging
+import time
 
 import mock
 import pywikibot
@@ -41,7 +43,7 @@ class TestLicense(object):
         ]
 
     def test_get_item(self):
-        bot = Bot.factory(['--verbose'] + self.args)
+        bot = Bot.factory(['--entities-ttl=0', '--verbose'] + self.args)
         license = License(bot, bot.args)
         redirect = 'GPL'
         license.get_names('en')
@@ -53,7 +55,7 @@ class TestLicense(object):
         assert canonical_item == license.get_item(gpl_fr, 'fr')
 
     def test_get_names(self):
-        bot = Bot.factory(['--verbose'] + self.args)
+        bot = Bot.factory(['--entities-ttl=0', '--verbose'] + self.args)
         license = License(bot, bot.args)
         redirect = 'GPL'
         names = license.get_names('en')
@@ -66,7 +68,7 @@ class TestLicense(object):
         assert self.gpl in names
 
     def test_template_parse_license(self):
-        bot = Bot.factory(['--verbose'] + self.args)
+        bot = Bot.factory(['--entities-ttl=0', '--verbose'] + self.args)
         license = License(bot, bot.args)
         found = license.template_parse_license(
             '[[GNU GPL#v2]] [[MIT/X11 license|]]', 'en')
@@ -76,6 +78,22 @@ class TestLicense(object):
             license.debug(item, "FOUND")
             assert item.labels['en'] in (self.gpl, self.mit)
 
+    @mock.patch('FLOSSbot.plugin.Plugin.get_redirects')
+    @mock.patch('FLOSSbot.license.License.set_license2item')
+    def test_get_names_threads(self, m_set_license2item, m_get_redirects):
+        bot = Bot.factory(['--entities-ttl=0', '--verbose', '--jobs=4'])
+        l = License(bot, bot.args)
+
+        def set_license2item():
+            time.sleep(0.1)
+            l.license2item = {'GPL v3': 'Q1'}
+        m_set_license2item.side_effect = set_license2item
+        m_get_redirects.return_value = ['GPL']
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            found = list(executor.map(lambda i: l.get_names('en'), range(4)))
+        assert 1 == m_set_license2item.call_count
+        assert 4 * [['GPL v3', 'GPL v3', 'GPL']] == found
+
     @mock.patch('FLOSSbot.license.License.set_license2item')
     @mock.patch('FLOSSbot.plugin.Plugin.get_sitelink_item')
     def test_fixup(self, m_get_sitelink_item, m_set_license2item):
@@ -83,7 +101,7 @@ class TestLicense(object):
             '--verbose',
             '--test',
             '--user=FLOSSbotCI',
-        ])
+        ] + WikidataHelper.argv())
         l = License(bot, bot.args)
 
         gpl = l.Q_GNU_General_Public_License
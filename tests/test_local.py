@@ -0,0 +1,199 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import urllib.parse
+import urllib.request
+
+from FLOSSbot import sparql
+from FLOSSbot.local import Server, Sparql, Wiki
+
+
+class TestLocal(object):
+
+    def fixtures(self, tmpdir):
+        path = str(tmpdir.join('fixtures.json'))
+        with open(path, 'w') as f:
+            json.dump({
+                'entities': {
+                    'P1': {'type': 'property', 'id': 'P1',
+                           'datatype': 'url', 'lastrevid': 10,
+                           'labels': {'en': {'language': 'en',
+                                             'value': 'source code'}}},
+                    'Q1': {'type': 'item', 'id': 'Q1', 'lastrevid': 11,
+                           'labels': {'en': {'language': 'en',
+                                             'value': 'FLOSSbot'}},
+                           'claims': {}},
+                },
+                'pages': {
+                    'en': {'FLOSSbot': {
+                        'text': '{{Infobox software|license=[[GPL]]}}',
+                        'langlinks': {'fr': 'FLOSSbot (logiciel)'},
+                        'backlinks': ['FLOSS bot'],
+                    }},
+                },
+            }, f)
+        return path
+
+    def api(self, httpd, code, **params):
+        url = ('http://127.0.0.1:' + str(httpd.server_address[1]) +
+               '/' + code + '/api.php')
+        data = urllib.parse.urlencode(params).encode('utf-8')
+        return json.loads(urllib.request.urlopen(url, data).read().decode(
+            'utf-8'))
+
+    def test_wikibase(self, tmpdir):
+        server = Server(Wiki(self.fixtures(tmpdir)))
+        httpd = server.serve(0)
+        try:
+            r = self.api(httpd, 'wikidata', action='wbsearchentities',
+                         search='source', type='property', language='en')
+            assert ['P1'] == [found['id'] for found in r['search']]
+
+            r = self.api(httpd, 'wikidata', action='wbgetentities',
+                         ids='Q1|Q2')
+            assert 'FLOSSbot' == r['entities']['Q1']['labels']['en']['value']
+            assert 'missing' in r['entities']['Q2']
+
+            claim = {'mainsnak': {'snaktype': 'value', 'property': 'P1',
+                                  'datavalue': {'type': 'string',
+                                                'value': 'http://a.org'}}}
+            r = self.api(httpd, 'wikidata', action='wbeditentity', id='Q1',
+                         baserevid='11',
+                         data=json.dumps({'claims': [claim]}))
+            assert 1 == len(r['entity']['claims']['P1'])
+            guid = r['entity']['claims']['P1'][0]['id']
+            r = self.api(httpd, 'wikidata', action='wbeditentity', id='Q1',
+                         baserevid='11', data=json.dumps({}))
+            assert 'editconflict' == r['error']['code']
+
+            r = self.api(httpd, 'wikidata', action='wbsetqualifier',
+                         claim=guid, property='P1', snaktype='value',
+                         value=json.dumps('http://b.org'))
+            assert 'P1' in r['claim']['qualifiers']
+            r = self.api(httpd, 'wikidata', action='wbsetreference',
+                         statement=guid, snaks=json.dumps({'P1': []}))
+            assert 'hash' in r['reference']
+            r = self.api(httpd, 'wikidata', action='wbcreateclaim',
+                         entity='Q1', property='P1', snaktype='value',
+                         value=json.dumps('http://c.org'))
+            assert r['claim']['id'].startswith('Q1$')
+            assert 2 == len(server.wiki.entities['Q1']['claims']['P1'])
+            r = self.api(httpd, 'wikidata', action='wbsetclaimvalue',
+                         claim=r['claim']['id'], snaktype='value',
+                         value=json.dumps('http://d.org'))
+            assert ('http://d.org' ==
+                    r['claim']['mainsnak']['datavalue']['value'])
+            claim = server.wiki.entities['Q1']['claims']['P1'][0]
+            self.api(httpd, 'wikidata', action='wbremovequalifiers',
+                     claim=guid,
+                     qualifiers=claim['qualifiers']['P1'][0]['hash'])
+            assert {} == claim['qualifiers']
+            r = self.api(httpd, 'wikidata', action='wbremoveclaims',
+                         claim=guid)
+            assert [guid] == r['claims']
+            assert 1 == len(server.wiki.entities['Q1']['claims']['P1'])
+        finally:
+            httpd.shutdown()
+
+    def test_pages(self, tmpdir):
+        server = Server(Wiki(self.fixtures(tmpdir)))
+        httpd = server.serve(0)
+        try:
+            r = self.api(httpd, 'en', action='parse', page='FLOSSbot',
+                         prop='templates|langlinks')
+            assert ([{'ns': 10, 'exists': '',
+                      '*': 'Template:Infobox software'}] ==
+                    r['parse']['templates'])
+            assert 'fr' == r['parse']['langlinks'][0]['lang']
+            r = self.api(httpd, 'en', action='query', titles='FLOSSbot',
+                         prop='revisions|templates')
+            page = r['query']['pages']['1']
+            assert '[[GPL]]' in page['revisions'][0]['*']
+            r = self.api(httpd, 'en', action='query', titles='FLOSSbot',
+                         generator='templates')
+            assert (['Template:Infobox software'] ==
+                    [p['title'] for p in r['query']['pages'].values()])
+            r = self.api(httpd, 'en', action='query', list='backlinks',
+                         bltitle='FLOSSbot')
+            assert 'FLOSS bot' == r['query']['backlinks'][0]['title']
+            r = self.api(httpd, 'wikidata', action='query',
+                         meta='siteinfo|userinfo',
+                         siprop='general|namespaces|languages')
+            assert ('wikibase-property' ==
+                    r['query']['namespaces']['120']['defaultcontentmodel'])
+            assert 'en' in [lang['code'] for lang in r['query']['languages']]
+            assert 'FLOSSbot' == r['query']['userinfo']['name']
+        finally:
+            httpd.shutdown()
+
+    def test_inject(self):
+        server = Server(Wiki(), maxlag=1)
+        (status, headers, r) = server.respond('/wikidata/api.php',
+                                              'localhost', {})
+        assert 'maxlag' == r['error']['code']
+        assert 'Retry-After' in headers
+        server = Server(Wiki(), errors=1)
+        (status, headers, r) = server.respond('/wikidata/api.php',
+                                              'localhost', {})
+        assert r['error']['code'].startswith('internal_api_error')
+
+    def test_sparql(self, tmpdir):
+        wiki = Wiki(self.fixtures(tmpdir))
+        server = Server(wiki, sparql=Sparql(wiki))
+        for (i, retrieved) in enumerate(('2016-01-01', None,
+                                         '2016-01-01', '2100-01-01')):
+            id = 'Q' + str(10 + i)
+            claim = {
+                'id': id + '$' + str(i),
+                'rank': 'normal',
+                'mainsnak': wiki.snak('P1', 'value', 'http://a.org/' + id),
+            }
+            if retrieved:
+                claim['references'] = [{
+                    'hash': 'h' + str(i),
+                    'snaks': {'P2': [wiki.snak('P2', 'value', {
+                        'time': '+' + retrieved + 'T00:00:00Z'})]},
+                }]
+            wiki.entities[id] = {'type': 'item', 'id': id,
+                                 'claims': {'P1': [claim]}}
+        query = """
+        SELECT DISTINCT ?item WHERE {
+          ?item p:P1 ?repo .
+          OPTIONAL {
+             ?repo prov:wasDerivedFrom/
+                   <http://www.wikidata.org/prop/reference/P2> ?retrieved
+          }
+          FILTER (!BOUND(?retrieved) ||
+                  ?retrieved < (now() - "P30D"^^xsd:duration))
+        } ORDER BY ?item
+        """
+
+        def ids(query):
+            (status, headers, r) = server.respond('/sparql', 'localhost',
+                                                  {'query': query})
+            assert 200 == status
+            return [b['item']['value'].split('/')[-1]
+                    for b in r['results']['bindings']]
+
+        assert ['Q10', 'Q11', 'Q12'] == ids(sparql.paginate(query,
+                                                            None, 10))
+        assert ['Q11'] == ids(sparql.paginate(query, 'Q10', 1))
+        assert ['Q10', 'Q11'] == ids(
+            "SELECT ?item WHERE { ?item wdt:P1 ?url } "
+            "ORDER BY ?item LIMIT 2")
+        assert 3 == server.calls['sparql']
@@ -0,0 +1,69 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import urllib.request
+
+from FLOSSbot.metrics import Metrics
+
+
+class TestMetrics(object):
+
+    def test_inc(self):
+        m = Metrics()
+        m.inc('items_total', plugin='QA')
+        m.inc('items_total', 2, plugin='QA')
+        m.inc('items_total', plugin='FSD')
+        text = m.render()
+        assert "# TYPE items_total counter\n" in text
+        assert 'items_total{plugin="QA"} 3\n' in text
+        assert 'items_total{plugin="FSD"} 1\n' in text
+
+    def test_observe(self):
+        m = Metrics()
+        m.observe('seconds', 0.2, plugin='QA')
+        m.observe('seconds', 200, plugin='QA')
+        with m.timer('seconds', plugin='QA'):
+            pass
+        text = m.render()
+        assert "# TYPE seconds histogram\n" in text
+        assert 'seconds_bucket{plugin="QA",le="0.01"} 1\n' in text
+        assert 'seconds_bucket{plugin="QA",le="0.5"} 2\n' in text
+        assert 'seconds_bucket{plugin="QA",le="120"} 2\n' in text
+        assert 'seconds_bucket{plugin="QA",le="+Inf"} 3\n' in text
+        assert 'seconds_count{plugin="QA"} 3\n' in text
+
+    def test_format(self):
+        assert Metrics.format('n', (('a', 'x"y'),), 1) == 'n{a="x\\"y"} 1\n'
+        assert Metrics.format('n', (), 1) == "n 1\n"
+
+    def test_write(self, tmpdir):
+        m = Metrics()
+        m.inc('items_total')
+        path = str(tmpdir.join('metrics.prom'))
+        m.write(path)
+        assert open(path).read() == m.render()
+
+    def test_serve(self):
+        m = Metrics()
+        m.inc('items_total')
+        server = m.serve(0)
+        try:
+            url = 'http://127.0.0.1:' + str(server.server_address[1])
+            body = urllib.request.urlopen(url + '/metrics').read()
+            assert body.decode('utf-8') == m.render()
+        finally:
+            server.shutdown()
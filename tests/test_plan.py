@@ -0,0 +1,58 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+
+import mock
+
+from FLOSSbot import plan
+
+
+class TestPlan(object):
+
+    def transaction(self, id, claims):
+        transaction = mock.Mock()
+        transaction.item.getID.return_value = id
+        transaction.item.latest_revision_id = 10
+        transaction.claims = claims
+        transaction.changes = [{'action': 'add claim'}] * len(claims)
+        transaction.data.return_value = {'claims': claims}
+        return transaction
+
+    def test_plan_apply(self, tmpdir):
+        path = str(tmpdir.join('plan.jsonl'))
+        p = plan.Plan(path)
+        assert p.write(self.transaction('Q1', [{'id': 'c1'}])) is True
+        assert p.write(self.transaction('Q2', [])) is False
+        assert p.write(self.transaction('Q3', [{}, {}])) is True
+        p.close()
+
+        lines = [json.loads(line) for line in open(path)]
+        assert ['Q1', 'Q3'] == [line['item'] for line in lines]
+        assert 10 == lines[0]['baserevid']
+        assert {'claims': [{'id': 'c1'}]} == lines[0]['data']
+
+        site = mock.Mock()
+        assert (2, 0) == plan.apply(site, path, dry_run=True)
+        site.editEntity.assert_not_called()
+
+        site.editEntity.side_effect = [None, Exception('editconflict')]
+        assert (1, 1) == plan.apply(site, path)
+        site.editEntity.assert_any_call({'id': 'Q1'},
+                                        {'claims': [{'id': 'c1'}]},
+                                        baserevid=10,
+                                        bot=True)
@@ -17,12 +17,14 @@
 #
 from datetime import date
 
+import mock
 import pytest
 import pywikibot
 
 from FLOSSbot.bot import Bot
+from FLOSSbot.license import License
 from FLOSSbot.plugin import Plugin
-from tests.wikidata import WikidataHelper
+from tests.wikidata import TEST_WIKIDATA, WikidataHelper
 
 
 class TestPlugin(object):
@@ -34,7 +36,7 @@ class TestPlugin(object):
         bot = Bot.factory([
             '--test',
             '--user=FLOSSbotCI',
-        ])
+        ] + WikidataHelper.argv())
         plugin = Plugin(bot, bot.args)
         assert 0 == len(plugin.bot.entities['item'])
         git = plugin.Q_git
@@ -47,16 +49,30 @@ class TestPlugin(object):
         bot = Bot.factory([
             '--test',
             '--user=FLOSSbotCI',
-        ])
+        ] + WikidataHelper.argv())
         plugin = Plugin(bot, bot.args)
         name = 'Q_' + WikidataHelper.random_name()
-        item = plugin.__getattribute__(name)
+        item = getattr(plugin, name)
         assert 1 == len(plugin.bot.entities['item'])
         plugin.clear_entity_label(item.getID())
         assert 0 == len(plugin.bot.entities['item'])
-        item = plugin.__getattribute__(name)
+        item = getattr(plugin, name)
         assert 1 == len(plugin.bot.entities['item'])
 
+    #
+    # a property gets its datatype from wikidata, which the local wiki
+    # also is: it cannot be created again once its label is cleared
+    #
+    @pytest.mark.skipif(not TEST_WIKIDATA,
+                        reason='needs FLOSSBOT_TEST_WIKIDATA')
+    def test_create_property(self):
+        bot = Bot.factory([
+            '--entities-ttl=0',
+            '--test',
+            '--user=FLOSSbotCI',
+        ])
+        plugin = Plugin(bot, bot.args)
+
         property2datatype = {
             'P_source_code_repository': 'url',
             'P_website_username': 'string',
@@ -64,26 +80,27 @@ class TestPlugin(object):
         }
 
         bot = Bot.factory([
+            '--entities-ttl=0',
             '--test',
             '--user=FLOSSbotCI',
         ])
         wikidata_plugin = Plugin(bot, bot.args)
         for (attr, datatype) in property2datatype.items():
-            plugin.reset_cache()
-            property = plugin.__getattribute__(attr)
-            assert 1 == len(plugin.bot.entities['property'])
+            label = " ".join(attr.split('_')[1:])
+            property = getattr(plugin, attr)
+            assert label in plugin.bot.entities['property']
             plugin.clear_entity_label(property)
-            assert 0 == len(plugin.bot.entities['property'])
+            assert label not in plugin.bot.entities['property']
             for i in range(120):
                 if (plugin.lookup_entity(
                         attr, type='property') is None):
                     break
-            property = plugin.__getattribute__(attr)
-            assert 1 == len(plugin.bot.entities['property'])
+            property = getattr(plugin, attr)
+            assert label in plugin.bot.entities['property']
 
             new_content = plugin.bot.site.loadcontent(
                 {'ids': property}, 'datatype')
-            wikidata_property = wikidata_plugin.__getattribute__(attr)
+            wikidata_property = getattr(wikidata_plugin, attr)
             wikidata_content = wikidata_plugin.bot.site.loadcontent(
                 {'ids': wikidata_property}, 'datatype')
             assert (wikidata_content[wikidata_property]['datatype'] ==
@@ -91,13 +108,158 @@ class TestPlugin(object):
             assert (datatype ==
                     wikidata_content[wikidata_property]['datatype']), attr
 
+    def test_resolve_entities(self):
+        bot = Bot.factory(['--entities-ttl=0'])
+        plugin = Plugin(bot, bot.args)
+        found = {
+            'source code repository': 'P1',
+            'retrieved': 'P2',
+            'instance of': 'P3',
+            'git': 'Q4',
+        }
+        with mock.patch.object(plugin, 'lookup_entity') as m_lookup:
+            m_lookup.side_effect = lambda label, type: found.get(label)
+            with pytest.raises(ValueError) as e:
+                plugin.resolve_entities()
+            assert 'P_Wikimedia_database_name' in str(e.value)
+            assert 'Q_Wikimedia_disambiguation_page' in str(e.value)
+            assert 'P2' == plugin.__dict__['P_retrieved']
+            with pytest.raises(AttributeError):
+                plugin.P_Wikimedia_database_name
+
+            found['Wikimedia database name'] = 'P5'
+            found['Wikimedia disambiguation page'] = 'Q6'
+            m_lookup.reset_mock()
+            plugin.resolve_entities()
+            assert 2 == m_lookup.call_count
+            assert 'P5' == plugin.P_Wikimedia_database_name
+            assert 'P1' == plugin.P_source_code_repository
+            assert 2 == m_lookup.call_count
+            assert 'Q4' == plugin.Q_git
+            assert 3 == m_lookup.call_count
+            assert 'Q4' == plugin.Q_git
+            assert 3 == m_lookup.call_count
+        with pytest.raises(AttributeError):
+            plugin.unknown
+        assert 'P_license' in License.entity_names()
+        assert 'P_retrieved' in License.entity_names()
+
+    def test_bot_resolve_entities(self):
+        bot = Bot.factory(['--plugin=QA', '--plugin=FSD',
+                           '--entities-ttl=0'])
+        with mock.patch.object(Plugin, 'resolve_entities') as m_resolve:
+            m_resolve.side_effect = [
+                None, ValueError("found no items for Q_thing")]
+            with pytest.raises(ValueError) as e:
+                bot.resolve_entities()
+            assert 2 == m_resolve.call_count
+        assert 'FSD: found no items for Q_thing' == str(e.value)
+
+    def test_search_entity_disambiguation(self):
+        bot = Bot.factory(['--entities-ttl=0'])
+        plugin = Plugin(bot, bot.args)
+        site = mock.Mock()
+        site.family.name = 'wikidata'
+        site.code = 'wikidata'
+        site.search_entities.return_value = [
+            {'id': 'Q1', 'label': 'thing'},
+            {'id': 'Q2', 'label': 'thing'},
+        ]
+        site.preloaditempages.side_effect = lambda candidates: candidates
+        disambiguation = mock.Mock()
+        disambiguation.getTarget.return_value = 'Q3'
+        claims = {
+            'Q1': {'P4': [disambiguation]},
+            'Q2': {},
+        }
+
+        def item(site, id, ns):
+            candidate = mock.Mock()
+            candidate.getID.return_value = id
+            candidate.get.return_value = {'claims': claims[id]}
+            return candidate
+        found = {
+            'instance of': 'P4',
+            'Wikimedia disambiguation page': 'Q3',
+        }
+        with mock.patch('pywikibot.ItemPage') as m_item, \
+                mock.patch.object(plugin, 'lookup_entity') as m_lookup:
+            m_item.side_effect = item
+            m_lookup.side_effect = lambda label, type: found[label]
+            assert 'Q2' == plugin.search_entity(
+                site, 'thing', type='item').getID()
+            assert 2 == m_lookup.call_count
+        assert 'P_instance_of' not in plugin.__dict__
+
+    def test_forget_entity(self):
+        bot = Bot.factory(['--entities-ttl=0'])
+        plugin = Plugin(bot, bot.args)
+        other = Plugin(bot, bot.args)
+        git = mock.Mock()
+        git.getID.return_value = 'Q4'
+        found = {
+            'source code repository': 'P1',
+            'retrieved': 'P2',
+            'git': git,
+        }
+        with mock.patch.object(Plugin, 'search_entity') as m_search:
+            m_search.side_effect = lambda site, label, type: (
+                {'id': found[label]} if type == 'property'
+                else found[label])
+            assert 'P1' == plugin.lookup_entity('source code repository',
+                                                type='property')
+            assert 'P2' == other.lookup_entity('retrieved',
+                                               type='property')
+            assert git is other.lookup_entity('git', type='item')
+            plugin.__dict__['P_source_code_repository'] = 'P1'
+            other.__dict__['P_retrieved'] = 'P2'
+            other.__dict__['Q_git'] = git
+
+            bot.forget_entity('P1', ['retrieved'])
+            assert {'git': git} == bot.entities['item']
+            assert {} == bot.entities['property']
+            assert 'P_source_code_repository' not in plugin.__dict__
+            assert 'P_retrieved' not in other.__dict__
+            assert git is other.Q_git
+
+            #
+            # an entity forgotten while it is looked up is not
+            # remembered
+            #
+            def search(site, label, type):
+                bot.forget_entity('Q4')
+                return {'id': 'P1'}
+            m_search.side_effect = search
+            assert 'P1' == plugin.lookup_entity('source code repository',
+                                                type='property')
+            assert {} == bot.entities['property']
+            assert {} == bot.entities['item']
+
+    @mock.patch('FLOSSbot.util.time.sleep')
+    def test_set_entity_label(self, m_sleep):
+        bot = Bot.factory(['--entities-ttl=0'])
+        plugin = Plugin(bot, bot.args)
+        bot.entities['property']['old'] = 'P1'
+        with mock.patch.object(bot, 'site') as m_site:
+            m_site.loadcontent.side_effect = [
+                {'P1': {'labels': {'en': {'value': 'old'}}}},
+                {'P1': {'labels': {'en': {'value': 'new'}}}},
+            ]
+            plugin.set_entity_label('P1', 'new')
+            m_site.editEntity.assert_called_once_with(
+                {'id': 'P1'},
+                {'labels': {'en': {'language': 'en', 'value': 'new'}}})
+            m_site.loadcontent.assert_called_with({'ids': 'P1'}, 'labels')
+        m_sleep.assert_called_once_with(0.5)
+        assert {} == bot.entities['property']
+
     def test_set_retrieved(self):
         bot = Bot.factory([
             '--test',
             '--user=FLOSSbotCI',
-        ])
+        ] + WikidataHelper.argv())
         plugin = Plugin(bot, bot.args)
-        item = plugin.__getattribute__('Q_' + WikidataHelper.random_name())
+        item = getattr(plugin, 'Q_' + WikidataHelper.random_name())
         claim = pywikibot.Claim(plugin.bot.site,
                                 plugin.P_source_code_repository,
                                 0)
@@ -114,7 +276,7 @@ class TestPlugin(object):
             '--test',
             '--user=FLOSSbotCI',
             '--verbose',
-        ])
+        ] + WikidataHelper.argv())
         plugin = Plugin(bot, bot.args)
         # ensure space, - and _ are accepted
         name = WikidataHelper.random_name() + "-some thing_else"
@@ -148,12 +310,14 @@ class TestPlugin(object):
             plugin.search_entity(plugin.bot.site, name, type='item')
         assert "found multiple items" in str(e.value)
 
-        Plugin.authoritative['test'][name] = second.getID()
+        site = plugin.bot.site
+        Plugin.authoritative[site.family.name][site.code][name] = (
+            second.getID())
         found = plugin.search_entity(plugin.bot.site, name, type='item')
         assert found.getID() == second.getID()
 
     def test_get_template_field(self):
-        bot = Bot.factory(['--verbose'])
+        bot = Bot.factory(['--entities-ttl=0', '--verbose'])
         plugin = Plugin(bot, bot.args)
         item = plugin.Q_GNU_Emacs
         expected = {
@@ -167,7 +331,7 @@ class TestPlugin(object):
         assert actual.keys() == expected.keys()
 
     def test_translate_title(self):
-        bot = Bot.factory(['--verbose'])
+        bot = Bot.factory(['--entities-ttl=0', '--verbose'])
         plugin = Plugin(bot, bot.args)
         assert 'GNU Emacs' == plugin.translate_title('GNU Emacs', 'fr')
         assert 'ГНУ Емакс' == plugin.translate_title('GNU Emacs', 'sr')
@@ -175,13 +339,13 @@ class TestPlugin(object):
         assert plugin.translate_title('License', '??') is None
 
     def test_get_redirects(self):
-        bot = Bot.factory(['--verbose'])
+        bot = Bot.factory(['--entities-ttl=0', '--verbose'])
         plugin = Plugin(bot, bot.args)
         titles = plugin.get_redirects('GNU General Public License', 'en')
         assert 'GPL' in titles
 
     def test_get_sitelink_item(self):
-        bot = Bot.factory(['--verbose'])
+        bot = Bot.factory(['--entities-ttl=0', '--verbose'])
         plugin = Plugin(bot, bot.args)
         enwiki = plugin.get_sitelink_item('enwiki')
         assert 'English Wikipedia' == enwiki.labels['en']
@@ -0,0 +1,52 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+import pstats
+import time
+
+from FLOSSbot.profiler import Profiler
+
+
+def slow_function(seconds):
+    time.sleep(seconds)
+
+
+class TestProfiler(object):
+
+    def test_profiler(self, tmpdir):
+        directory = str(tmpdir.join('profile'))
+        p = Profiler(directory, slowest=2)
+        for (id, seconds) in (('Q1', 0.01), ('Q2', 0.05), ('Q3', 0.02)):
+            with p.item(id):
+                with p.plugin('Repository'):
+                    slow_function(seconds)
+                with p.plugin('QA'):
+                    pass
+        assert ['Q3', 'Q2'] == [id for (s, id, b) in sorted(p.items)]
+        p.close()
+
+        assert os.path.exists(os.path.join(directory, 'QA.pstats'))
+        stats = pstats.Stats(os.path.join(directory, 'Repository.pstats'))
+        assert any(function[2] == 'slow_function'
+                   for function in stats.stats.keys())
+        summary = open(os.path.join(directory, 'summary.txt')).read()
+        assert '==== Repository' in summary
+        slowest = summary.split('==== slowest items\n')[1]
+        assert slowest.startswith('Q2 ')
+        assert 'Q1 ' not in slowest
+        assert '(slow_function)' in slowest
@@ -38,9 +38,9 @@ class TestQA(object):
             '--verbose',
             '--test',
             '--user=FLOSSbotCI',
-        ])
+        ] + WikidataHelper.argv())
         qa = QA(bot, bot.args)
-        item = qa.__getattribute__('Q_' + WikidataHelper.random_name())
+        item = getattr(qa, 'Q_' + WikidataHelper.random_name())
         claim = pywikibot.Claim(
             qa.bot.site, qa.P_software_quality_assurance, 'novalue')
         claim.setTarget(qa.Q_Continuous_integration)
@@ -68,9 +68,9 @@ class TestQA(object):
             '--test',
             '--user=FLOSSbotCI',
             '--verification-delay=0',
-        ])
+        ] + WikidataHelper.argv())
         qa = QA(bot, bot.args)
-        item = qa.__getattribute__('Q_' + WikidataHelper.random_name())
+        item = getattr(qa, 'Q_' + WikidataHelper.random_name())
 
         log.debug(">> do nothing if there is no source code repository")
         item.get(force=True)
@@ -117,6 +117,21 @@ class TestQA(object):
 
         qa.clear_entity_label(item.getID())
 
+    @mock.patch('FLOSSbot.qa.QA.get')
+    def test_github2travis_timeout(self, m_get):
+        m_get.side_effect = requests.ReadTimeout
+        bot = Bot.factory([
+            '--verbose',
+            '--test',
+            '--user=FLOSSbotCI',
+        ] + WikidataHelper.argv())
+        qa = QA(bot, bot.args)
+        item = mock.Mock()
+        item.getID.return_value = 'Q1'
+        item.labels = {}
+        assert qa.github2travis(item, 'http://github.com/FAKE1/FAKE2') is None
+        m_get.assert_called_once_with('http://github.com/FAKE1/FAKE2')
+
 
 # Local Variables:
 # compile-command: "cd .. ; tox -e py3 tests/test_qa.py"
@@ -15,7 +15,9 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import mock
 import pywikibot
+import requests
 
 from FLOSSbot.bot import Bot
 from FLOSSbot.repository import Repository
@@ -32,7 +34,7 @@ class TestRepository(object):
             '--verbose',
             '--test',
             '--user=FLOSSbotCI',
-        ])
+        ] + WikidataHelper.argv())
         self.r = Repository(bot, bot.args)
 
     def test_guessproto__github_is_git(self):
@@ -67,6 +69,17 @@ class TestRepository(object):
                 self.r.guess_protocol_from_url(case)
                 == self.r.Q_Hypertext_Transfer_Protocol)
 
+    def test_extract_repository__sourceforge_timeout(self):
+        sf_cases = [
+            'https://sourceforge.net/p/foo/git/ci/master/tree/',
+            'https://sourceforge.net/p/foo/bar/ci/default/tree/',
+            'https://sourceforge.net/p/foo/svn/HEAD/tree/',
+            ]
+        with mock.patch.object(self.r, 'http_request',
+                               side_effect=requests.ReadTimeout):
+            for case in sf_cases:
+                assert self.r.extract_repository(case) is None
+
     def test_guessproto__codeplex_SourceControl_is_http(self):
         assert(
             self.r.guess_protocol_from_url(
@@ -94,7 +107,7 @@ class TestRepository(object):
             is None)
 
     def test_get_source_code_repository(self):
-        item = self.r.__getattribute__('Q_' + WikidataHelper.random_name())
+        item = getattr(self.r, 'Q_' + WikidataHelper.random_name())
         claim_no_value = pywikibot.Claim(self.r.bot.site,
                                          self.r.P_source_code_repository,
                                          'novalue')
@@ -117,7 +130,7 @@ class TestRepository(object):
         self.r.clear_entity_label(item.getID())
 
     def test_verify_no_value(self):
-        item = self.r.__getattribute__('Q_' + WikidataHelper.random_name())
+        item = getattr(self.r, 'Q_' + WikidataHelper.random_name())
         claim = pywikibot.Claim(self.r.bot.site,
                                 self.r.P_source_code_repository,
                                 'novalue')
@@ -132,7 +145,7 @@ class TestRepository(object):
         self.r.clear_entity_label(item.getID())
 
     def test_verify(self):
-        item = self.r.__getattribute__('Q_' + WikidataHelper.random_name())
+        item = getattr(self.r, 'Q_' + WikidataHelper.random_name())
         claim = pywikibot.Claim(self.r.bot.site,
                                 self.r.P_source_code_repository,
                                 0)
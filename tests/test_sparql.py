@@ -0,0 +1,172 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import mock
+import pytest
+
+from FLOSSbot import sparql
+
+
+class TestSparql(object):
+
+    query = """
+    SELECT DISTINCT ?item WHERE {
+      ?item wdt:P1 ?url.
+    } ORDER BY ?item
+    """
+
+    def test_add_filter(self):
+        query = sparql.add_filter(self.query, 'COND')
+        assert 'FILTER(COND) } ORDER BY' in query
+
+        grouped = """
+        SELECT ?item (COUNT(?value) AS ?count) WHERE
+        {
+          ?item p:P1 [ ps:P1 ?value ].
+          MINUS { ?item p:P1/wikibase:rank wikibase:PreferredRank. }
+        }
+        GROUP BY ?item
+        ORDER BY ?item
+        """
+        query = sparql.add_filter(grouped, 'COND')
+        assert 'FILTER(COND) }\n        GROUP BY' in query
+
+        with pytest.raises(ValueError):
+            sparql.add_filter('SELECT ?item WHERE { ?item ?p ?o }', 'COND')
+
+    def test_paginate(self):
+        query = sparql.paginate(self.query, None, 10)
+        assert 'FILTER' not in query
+        assert query.endswith('ORDER BY ' + sparql.ITEM_ID + ' LIMIT 10')
+
+        query = sparql.paginate(self.query, 'Q12', 10)
+        assert sparql.ITEM_ID + ' > "Q12"' in query
+
+        with pytest.raises(ValueError):
+            sparql.paginate('SELECT ?item WHERE { ?item ?p ?o }', None, 10)
+
+    @mock.patch('time.sleep')
+    @mock.patch('pywikibot.pagegenerators.WikidataSPARQLPageGenerator')
+    def test_items(self, m_query, m_sleep):
+        def item(id):
+            i = mock.Mock()
+            i.getID.return_value = id
+            return i
+        pages = [
+            [item('Q1'), item('Q2')],
+            Exception('timeout'),
+            [item('Q3'), item('Q4')],
+            [item('Q5')],
+        ]
+        queries = []
+
+        def query(query, **kwargs):
+            queries.append(query)
+            page = pages.pop(0)
+            if isinstance(page, Exception):
+                raise page
+            return page
+
+        m_query.side_effect = query
+        found = [i.getID() for i in sparql.items(None, self.query,
+                                                 page_size=2)]
+        assert ['Q1', 'Q2', 'Q3', 'Q4', 'Q5'] == found
+        assert 4 == len(queries)
+        assert '> "Q2"' in queries[1]
+        assert '> "Q2"' in queries[2]
+        assert '> "Q4"' in queries[3]
+        m_sleep.assert_called_once_with(1)
+
+    def test_shard(self):
+        assert sparql.in_shard('Q7', (1, 3))
+        assert not sparql.in_shard('Q7', (0, 3))
+        condition = sparql.shard_filter((1, 3))
+        assert condition.endswith(' = 1')
+        assert ' 3 * FLOOR(' in condition
+
+    @mock.patch('pywikibot.pagegenerators.WikidataSPARQLPageGenerator')
+    def test_items_shard(self, m_query):
+        def item(id):
+            i = mock.Mock()
+            i.getID.return_value = id
+            return i
+        m_query.return_value = [item('Q1'), item('Q2'), item('Q4')]
+        found = [i.getID() for i in sparql.items(None, self.query,
+                                                 shard=(1, 3))]
+        assert ['Q1', 'Q4'] == found
+        assert sparql.shard_filter((1, 3)) in m_query.call_args[0][0]
+
+    def test_merge(self):
+        def items(*ids):
+            for id in ids:
+                i = mock.Mock()
+                i.getID.return_value = id
+                yield i
+        merged = sparql.merge([
+            ('a', items('Q1', 'Q10', 'Q3')),
+            ('b', items('Q10', 'Q2', 'Q3')),
+            ('c', items()),
+        ])
+        assert [
+            ('Q1', ['a']),
+            ('Q10', ['a', 'b']),
+            ('Q2', ['b']),
+            ('Q3', ['a', 'b']),
+        ] == [(item.getID(), keys) for (item, keys) in merged]
+
+    verify = """
+    SELECT DISTINCT ?item WHERE {
+      ?item p:P1 ?claim .
+      OPTIONAL { ?claim prov:wasDerivedFrom/pr:P2 ?retrieved }
+    } ORDER BY ?item
+    """
+
+    def test_oldest_query(self):
+        query = sparql.oldest_query(self.verify)
+        assert 'AS ?oldest' in query
+        assert '"' + sparql.NEVER + '"^^xsd:dateTime' in query
+        assert query.endswith('} GROUP BY ?item ORDER BY ?item')
+        assert (sparql.ITEM_ID + ' LIMIT 10' in
+                sparql.paginate(query, None, 10))
+
+        with pytest.raises(ValueError):
+            sparql.oldest_query('SELECT ?item WHERE { ?item ?p ?o }')
+
+    @mock.patch('pywikibot.ItemPage')
+    @mock.patch('FLOSSbot.sparql.select')
+    def test_oldest(self, m_select, m_item):
+        m_item.side_effect = lambda site, id: id
+        m_select.side_effect = [
+            [{'item': 'http://www.wikidata.org/entity/Q1',
+              'oldest': '2016-01-01T00:00:00Z'},
+             {'item': 'http://www.wikidata.org/entity/Q2',
+              'oldest': sparql.NEVER}],
+            [{'item': 'http://www.wikidata.org/entity/Q3',
+              'oldest': None}],
+        ]
+        assert [
+            ('2016-01-01T00:00:00Z', 'Q1'),
+            (sparql.NEVER, 'Q2'),
+            (sparql.NEVER, 'Q3'),
+        ] == list(sparql.oldest(None, self.verify, page_size=2))
+        assert '> "Q2"' in m_select.call_args[0][1]
+
+    @mock.patch('FLOSSbot.sparql.items')
+    def test_oldest_not_verify(self, m_items):
+        m_items.return_value = ['Q1']
+        assert ([(sparql.NEVER, 'Q1')] ==
+                list(sparql.oldest(None, self.query)))
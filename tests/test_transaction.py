@@ -0,0 +1,124 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import mock
+
+from FLOSSbot.transaction import Transaction
+
+
+class TestTransaction(object):
+
+    def claim(self, id):
+        claim = mock.Mock()
+        claim.getID.return_value = id
+        claim.qualifiers = {}
+        claim.sources = []
+        claim.target = None
+        claim.rank = 'normal'
+        claim.setTarget.side_effect = lambda target: setattr(
+            claim, 'target', target)
+        claim.setRank.side_effect = lambda rank: setattr(claim, 'rank', rank)
+        claim.toJSON.return_value = {'id': id, 'mainsnak': {}}
+        return claim
+
+    def test_commit(self):
+        item = mock.Mock()
+        item.getID.return_value = 'Q1'
+        item.claims = {}
+        t = Transaction(item)
+        assert t.commit() is False
+        item.editEntity.assert_not_called()
+
+        claim = self.claim('P1')
+        t.add_claim(claim)
+        assert [claim] == item.claims['P1']
+        qualifier = self.claim('P2')
+        t.add_qualifier(claim, qualifier)
+        assert [qualifier] == claim.qualifiers['P2']
+        assert qualifier.isQualifier is True
+        source = self.claim('P3')
+        t.add_source(claim, source)
+        assert [source] == claim.sources[0]['P3']
+        t.change_rank(claim, 'preferred')
+        claim.setRank.assert_called_with('preferred')
+        other = self.claim('P4')
+        t.change_target(other, 'http://example.org')
+        other.setTarget.assert_called_with('http://example.org')
+
+        assert (['add claim', 'add qualifier', 'add reference',
+                 'change rank', 'change target'] ==
+                [change['action'] for change in t.changes])
+        assert t.commit(bot=True) is True
+        item.editEntity.assert_called_once_with({
+            'claims': [
+                {'id': 'P1', 'mainsnak': {}},
+                {'id': 'P4', 'mainsnak': {}},
+            ]}, bot=True)
+        assert t.commit() is False
+        assert [] == t.changes
+
+    def test_rollback(self):
+        item = mock.Mock()
+        item.claims = {}
+        t = Transaction(item)
+        first = self.claim('P1')
+        t.add_claim(first)
+        savepoint = t.savepoint()
+        t.add_claim(self.claim('P2'))
+        t.change_rank(first, 'preferred')
+        t.rollback(savepoint)
+        assert [first] == t.claims
+        assert ['add claim'] == [change['action'] for change in t.changes]
+        assert 'normal' == first.rank
+        assert [first] == item.claims['P1']
+        assert 'P2' not in item.claims
+
+    def test_rollback_modified(self):
+        item = mock.Mock()
+        item.claims = {}
+        t = Transaction(item)
+        claim = self.claim('P1')
+        t.add_claim(claim)
+        source = self.claim('P2')
+        t.add_source(claim, source)
+        t.change_source(claim, source, 'http://example.org')
+        savepoint = t.savepoint()
+        #
+        # a plugin changes the source and the rank of a claim touched
+        # before the savepoint, adds a qualifier and then raises
+        #
+        t.change_source(claim, source, 'http://example.com')
+        t.change_rank(claim, 'deprecated')
+        t.add_qualifier(claim, self.claim('P3'))
+        t.add_source(claim, self.claim('P4'))
+        t.rollback(savepoint)
+        assert 'http://example.org' == source.target
+        assert 'normal' == claim.rank
+        assert {} == claim.qualifiers
+        assert [source] == claim.sources[0]['P2']
+        assert 1 == len(claim.sources)
+        assert [claim] == t.claims
+        assert (['add claim', 'add reference', 'change reference'] ==
+                [change['action'] for change in t.changes])
+
+        other = self.claim('P5')
+        other.target = 'http://example.net'
+        savepoint = t.savepoint()
+        t.change_target(other, 'http://example.com')
+        t.rollback(savepoint)
+        assert 'http://example.net' == other.target
+        assert [claim] == t.claims
@@ -17,7 +17,9 @@
 #
 import subprocess
 
+import mock
 import pytest
+import requests
 
 from FLOSSbot import util
 
@@ -60,3 +62,48 @@ class TestUtil(object):
 
     def test_sh__handles_utf8(self):
         assert ('€' == util.sh('echo -n €'))
+
+    @mock.patch('FLOSSbot.metrics.registry')
+    @mock.patch('FLOSSbot.util.time')
+    def test_wait_for(self, m_time, m_registry):
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+        m_time.time.side_effect = lambda: now[0]
+        m_time.sleep.side_effect = sleep
+
+        results = [None, False, 'found']
+        assert 'found' == util.wait_for(lambda: results.pop(0), 'test')
+        assert [mock.call(0.5), mock.call(1.0)] == (
+            m_time.sleep.call_args_list)
+
+        m_time.sleep.reset_mock()
+        now[0] = 0.0
+        with pytest.raises(TimeoutError) as e:
+            util.wait_for(lambda: None, 'search', 'item Q1', timeout=10,
+                          max_delay=4)
+        assert 'no search item Q1 after 6 attempts' in str(e.value)
+        m_registry.inc.assert_any_call('flossbot_wait_total', what='search',
+                                       status='timeout')
+        assert ([0.5, 1.0, 2.0, 4.0, 2.5] ==
+                [c[0][0] for c in m_time.sleep.call_args_list])
+
+    @mock.patch('requests.adapters.HTTPAdapter.send')
+    def test_session(self, m_send):
+        r = requests.Response()
+        r.status_code = 200
+        m_send.return_value = r
+        session = util.Session(pool_size=4, timeout=5)
+        adapter = session.get_adapter('https://example.com/')
+        assert adapter is session.get_adapter('http://example.com/')
+        assert 4 == adapter._pool_maxsize
+
+        session.get('https://example.com/')
+        (request,) = m_send.call_args[0]
+        assert 5 == m_send.call_args[1]['timeout']
+        assert 'FLOSSbot' == request.headers['User-Agent']
+        assert 'gzip' in request.headers['Accept-Encoding']
+
+        session.get('https://example.com/', timeout=1)
+        assert 1 == m_send.call_args[1]['timeout']
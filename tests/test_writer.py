@@ -0,0 +1,40 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright (C) 2016 Loic Dachary <loic@dachary.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import mock
+
+from FLOSSbot.writer import Writer
+
+
+class TestWriter(object):
+
+    def test_writer(self):
+        w = Writer(2)
+        done = mock.Mock()
+        not_saved = mock.Mock()
+        ok = mock.Mock()
+        w.put(ok, done, not_saved)
+        failed = mock.Mock()
+        failed.commit.side_effect = Exception('conflict')
+        w.put(failed, done, not_saved)
+        w.flush()
+        ok.commit.assert_called_once_with(bot=True)
+        done.assert_called_once_with()
+        not_saved.assert_called_once_with()
+        assert 1 == w.errors
+        w.close()
+        assert not w.thread.is_alive()
@@ -14,21 +14,122 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import json
+import os
 import random
 import string
 
 import pywikibot
 from pywikibot.data import api
 
+from FLOSSbot import local
+
+#
+# The tests run against the wikis served by FLOSSbot.local, in the
+# test process. Set FLOSSBOT_TEST_WIKIDATA=1 to run them against
+# test.wikidata.org instead.
+#
+TEST_WIKIDATA = bool(os.environ.get('FLOSSBOT_TEST_WIKIDATA'))
+
+#
+# The properties the plugins need, which --test does not create
+# because their datatype is found in wikidata
+#
+PROPERTIES = (
+    ('Free Software Directory entry', 'external-id'),
+    ('Wikimedia database name', 'external-id'),
+    ('archive URL', 'url'),
+    ('described at URL', 'url'),
+    ('imported from', 'wikibase-item'),
+    ('instance of', 'wikibase-item'),
+    ('license', 'wikibase-item'),
+    ('protocol', 'wikibase-item'),
+    ('retrieved', 'time'),
+    ('software quality assurance', 'wikibase-item'),
+    ('source code repository', 'url'),
+    ('subclass of', 'wikibase-item'),
+    ('website username', 'string'),
+)
+
+#
+# The pages of wikipedia and of the Free Software Directory the
+# plugins read, for the items of the tests
+#
+PAGES = {
+    'en': {
+        'GNU Emacs': {
+            'text': ("{{Infobox software\n"
+                     "| license = [[GNU General Public License]]\n"
+                     "}}"),
+        },
+        'GNU General Public License': {
+            'text': '',
+            'langlinks': {'fr': 'Licence publique générale GNU'},
+        },
+        'License': {
+            'text': '',
+            'langlinks': {'fr': 'Licence (juridique)'},
+        },
+    },
+    'fsd': {
+        'Loomio': {
+            'text': ("{{Entry\n"
+                     "|Name=Loomio\n"
+                     "|Short description=Collaborative decision-making tool\n"
+                     "}}"),
+        },
+    },
+    'fr': {
+        'GNU Emacs': {
+            'text': ("{{Infobox Logiciel\n"
+                     "| licence = [[Licence publique générale GNU|GPL]]\n"
+                     "}}"),
+        },
+    },
+}
+
 
 class WikidataHelper(object):
 
+    address = None
+
     def login(self):
+        if not TEST_WIKIDATA:
+            WikidataHelper.local_wiki()
+            return
         site = pywikibot.Site("test", "wikidata", "FLOSSbotCI")
         api.LoginManager(site=site,
                          user="FLOSSbotCI",
                          password="yosQuepacAm2").login()
 
+    @staticmethod
+    def local_wiki():
+        """Serve the wikis of the tests, the first time, and return
+        their HOST:PORT."""
+        if WikidataHelper.address is None:
+            wiki = local.Wiki()
+            wiki.pages = PAGES
+            for (label, datatype) in PROPERTIES:
+                wiki.edit_entity({'new': 'property', 'data': json.dumps({
+                    'labels': {'en': {'language': 'en', 'value': label}},
+                    'datatype': datatype,
+                })})
+            httpd = local.Server(wiki, user='FLOSSbotCI').serve(0)
+            WikidataHelper.address = (
+                '127.0.0.1:' + str(httpd.server_address[1]))
+            local.register(WikidataHelper.address)
+        return WikidataHelper.address
+
+    @staticmethod
+    def argv():
+        """The arguments of the bots that work on the wiki of the
+        tests. The entities found in it are not cached: the tests
+        create and forget them."""
+        if TEST_WIKIDATA:
+            return ['--entities-ttl=0']
+        return ['--local-wiki', WikidataHelper.local_wiki(),
+                '--entities-ttl=0']
+
     @staticmethod
     def random_name():
         return ''.join(random.choice(string.ascii_lowercase)